@@ -0,0 +1,325 @@
+/*
+#   analyser.c: offline loudness, silence and waveform analysis of media files
+#   Copyright (C) 2026 Stephen Fairchild (s-fairchild@users.sourceforge.net)
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 2 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program in the file entitled COPYING.
+#   If not, see <http://www.gnu.org/licenses/>.
+*/
+
+/* Files are decoded by an xlplayer of their own at the jack sample rate
+ * with the audio diverted here rather than to jack. Integrated loudness
+ * is measured per ITU-R BS.1770 with the gating of EBU R128. The levels
+ * of each 100 ms give the extent of leading and trailing silence and the
+ * start of any fade-out and together with the sample extremes make up a
+ * waveform overview for display. */
+
+#include <stdio.h>
+#include <stdlib.h>
+#include <string.h>
+#include <math.h>
+#include "analyser.h"
+
+#define TRUE 1
+#define FALSE 0
+
+/* the level in dBFS below which audio counts as silence */
+#define SILENCE_DB -50.0
+/* a fade-out is where the level stays this many dB below the track average */
+#define FADE_DB 10.0
+/* fade-outs are looked for in this many seconds before the audio ends */
+#define FADE_MAX_S 15
+/* the maximum number of bins in a waveform overview */
+#define OVERVIEW_BINS 512
+
+/* K-weighting filter stage 1: the head related high shelf */
+static void shelf_init(struct biquad *self, double rate)
+    {
+    const double f0 = 1681.974450955533, g = 3.999843853973347, q = 0.7071752369554196;
+    double k = tan(M_PI * f0 / rate);
+    double vh = pow(10.0, g / 20.0);
+    double vb = pow(vh, 0.4996667741545416);
+    double a0 = 1.0 + k / q + k * k;
+
+    self->b0 = (vh + vb * k / q + k * k) / a0;
+    self->b1 = 2.0 * (k * k - vh) / a0;
+    self->b2 = (vh - vb * k / q + k * k) / a0;
+    self->a1 = 2.0 * (k * k - 1.0) / a0;
+    self->a2 = (1.0 - k / q + k * k) / a0;
+    }
+
+/* K-weighting filter stage 2: the revised low frequency B curve */
+static void highpass_init(struct biquad *self, double rate)
+    {
+    const double f0 = 38.13547087602444, q = 0.5003270373238773;
+    double k = tan(M_PI * f0 / rate);
+    double a0 = 1.0 + k / q + k * k;
+
+    self->b0 = 1.0;
+    self->b1 = -2.0;
+    self->b2 = 1.0;
+    self->a1 = 2.0 * (k * k - 1.0) / a0;
+    self->a2 = (1.0 - k / q + k * k) / a0;
+    }
+
+static inline double biquad_run(struct biquad *self, int ch, double x)
+    {
+    double y = self->b0 * x + self->z1[ch];
+
+    self->z1[ch] = self->b1 * x - self->a1 * y + self->z2[ch];
+    self->z2[ch] = self->b2 * x - self->a2 * y;
+    return y;
+    }
+
+static void analyser_reset(struct analyser *self)
+    {
+    memset(self->shelf.z1, 0, sizeof self->shelf.z1);
+    memset(self->shelf.z2, 0, sizeof self->shelf.z2);
+    memset(self->highpass.z1, 0, sizeof self->highpass.z1);
+    memset(self->highpass.z2, 0, sizeof self->highpass.z2);
+    self->fill = 0;
+    self->acc = 0.0;
+    self->raw_acc = 0.0;
+    self->lo = self->hi = 0.0f;
+    self->n_quarters = 0;
+    self->blocks.n = 0;
+    self->levels.n = 0;
+    self->lows.n = 0;
+    self->highs.n = 0;
+    self->complete = FALSE;
+    }
+
+static void series_append(struct series *self, double value)
+    {
+    if (self->n == self->alloc)
+        {
+        self->alloc = self->alloc ? self->alloc * 2 : 4096;
+        if (!(self->v = realloc(self->v, self->alloc * sizeof (double))))
+            {
+            fprintf(stderr, "analyser: malloc failure\n");
+            exit(5);
+            }
+        }
+    self->v[self->n++] = value;
+    }
+
+static void analyser_sink(struct xlplayer *xlplayer, float *left, float *right, size_t frames)
+    {
+    struct analyser *self = xlplayer->sink_data;
+    double l, r;
+    float mono;
+
+    while (frames--)
+        {
+        self->raw_acc += *left * *left + *right * *right;
+        mono = 0.5f * (*left + *right);
+        if (mono < self->lo)
+            self->lo = mono;
+        if (mono > self->hi)
+            self->hi = mono;
+        l = biquad_run(&self->highpass, 0, biquad_run(&self->shelf, 0, *left++));
+        r = biquad_run(&self->highpass, 1, biquad_run(&self->shelf, 1, *right++));
+        self->acc += l * l + r * r;
+        if (++self->fill == self->quarter_frames)
+            {
+            memmove(self->quarters, self->quarters + 1, sizeof self->quarters - sizeof (double));
+            self->quarters[3] = self->acc;
+            if (++self->n_quarters >= 4)
+                series_append(&self->blocks, (self->quarters[0] + self->quarters[1] +
+                    self->quarters[2] + self->quarters[3]) / (4.0 * self->quarter_frames));
+            series_append(&self->levels, self->raw_acc / (2.0 * self->quarter_frames));
+            series_append(&self->lows, self->lo);
+            series_append(&self->highs, self->hi);
+            self->fill = 0;
+            self->acc = 0.0;
+            self->raw_acc = 0.0;
+            self->lo = self->hi = 0.0f;
+            }
+        }
+    }
+
+static void analyser_sink_end(struct xlplayer *xlplayer, int complete)
+    {
+    struct analyser *self = xlplayer->sink_data;
+
+    self->complete = complete;
+    self->state = AS_DONE;
+    }
+
+/* integrated loudness in LUFS -- NAN when the file is silent or too short */
+static double analyser_integrated(struct analyser *self)
+    {
+    const double abs_gate = pow(10.0, (-70.0 + 0.691) / 10.0);
+    double sum = 0.0, rel_gate;
+    size_t i, n = 0;
+
+    for (i = 0; i < self->blocks.n; ++i)
+        if (self->blocks.v[i] > abs_gate)
+            {
+            sum += self->blocks.v[i];
+            ++n;
+            }
+    if (!n)
+        return NAN;
+    rel_gate = sum / n * 0.1;        /* 10 LU below the absolute gated level */
+
+    for (sum = 0.0, n = 0, i = 0; i < self->blocks.n; ++i)
+        if (self->blocks.v[i] > abs_gate && self->blocks.v[i] > rel_gate)
+            {
+            sum += self->blocks.v[i];
+            ++n;
+            }
+    return -0.691 + 10.0 * log10(sum / n);
+    }
+
+/* where the audio begins and ends and where a fade-out starts, in seconds
+* returns FALSE when the file is silent throughout */
+static int analyser_offsets(struct analyser *self, double *lead, double *end, double *fade)
+    {
+    const double silence = pow(10.0, SILENCE_DB / 10.0);
+    const size_t window = 10;                   /* one second of levels */
+    double *v = self->levels.v, *p, ref = 0.0, sum;
+    size_t first, last, i;
+
+    for (first = 0; first < self->levels.n && v[first] <= silence; ++first);
+    if (first == self->levels.n)
+        return FALSE;
+    for (last = self->levels.n - 1; v[last] <= silence; --last);
+
+    for (i = first; i <= last; ++i)
+        ref += v[i];
+    ref = ref / (last - first + 1) * pow(10.0, -FADE_DB / 10.0);
+
+    /* step back one second at a time from the end to the last loud second */
+    *fade = (last + 1) * 0.1;
+    for (i = last + 1; i >= first + window && (last + 1 - i) < FADE_MAX_S * 10; i -= window)
+        {
+        for (sum = 0.0, p = v + i - window; p < v + i; ++p)
+            sum += *p;
+        if (sum / window >= ref)
+            break;
+        *fade = (i - window) * 0.1;
+        }
+
+    *lead = first * 0.1;
+    *end = (last + 1) * 0.1;
+    return TRUE;
+    }
+
+static int quantise(double value, double offset)
+    {
+    int q = (int)(value * 127.5 + offset);
+
+    return q < 0 ? 0 : (q > 255 ? 255 : q);
+    }
+
+/* the waveform overview as hex digits -- the minimum, maximum and rms of each bin */
+static void analyser_overview(struct analyser *self, FILE *fp)
+    {
+    size_t n = self->levels.n, bins = n < OVERVIEW_BINS ? n : OVERVIEW_BINS;
+    size_t bin, i, start, stop;
+    double lo, hi, ms;
+
+    for (bin = 0; bin < bins; ++bin)
+        {
+        start = bin * n / bins;
+        stop = (bin + 1) * n / bins;
+        for (lo = hi = ms = 0.0, i = start; i < stop; ++i)
+            {
+            if (self->lows.v[i] < lo)
+                lo = self->lows.v[i];
+            if (self->highs.v[i] > hi)
+                hi = self->highs.v[i];
+            ms += self->levels.v[i];
+            }
+        fprintf(fp, "%02x%02x%02x", quantise(lo, 127.5), quantise(hi, 127.5),
+                                    quantise(2.0 * sqrt(ms / (stop - start)), 0.0));
+        }
+    }
+
+struct analyser *analyser_create(int samplerate, sig_atomic_t *shutdown_f)
+    {
+    struct analyser *self;
+
+    if (!(self = calloc(1, sizeof (struct analyser))))
+        {
+        fprintf(stderr, "analyser: malloc failure\n");
+        exit(5);
+        }
+    if (!(self->xlplayer = xlplayer_create(samplerate, 0.1, "analyser", shutdown_f, NULL, 0, NULL, NULL, 0.0f)))
+        {
+        fprintf(stderr, "analyser: failed to create player module\n");
+        exit(5);
+        }
+    self->xlplayer->offline = TRUE;
+    self->xlplayer->sink = analyser_sink;
+    self->xlplayer->sink_end = analyser_sink_end;
+    self->xlplayer->sink_data = self;
+    self->xlplayer->rsqual = SRC_SINC_FASTEST;     /* ample for measurement */
+    shelf_init(&self->shelf, samplerate);
+    highpass_init(&self->highpass, samplerate);
+    self->quarter_frames = samplerate / 10;
+    return self;
+    }
+
+void analyser_destroy(struct analyser *self)
+    {
+    if (self)
+        {
+        xlplayer_destroy(self->xlplayer);
+        free(self->pathname);
+        free(self->blocks.v);
+        free(self->levels.v);
+        free(self->lows.v);
+        free(self->highs.v);
+        free(self);
+        }
+    }
+
+void analyser_start(struct analyser *self, char *pathname)
+    {
+    free(self->pathname);
+    if (!(self->pathname = strdup(pathname)))
+        {
+        fprintf(stderr, "analyser: malloc failure\n");
+        exit(5);
+        }
+    analyser_reset(self);
+    self->state = AS_BUSY;
+    if (xlplayer_play(self->xlplayer, self->pathname, 0, 0, 0.0f, 0) == -1)
+        {
+        fprintf(stderr, "analyser: unable to decode %s\n", self->pathname);
+        self->state = AS_DONE;
+        }
+    }
+
+void analyser_report(struct analyser *self, FILE *fp)
+    {
+    double loudness = self->complete ? analyser_integrated(self) : NAN;
+    double lead, end, fade;
+
+    if (isnan(loudness))
+        fprintf(fp, "analysis_loudness=nan\n");
+    else
+        fprintf(fp, "analysis_loudness=%0.2f\n", loudness);
+    if (self->complete && analyser_offsets(self, &lead, &end, &fade))
+        fprintf(fp, "analysis_lead=%0.1f\nanalysis_end=%0.1f\nanalysis_fade=%0.1f\n", lead, end, fade);
+    if (self->complete && self->levels.n)
+        {
+        fprintf(fp, "analysis_overview=");
+        analyser_overview(self, fp);
+        fputc('\n', fp);
+        }
+    fprintf(fp, "analysis_pathname=%s\n", self->pathname);
+    self->state = AS_IDLE;
+    }
@@ -0,0 +1,73 @@
+/*
+#   analyser.h: offline loudness, silence and waveform analysis of media files
+#   Copyright (C) 2026 Stephen Fairchild (s-fairchild@users.sourceforge.net)
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 2 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program in the file entitled COPYING.
+#   If not, see <http://www.gnu.org/licenses/>.
+*/
+
+#ifndef ANALYSER_H
+#define ANALYSER_H
+
+#include <stdio.h>
+#include <signal.h>
+#include "xlplayer.h"
+
+enum analyser_state {AS_IDLE, AS_BUSY, AS_DONE};
+
+struct biquad
+    {
+    double b0, b1, b2, a1, a2;
+    double z1[2], z2[2];                /* filter state per channel */
+    };
+
+struct series
+    {
+    double *v;
+    size_t n, alloc;
+    };
+
+struct analyser
+    {
+    struct xlplayer *xlplayer;          /* decodes the file */
+    char *pathname;
+    volatile enum analyser_state state;
+    int complete;                       /* the whole file was decoded */
+    struct biquad shelf;                /* the EBU R128 K-weighting filter */
+    struct biquad highpass;
+    size_t quarter_frames;              /* frames in 100 ms */
+    size_t fill;                        /* frames so far in the current 100 ms */
+    double acc;                         /* weighted sum of squares of the above */
+    double quarters[4];                 /* the last 400 ms */
+    int n_quarters;
+    double raw_acc;                     /* unweighted sum of squares of the current 100 ms */
+    float lo, hi;                       /* sample extremes of the current 100 ms */
+    struct series blocks;               /* mean square of 400 ms blocks overlapped by 75% */
+    struct series levels;               /* unweighted mean square of each 100 ms */
+    struct series lows, highs;          /* sample extremes of each 100 ms */
+    };
+
+/* analyser_create: an analyser for audio at the jack sample rate */
+struct analyser *analyser_create(int samplerate, sig_atomic_t *shutdown_f);
+/* analyser_destroy: the opposite of analyser_create */
+void analyser_destroy(struct analyser *self);
+
+/* analyser_start: begin analysing pathname -- the analyser must be idle */
+void analyser_start(struct analyser *self, char *pathname);
+
+/* analyser_report: write out the results of a finished analysis and become idle
+* the output is a group of key=value lines ending with analysis_pathname */
+void analyser_report(struct analyser *self, FILE *fp);
+
+#endif /* ANALYSER_H */
@@ -42,6 +42,7 @@
 #include "dbconvert.h"
 #include "compressor.h"
 #include "xlplayer.h"
+#include "analyser.h"
 #include "mp3dec.h"
 #include "speextag.h"
 #include "sndfileinfo.h"
@@ -60,6 +61,14 @@
 #define MAIN_RB_SIZE 10.0
 /* number of bytes in the MIDI queue buffer */
 #define MIDI_QUEUE_SIZE 1024
+/* effects no longer than this many seconds are held in memory */
+#define EFFECT_PRELOAD_MAX_S 30
+/* seconds of the next track decoded in advance -- should exceed MAIN_RB_SIZE */
+#define PREFETCH_S 12
+/* number of files that may be analysed concurrently */
+#define N_ANALYSERS 2
+/* milliseconds of audio an offline render may run ahead of the user interface */
+#define RENDER_STEP_MS 1000
 
 /* the different VOIP modes */
 #define NO_PHONE 0
@@ -156,9 +165,15 @@ static pthread_mutex_t midi_mutex;
 static struct xlplayer *plr_l, *plr_r, *plr_i; /* player instance stuctures */
 static struct xlplayer **plr_j;
 static struct xlplayer **plr_j_roster;
+static struct analyser *analysers[N_ANALYSERS];
 static struct xlplayer *players[4];
 static struct xlplayer *players_roster[4];
 
+/* offline rendering runs the mixer under jack freewheel in steps set by the user interface */
+static int render_mode;
+static volatile long render_allowance;   /* frames that may be produced before the next step */
+static u_int64_t render_frames;          /* frames produced since the render started */
+
 /* these are set in the parse routine - the contents coming from the GUI */
 static char *mixer_string, *compressor_string, *gate_string, *microphone_string, *item_index;
 static char *new_mic_string;
@@ -430,6 +445,35 @@ static void update_smoothed_volumes()
         }
     }
 
+/* render_flush_pending: a player is waiting on this callback to flush its buffers */
+static int render_flush_pending(void)
+    {
+    for (struct xlplayer **p = players; *p; ++p)
+        if ((*p)->jack_flush)
+            return TRUE;
+    for (struct xlplayer **p = plr_j; *p; ++p)
+        if ((*p)->jack_flush)
+            return TRUE;
+    return FALSE;
+    }
+
+/* render_wait: hold back freewheeling until the user interface and the decoders catch up */
+static void render_wait(jack_nframes_t nframes)
+    {
+    struct xlplayer *p;
+
+    /* a pending flush means the mixer thread and in turn the user interface are blocked on us */
+    while (render_mode && g.freewheel && render_allowance < (long)nframes && !g.app_shutdown && !render_flush_pending())
+        usleep(1000);
+    /* there is no deadline to meet so decoders are never allowed to underrun */
+    for (int i = 0; (p = players[i]); ++i)
+        while (render_mode && g.freewheel && !g.app_shutdown && !p->pause && (p->playmode == PM_PLAYING || p->playmode == PM_HANDOVER)
+                    && jack_ringbuffer_read_space(p->right_ch) < nframes * sizeof (sample_t))
+            usleep(1000);
+    render_allowance -= nframes;
+    render_frames += nframes;
+    }
+
 /* process_audio: the JACK callback routine */
 int mixer_process_audio(jack_nframes_t nframes, void *arg)
     {
@@ -561,6 +605,9 @@ int mixer_process_audio(jack_nframes_t nframes, void *arg)
         reset_vu_stats_f = FALSE;
         }
 
+    if (render_mode && g.freewheel)
+        render_wait(nframes);
+
     mic_process_start_all(mics, nframes);
     xlplayer_read_start_all(players, nframes, players_roster);
     xlplayer_read_start_all(plr_j, nframes, plr_j_roster);
@@ -1124,6 +1171,8 @@ static void mixer_cleanup()
         xlplayer_destroy(*p);
     free(plr_j);
     free(plr_j_roster);
+    for (int i = 0; i < N_ANALYSERS; ++i)
+        analyser_destroy(analysers[i]);
     }
 
 int mixer_new_buffer_size(jack_nframes_t n_frames)
@@ -1171,6 +1220,7 @@ void mixer_init(void)
             exit(5);
             }
         plr_j[i]->fade_mode = 3;
+        plr_j[i]->pcm = pcmcache_create((size_t)sr * EFFECT_PRELOAD_MAX_S, FALSE);
         }
     
     if (!(players[n++] = plr_i = xlplayer_create(sr, MAIN_RB_SIZE, "interlude", &g.app_shutdown, &interludevol, 0, &inter_stream, &inter_audio, 0.3f)))
@@ -1187,6 +1237,21 @@ void mixer_init(void)
         exit(5);
         }
 
+    for (struct xlplayer **p = players; *p; ++p)
+        {
+        if (!((*p)->standby = xlplayer_create(sr, 0.1, "standby", &g.app_shutdown, NULL, 0, NULL, NULL, 0.0f)))
+            {
+            fprintf(stderr, "failed to create standby player module\n");
+            exit(5);
+            }
+        (*p)->standby->offline = TRUE;
+        (*p)->standby->pcm = pcmcache_create((size_t)sr * PREFETCH_S, TRUE);
+        (*p)->pcm = pcmcache_create((size_t)sr * PREFETCH_S, TRUE);
+        }
+
+    for (int i = 0; i < N_ANALYSERS; ++i)
+        analysers[i] = analyser_create(sr, &g.app_shutdown);
+
     smoothing_volume_init(&jingles_headroom_smoothing, &jingles_headroom_control, 0.0f);
 
     if (!init_dblookup_table())
@@ -1261,6 +1326,31 @@ int mixer_main()
     if (!strcmp(action, "freewheel_off"))
         jack_set_freewheel(g.client, 0);
 
+    if (!strcmp(action, "render_start"))
+        {
+        render_frames = 0;
+        render_allowance = 0;
+        for (struct xlplayer **p = players; *p; ++p)
+            (*p)->unthrottled = TRUE;
+        render_mode = TRUE;
+        jack_set_freewheel(g.client, 1);
+        }
+
+    if (!strcmp(action, "render_step"))
+        {
+        render_allowance = (long)sr * RENDER_STEP_MS / 1000;
+        fprintf(g.out, "render_frames=%llu\nend\n", (unsigned long long)render_frames);
+        fflush(g.out);
+        }
+
+    if (!strcmp(action, "render_stop"))
+        {
+        render_mode = FALSE;
+        for (struct xlplayer **p = players; *p; ++p)
+            (*p)->unthrottled = FALSE;
+        jack_set_freewheel(g.client, 0);
+        }
+
     void dis_connect(char *str, int (*fn)(jack_client_t *, const char *, const char *))
         {
         const char **jackports, **jp;
@@ -1324,6 +1414,15 @@ int mixer_main()
         xlplayer_play(plr_j[i], playerpathname, 0, 0, atoi(rg_db), i);
         }
 
+    if (!strcmp(action, "preloadeffect"))
+        {
+        int i = atoi(effect_ix);
+
+        /* never cut short an effect that is sounding */
+        if (plr_j[i]->playmode == PM_STOPPED)
+            xlplayer_preload(plr_j[i], playerpathname);
+        }
+
     if (!strcmp(action, "stopeffect"))
         {
         int i = atoi(effect_ix);
@@ -1376,6 +1475,12 @@ int mixer_main()
         fprintf(g.out, "context_id=%d\n", xlplayer_play(plr_i, playerpathname, atoi(seek_s), atoi(size), atof(rg_db), 0));
         fflush(g.out);
         }
+    if (!strcmp(action, "prefetchleft"))
+        xlplayer_prefetch(plr_l, playerpathname);
+    if (!strcmp(action, "prefetchright"))
+        xlplayer_prefetch(plr_r, playerpathname);
+    if (!strcmp(action, "prefetchinterlude"))
+        xlplayer_prefetch(plr_i, playerpathname);
     if (!strcmp(action, "playnoflushleft"))
         {
         fprintf(g.out, "context_id=%d\n", xlplayer_play_noflush(plr_l, playerpathname, atoi(seek_s), atoi(size), atof(rg_db), 0));
@@ -1409,6 +1514,32 @@ int mixer_main()
     if (!strcmp(action, "stopinterlude"))
         xlplayer_eject(plr_i);
 
+    if (!strcmp(action, "analyse"))
+        {
+        int i;
+
+        for (i = 0; i < N_ANALYSERS && analysers[i]->state != AS_IDLE; ++i);
+        if (i < N_ANALYSERS)
+            analyser_start(analysers[i], playerpathname);
+        else
+            fprintf(stderr, "no analyser free for %s\n", playerpathname);
+        }
+
+    if (!strcmp(action, "analysisresults"))
+        {
+        int idle = 0;
+
+        for (int i = 0; i < N_ANALYSERS; ++i)
+            {
+            if (analysers[i]->state == AS_DONE)
+                analyser_report(analysers[i], g.out);
+            if (analysers[i]->state == AS_IDLE)
+                ++idle;
+            }
+        fprintf(g.out, "analysers_idle=%d\nend\n", idle);
+        fflush(g.out);
+        }
+
     if (!strcmp(action, "dither"))
         {
         xlplayer_dither(plr_l, TRUE);
@@ -0,0 +1,181 @@
+/*
+#   pcmcache.c: decoded audio held in memory for instant replay by xlplayer
+#   Copyright (C) 2026 Stephen Fairchild (s-fairchild@users.sourceforge.net)
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 2 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program in the file entitled COPYING.
+#   If not, see <http://www.gnu.org/licenses/>.
+*/
+
+#include <stdio.h>
+#include <stdlib.h>
+#include <string.h>
+#include "xlplayer.h"
+#include "pcmcache.h"
+
+#define TRUE 1
+#define FALSE 0
+#define ACCEPTED 1
+#define REJECTED 0
+
+static const size_t pcmcache_frameqty = 4096;
+
+struct pcmcache *pcmcache_create(size_t max_frames, int prefix)
+    {
+    struct pcmcache *self;
+
+    if (!(self = calloc(1, sizeof (struct pcmcache))))
+        {
+        fprintf(stderr, "pcmcache: malloc failure\n");
+        exit(5);
+        }
+    self->max_frames = max_frames;
+    self->prefix = prefix;
+    return self;
+    }
+
+static void pcmcache_clear(struct pcmcache *self)
+    {
+    free(self->pathname);
+    free(self->left);
+    free(self->right);
+    self->pathname = NULL;
+    self->left = self->right = NULL;
+    self->frames = self->alloc = 0;
+    self->truncated = FALSE;
+    self->state = PCMCACHE_EMPTY;
+    }
+
+void pcmcache_destroy(struct pcmcache *self)
+    {
+    if (self)
+        {
+        pcmcache_clear(self);
+        free(self);
+        }
+    }
+
+void pcmcache_begin(struct pcmcache *self, char *pathname)
+    {
+    pcmcache_clear(self);
+    if (!(self->pathname = strdup(pathname)))
+        {
+        fprintf(stderr, "pcmcache: malloc failure\n");
+        exit(5);
+        }
+    self->state = PCMCACHE_FILLING;
+    }
+
+int pcmcache_append(struct pcmcache *self, float *left, float *right, size_t frames)
+    {
+    size_t need = self->frames + frames;
+
+    if (need > self->max_frames)
+        {
+        if (!self->prefix)
+            {
+            fprintf(stderr, "pcmcache: %s is too long to hold in memory\n", self->pathname);
+            pcmcache_clear(self);
+            return FALSE;
+            }
+        /* keep what fits as the opening of the file */
+        frames = self->max_frames - self->frames;
+        need = self->max_frames;
+        self->truncated = TRUE;
+        }
+    if (need > self->alloc)
+        {
+        /* grow geometrically to keep reallocations few */
+        self->alloc = need * 2 > self->max_frames ? self->max_frames : need * 2;
+        if (!(self->left = realloc(self->left, self->alloc * sizeof (float))) ||
+                    !(self->right = realloc(self->right, self->alloc * sizeof (float))))
+            {
+            fprintf(stderr, "pcmcache: malloc failure\n");
+            exit(5);
+            }
+        }
+    memcpy(self->left + self->frames, left, frames * sizeof (float));
+    memcpy(self->right + self->frames, right, frames * sizeof (float));
+    self->frames = need;
+    return !self->truncated;
+    }
+
+void pcmcache_end(struct pcmcache *self, int complete)
+    {
+    if (self->state != PCMCACHE_FILLING)
+        return;
+    if (complete)
+        {
+        self->state = PCMCACHE_READY;
+        fprintf(stderr, "pcmcache: holding %lu frames of %s\n", (unsigned long)self->frames, self->pathname);
+        }
+    else
+        pcmcache_clear(self);
+    }
+
+static void pcmcache_init(struct xlplayer *xlplayer)
+    {
+    struct pcmcache *self = xlplayer->dec_data;
+
+    self->pos = (size_t)xlplayer->seek_s * xlplayer->samplerate;
+    if (self->pos > self->frames)
+        self->pos = self->frames;
+    }
+
+static void pcmcache_play(struct xlplayer *xlplayer)
+    {
+    struct pcmcache *self = xlplayer->dec_data;
+    size_t frames, i;
+    float gain, *l, *r;
+
+    frames = self->frames - self->pos;
+    if (frames > pcmcache_frameqty)
+        frames = pcmcache_frameqty;
+    xlplayer->op_buffersize = frames * sizeof (float);
+    if (frames && (!(xlplayer->leftbuffer = realloc(xlplayer->leftbuffer, xlplayer->op_buffersize)) ||
+                !(xlplayer->rightbuffer = realloc(xlplayer->rightbuffer, xlplayer->op_buffersize))))
+        {
+        fprintf(stderr, "pcmcache: malloc failure\n");
+        exit(5);
+        }
+    for (i = 0, l = xlplayer->leftbuffer, r = xlplayer->rightbuffer; i < frames; ++i)
+        {
+        gain = xlplayer_get_next_gain(xlplayer);
+        *l++ = self->left[self->pos + i] * gain;
+        *r++ = self->right[self->pos + i] * gain;
+        }
+    self->pos += frames;
+    xlplayer_write_channel_data(xlplayer);
+    if (frames == 0)
+        xlplayer->playmode = self->truncated ? PM_HANDOVER : PM_FLUSH;
+    }
+
+static void pcmcache_eject(struct xlplayer *xlplayer)
+    {
+    }
+
+int pcmcache_reg(struct xlplayer *xlplayer, struct pcmcache *self)
+    {
+    if (!self || self->state != PCMCACHE_READY || strcmp(self->pathname, xlplayer->pathname))
+        return REJECTED;
+    /* seeks past the opening are left to the file decoders */
+    if (self->truncated && (size_t)xlplayer->seek_s * xlplayer->samplerate >= self->frames)
+        return REJECTED;
+    /* the requested pathname is transient and a handover reopens the file later */
+    xlplayer->pathname = self->pathname;
+    xlplayer->dec_data = self;
+    xlplayer->dec_init = pcmcache_init;
+    xlplayer->dec_play = pcmcache_play;
+    xlplayer->dec_eject = pcmcache_eject;
+    return ACCEPTED;
+    }
@@ -0,0 +1,61 @@
+/*
+#   pcmcache.h: decoded audio held in memory for instant replay by xlplayer
+#   Copyright (C) 2026 Stephen Fairchild (s-fairchild@users.sourceforge.net)
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 2 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program in the file entitled COPYING.
+#   If not, see <http://www.gnu.org/licenses/>.
+*/
+
+#ifndef PCMCACHE_H
+#define PCMCACHE_H
+
+#include <stddef.h>
+
+enum pcmcache_state {PCMCACHE_EMPTY, PCMCACHE_FILLING, PCMCACHE_READY};
+
+struct pcmcache
+    {
+    char *pathname;                     /* the file the audio was decoded from */
+    float *left;                        /* audio at the jack sample rate */
+    float *right;
+    size_t frames;                      /* the number of frames held */
+    size_t alloc;                       /* the number of frames allocated */
+    size_t max_frames;                  /* longer files are not cached */
+    size_t pos;                         /* playback position */
+    int prefix;                         /* keep the opening of longer files rather than none of it */
+    int truncated;                      /* only the opening of the file is held */
+    enum pcmcache_state state;
+    };
+
+struct xlplayer;
+
+/* pcmcache_create: a cache for up to max_frames of audio
+* with prefix set the first max_frames of longer files are held and play
+* carries on from the file itself once they run out */
+struct pcmcache *pcmcache_create(size_t max_frames, int prefix);
+/* pcmcache_destroy: the opposite of pcmcache_create */
+void pcmcache_destroy(struct pcmcache *self);
+
+/* pcmcache_begin: discard the contents and start filling from pathname */
+void pcmcache_begin(struct pcmcache *self, char *pathname);
+/* pcmcache_append: add audio, returns 0 when full in which case a cache that is not a prefix is emptied */
+int pcmcache_append(struct pcmcache *self, float *left, float *right, size_t frames);
+/* pcmcache_end: filling stopped -- complete indicates all the audio was had */
+void pcmcache_end(struct pcmcache *self, int complete);
+
+/* pcmcache_reg: the decoder for audio cached in self -- accepts when the pathname matches
+ * and repoints the player pathname at the copy held by the cache */
+int pcmcache_reg(struct xlplayer *xlplayer, struct pcmcache *self);
+
+#endif /* PCMCACHE_H */
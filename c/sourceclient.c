@@ -118,6 +118,17 @@ static int get_report(struct threads_info *ti, struct universal_vars *uv, void *
     return FAILED;
     }
 
+static int get_all_reports(struct threads_info *ti, struct universal_vars *uv, void *other)
+    {
+    int i;
+
+    for (i = 0; i < ti->n_recorders; i++)
+        recorder_make_report(ti->recorder[i]);
+    for (i = 0; i < ti->n_streamers; i++)
+        streamer_make_report(ti->streamer[i]);
+    return SUCCEEDED;
+    }
+
 static int command_parse(struct commandmap *map, struct threads_info *ti, struct universal_vars *uv)
     {
     for (; map->key; map++)
@@ -200,6 +211,7 @@ static struct commandmap commandmap[] = {
     { "encoder_lame_availability", encoder_init_lame, NULL},
     { "encoder_aac_availability", live_avcodec_encoder_aac_functionality, NULL},
     { "get_report", get_report, NULL },
+    { "get_all_reports", get_all_reports, NULL },
     { "encoder_start", encoder_start, &ev },
     { "encoder_stop", encoder_stop, NULL },
     { "encoder_update", encoder_update, &ev },
@@ -197,6 +197,33 @@ void xlplayer_write_channel_data(struct xlplayer *self)
     float *lp, *rp;
     int sc;
     
+    if (self->pcm && self->pcm->state == PCMCACHE_FILLING)
+        {
+        /* preloading: the audio goes to memory rather than to jack */
+        if (self->op_buffersize && !pcmcache_append(self->pcm, self->leftbuffer, self->rightbuffer, self->op_buffersize / sizeof (sample_t)))
+            self->playmode = PM_EJECTING;
+        self->write_deferred = FALSE;
+        return;
+        }
+
+    if (self->sink)
+        {
+        /* offline processing: no jack involvement but pause now and then to spare the cpu */
+        if (self->op_buffersize)
+            {
+            samplecount = self->op_buffersize / sizeof (sample_t);
+            self->sink(self, self->leftbuffer, self->rightbuffer, samplecount);
+            self->sleep_samples += samplecount;
+            if (self->sleep_samples > self->samplerate / 4)
+                {
+                usleep(5000);
+                self->sleep_samples = 0;
+                }
+            }
+        self->write_deferred = FALSE;
+        return;
+        }
+
     if (self->op_buffersize > jack_ringbuffer_write_space(self->right_ch))
         {
         self->write_deferred = TRUE;      /* prevent further accumulation of data that would clobber */
@@ -225,7 +252,7 @@ void xlplayer_write_channel_data(struct xlplayer *self)
             self->silence += (float)sc / self->samplerate;
             }
         self->write_deferred = FALSE;
-        if (self->sleep_samples > 6000)
+        if (self->sleep_samples > 6000 && !self->unthrottled)
             {
             if (self->sleep_samples > 12000)
                 usleep(20000);
@@ -269,6 +296,45 @@ static char *get_extension(char *pathname)
     return extension;
     }
 
+/* xlplayer_reg_decoder: find a decoder for the file by its extension */
+static int xlplayer_reg_decoder(struct xlplayer *self)
+    {
+    char *extension = get_extension(self->pathname);
+    int accepted;
+
+    accepted = ((!strcmp(extension, "ogg") || !strcmp(extension, "oga")) && oggdecode_reg(self))
+#ifdef HAVE_SPEEX
+              || (!strcmp(extension, "spx") && oggdecode_reg(self))
+#endif
+#ifdef HAVE_OPUS
+              || (!strcmp(extension, "opus") && oggdecode_reg(self))
+#endif
+#ifdef HAVE_FLAC
+              || (!strcmp(extension, "flac") && flacdecode_reg(self))
+#endif
+              || ((!strcmp(extension, "wav") || !strcmp(extension, "au") || !strcmp(extension, "aiff")) && sndfiledecode_reg(self))
+#ifdef HAVE_LIBAV
+              || ((!strcmp(extension, "aac") || !strcmp(extension, "m4a") || !strcmp(extension, "mp4") || !strcmp(extension, "m4b") || !strcmp(extension, "m4p") || !strcmp(extension, "wma") || !strcmp(extension, "avi") || !strcmp(extension, "mpc") || !strcmp(extension, "ape")) && avcodecdecode_reg(self))
+#endif /* HAVE_LIBAV */
+              || ((!strcmp(extension, "mp3") || (!strcmp(extension, "mp2"))) && mpg123ok && mp3decode_reg(self));
+    free(extension);
+    return accepted;
+    }
+
+/* xlplayer_take_prefetch: play from the opening decoded by the standby player */
+static int xlplayer_take_prefetch(struct xlplayer *self)
+    {
+    struct pcmcache *pcm;
+
+    if (!self->standby || !pcmcache_reg(self, self->standby->pcm))
+        return FALSE;
+    /* exchange caches so the standby is free to prefetch again */
+    pcm = self->pcm;
+    self->pcm = self->standby->pcm;
+    self->standby->pcm = pcm;
+    return TRUE;
+    }
+
 static void xlplayer_command(struct xlplayer *self, enum command_t new_command)
     {
     pthread_mutex_lock(&self->command_mutex);
@@ -281,7 +347,7 @@ static void xlplayer_command(struct xlplayer *self, enum command_t new_command)
 
 static void *xlplayer_main(struct xlplayer *self)
     {
-    char *extension;
+    int seek_s;
     
     sig_mask_thread();
     for(self->up = TRUE; self->command != CMD_THREADEXIT; self->watchdog_timer = 0)
@@ -303,10 +369,13 @@ static void *xlplayer_main(struct xlplayer *self)
                 else
                     {
                     xlplayer_set_fadesteps(self, self->fade_mode);
-                    self->jack_flush = TRUE;
-                    while (self->jack_is_flushed == 0 && *(self->jack_shutdown_f) == FALSE)
-                        usleep(10000);
-                    self->jack_is_flushed = 0;
+                    if (!self->offline)
+                        {
+                        self->jack_flush = TRUE;
+                        while (self->jack_is_flushed == 0 && *(self->jack_shutdown_f) == FALSE)
+                            usleep(10000);
+                        self->jack_is_flushed = 0;
+                        }
                     self->command = CMD_COMPLETE;
                     }
                 break;
@@ -328,24 +397,7 @@ static void *xlplayer_main(struct xlplayer *self)
             case PM_INITIATE:
                 self->initial_audio_context = -1;   /* pre-select failure return code */
                 xlplayer_set_fadesteps(self, self->fade_mode);
-                extension = get_extension(self->pathname);
-                if (
-                          ((!strcmp(extension, "ogg") || !strcmp(extension, "oga")) && oggdecode_reg(self))
-#ifdef HAVE_SPEEX
-                          || (!strcmp(extension, "spx") && oggdecode_reg(self))
-#endif
-#ifdef HAVE_OPUS
-                          || (!strcmp(extension, "opus") && oggdecode_reg(self))
-#endif
-#ifdef HAVE_FLAC
-                          || (!strcmp(extension, "flac") && flacdecode_reg(self))
-#endif
-                          || ((!strcmp(extension, "wav") || !strcmp(extension, "au") || !strcmp(extension, "aiff")) && sndfiledecode_reg(self))
-#ifdef HAVE_LIBAV
-                          || ((!strcmp(extension, "aac") || !strcmp(extension, "m4a") || !strcmp(extension, "mp4") || !strcmp(extension, "m4b") || !strcmp(extension, "m4p") || !strcmp(extension, "wma") || !strcmp(extension, "avi") || !strcmp(extension, "mpc") || !strcmp(extension, "ape")) && avcodecdecode_reg(self))
-#endif /* HAVE_LIBAV */
-                          || ((!strcmp(extension, "mp3") || (!strcmp(extension, "mp2"))) && mpg123ok && mp3decode_reg(self))
-                    )
+                if ((self->pcm && pcmcache_reg(self, self->pcm)) || xlplayer_take_prefetch(self) || xlplayer_reg_decoder(self))
                     {
                     self->playmode = PM_PLAYING;
                     self->play_progress_ms = 0;
@@ -353,7 +405,7 @@ static void *xlplayer_main(struct xlplayer *self)
                     self->pause = 0;
                     self->samples_written = 0;
                     self->sleep_samples = 0;
-                    fade_set(self->fadein, (self->seek_s || self->fade_mode) ? FADE_SET_LOW : FADE_SET_HIGH, -1.0f, FADE_IN);
+                    fade_set(self->fadein, (self->seek_s || self->fade_mode) && !(self->pcm && self->pcm->state == PCMCACHE_FILLING) ? FADE_SET_LOW : FADE_SET_HIGH, -1.0f, FADE_IN);
                     self->silence = 0.0f;
                     self->dec_init(self);
                     if (self->command != CMD_COMPLETE)
@@ -363,7 +415,6 @@ static void *xlplayer_main(struct xlplayer *self)
                 else
                     self->playmode = PM_STOPPED;
                 self->command = CMD_COMPLETE;
-                free(extension);
                 break;
             case PM_PLAYING:
                 if (self->write_deferred)
@@ -371,6 +422,21 @@ static void *xlplayer_main(struct xlplayer *self)
                 else
                     self->dec_play(self);
                 break;
+            case PM_HANDOVER:
+                /* the opening held in memory is used up so carry on from the file itself */
+                seek_s = self->seek_s;
+                self->seek_s = ((struct pcmcache *)self->dec_data)->frames / self->samplerate;
+                self->dec_eject(self);
+                if (xlplayer_reg_decoder(self))
+                    {
+                    fade_set(self->fadein, FADE_SET_HIGH, -1.0f, FADE_IN);
+                    self->dec_init(self);
+                    self->playmode = PM_PLAYING;
+                    }
+                else
+                    self->playmode = PM_FLUSH;
+                self->seek_s = seek_s;
+                break;
             case PM_FLUSH:
                 if (self->write_deferred)
                     xlplayer_write_channel_data(self);
@@ -380,6 +446,10 @@ static void *xlplayer_main(struct xlplayer *self)
             case PM_EJECTING:
                 xlplayer_set_fadesteps(self, self->fade_mode);
                 self->dec_eject(self);
+                if (self->pcm)
+                    pcmcache_end(self->pcm, self->command != CMD_EJECT);
+                if (self->sink_end)
+                    self->sink_end(self, self->command != CMD_EJECT);
                 if (self->playlistmode)
                     {
                     if (self->command != CMD_EJECT)
@@ -612,6 +682,8 @@ void xlplayer_destroy(struct xlplayer *self)
         jack_ringbuffer_free(self->right_ch);
         jack_ringbuffer_free(self->left_fade);
         jack_ringbuffer_free(self->right_fade);
+        pcmcache_destroy(self->pcm);
+        xlplayer_destroy(self->standby);
         free(self);
         }
     }
@@ -631,6 +703,50 @@ int xlplayer_play(struct xlplayer *self, char *pathname, int seek_s, int size, f
     return self->initial_audio_context;
     }
 
+void xlplayer_preload(struct xlplayer *self, char *pathname)
+    {
+    xlplayer_eject(self);
+    pcmcache_begin(self->pcm, pathname);
+    self->pathname = pathname;
+    self->gain = 1.0;
+    self->seek_s = 0;
+    self->size = 0;
+    self->id = 0;
+    self->loop = FALSE;
+    self->usedelay = FALSE;
+    self->playlistmode = FALSE;
+    xlplayer_command(self, CMD_PLAY);
+    }
+
+void xlplayer_prefetch(struct xlplayer *self, char *pathname)
+    {
+    struct xlplayer *standby = self->standby;
+
+    if (!standby)
+        return;
+    /* an earlier prefetch may still be opening its file */
+    while (standby->command != CMD_COMPLETE)
+        usleep(10000);
+    if (standby->pcm->state != PCMCACHE_EMPTY && !strcmp(standby->pcm->pathname, pathname))
+        return;
+    xlplayer_eject(standby);
+    pcmcache_begin(standby->pcm, pathname);
+    standby->pathname = standby->pcm->pathname;
+    standby->rsqual = self->rsqual;
+    standby->gain = 1.0;
+    standby->seek_s = 0;
+    standby->size = 0;
+    standby->id = 0;
+    standby->loop = FALSE;
+    standby->usedelay = FALSE;
+    standby->playlistmode = FALSE;
+    /* no waiting on the slow part which is the whole point */
+    pthread_mutex_lock(&standby->command_mutex);
+    standby->command = CMD_PLAY;
+    pthread_cond_signal(&standby->command_cv);
+    pthread_mutex_unlock(&standby->command_mutex);
+    }
+
 int xlplayer_playmany(struct xlplayer *self, char *playlist, int loop_f)
     {
     char *start = playlist, *end;
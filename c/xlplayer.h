@@ -35,10 +35,11 @@
 
 #include "fade.h"
 #include "smoothing.h"
+#include "pcmcache.h"
 
 enum command_t {CMD_COMPLETE, CMD_PLAY, CMD_EJECT, CMD_CLEANUP, CMD_THREADEXIT, CMD_PLAYMANY};
 
-enum playmode_t {PM_STOPPED, PM_INITIATE, PM_PLAYING, PM_FLUSH, PM_EJECTING };
+enum playmode_t {PM_STOPPED, PM_INITIATE, PM_PLAYING, PM_FLUSH, PM_EJECTING, PM_HANDOVER };
 
 enum metadata_t {DM_NONE_NEW, DM_SPLIT_U8, DM_JOINED_U8, DM_SPLIT_L1, DM_JOINED_L1, DM_JOINED_UC, DM_JOINED_UCBE, DM_NOTAG};
 
@@ -147,6 +148,13 @@ struct xlplayer
     uint32_t id;                        /* player identity e.g. player 3 = 1 << 3 */
     pthread_mutex_t command_mutex;      /* lock for command varaible change */
     pthread_cond_t command_cv;          /* used to wake up idle worker thread */
+    struct pcmcache *pcm;               /* audio held in memory for instant play, or NULL */
+    void (*sink)(struct xlplayer *, float *, float *, size_t); /* when set takes the audio in place of jack */
+    void (*sink_end)(struct xlplayer *, int);   /* called when decoding stops -- true if it ran to the end */
+    void *sink_data;                    /* for use by the above */
+    int offline;                        /* jack never reads from this player */
+    int unthrottled;                    /* decode flat out e.g. when rendering offline */
+    struct xlplayer *standby;           /* decodes the opening of the next track in advance, or NULL */
     };
 
 /* xlplayer_create: create an instance of the player */
@@ -167,6 +175,14 @@ int xlplayer_playmany(struct xlplayer *self, char *playlist, int loop_f);
 /* xlplayer_play_noflush: starts the player without flushing out old data from the ringbuffer */
 int xlplayer_play_noflush(struct xlplayer *self, char *pathname, int seek_s, int size, float gain_db, int id);
 
+/* xlplayer_preload: decodes a track into the player's pcm cache without playing it
+* subsequent xlplayer_play calls for the same pathname are served from memory */
+void xlplayer_preload(struct xlplayer *self, char *pathname);
+
+/* xlplayer_prefetch: has the standby player decode the opening of the track expected to play next
+* the call returns without waiting for the file to be opened */
+void xlplayer_prefetch(struct xlplayer *self, char *pathname);
+
 /* xlplayer_cancelplaynext: cancels the automatic playing of the next track 
 * the current track is allowed to continue playing */
 void xlplayer_cancelplaynext(struct xlplayer *self);
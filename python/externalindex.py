@@ -0,0 +1,376 @@
+"""Persistent indexes of media for the External playlist mode.
+
+An index lists the tracks of a playlist file or media directory in play
+order along with a cursor marking the last track issued. Both are saved to
+disk so playback carries on where it left off after a restart.
+
+Directory indexes are kept up to date one directory at a time using file
+monitors where gio is available. Without gio directory modification times
+are checked at wrap-around. Either way only changed directories are read
+again, never the whole tree.
+"""
+
+#   Copyright (C) 2026 Stephen Fairchild (s-fairchild@users.sourceforge.net)
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 2 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program in the file entitled COPYING.
+#   If not, see <http://www.gnu.org/licenses/>.
+
+from __future__ import print_function
+
+__all__ = ["open_index"]
+
+import os
+import pickle
+import bisect
+from abc import ABCMeta, abstractmethod
+
+try:
+    import gio
+except ImportError:
+    gio = None
+
+from . import playlistio
+from .gtkstuff import timeout_add, source_remove
+
+
+# Milliseconds to wait for file activity to settle before reindexing.
+SETTLE_TIME = 1500
+
+
+def open_index(pathname, store, check_media):
+    """Load or create the index for pathname.
+
+    pathname: a playlist file or a directory.
+    store: where the index is saved.
+    check_media: predicate for media files that are eligible for play.
+    """
+
+    try:
+        with open(store, "rb") as f:
+            saved = pickle.load(f)
+    except Exception:
+        saved = None
+    else:
+        if saved.get("pathname") != pathname:
+            saved = None
+
+    if os.path.isdir(pathname):
+        return DirectoryIndex(pathname, store, check_media, 2, saved)
+
+    ext = os.path.splitext(pathname)[1].lower()
+    if ext in (".m3u", ".m3u8"):
+        try:
+            gen = playlistio.read_m3u(pathname)
+            first = next(gen, None)
+            if first is not None and next(gen, None) is None and \
+                                                    os.path.isdir(first):
+                # A single element referring to a directory.
+                return DirectoryIndex(first, store, check_media, 1, saved)
+        except IOError:
+            pass
+
+    return PlaylistIndex(pathname, store, saved)
+
+
+class ExternalIndex(object):
+    """Common code for the index types."""
+
+    __metaclass__ = ABCMeta
+
+    def __init__(self, pathname, store):
+        self.pathname = pathname
+        self._store = store
+        self._monitors = {}
+        self._dirty = False
+
+    @abstractmethod
+    def next(self):
+        """The next item in play order wrapping at the end.
+
+        Returns None if the index is empty.
+        """
+
+    @abstractmethod
+    def __len__(self):
+        """The number of items in the index."""
+
+    def save(self):
+        if not self._dirty:
+            return
+        data = self._get_state()
+        data["pathname"] = self.pathname
+        try:
+            with open(self._store + ".tmp", "wb") as f:
+                pickle.dump(data, f, pickle.HIGHEST_PROTOCOL)
+            os.rename(self._store + ".tmp", self._store)
+        except (IOError, OSError) as e:
+            print("failed to save external playlist index:", e)
+        else:
+            self._dirty = False
+
+    def close(self):
+        """Save the index and stop watching for changes."""
+
+        for monitor in self._monitors.itervalues():
+            monitor.cancel()
+        self._monitors.clear()
+        self.save()
+
+    def _watch(self, key, pathname, directory):
+        if gio is None or key in self._monitors:
+            return
+        gfile = gio.File(pathname)
+        try:
+            if directory:
+                monitor = gfile.monitor_directory()
+            else:
+                monitor = gfile.monitor_file()
+        except gio.Error as e:
+            print("cannot watch", pathname, e)
+        else:
+            monitor.connect("changed", self._on_monitor_changed, key)
+            self._monitors[key] = monitor
+
+    def _unwatch(self, key):
+        monitor = self._monitors.pop(key, None)
+        if monitor is not None:
+            monitor.cancel()
+
+    @abstractmethod
+    def _on_monitor_changed(self, monitor, gfile, other, event, key):
+        """Handle a change reported by a monitor made with _watch."""
+
+    @abstractmethod
+    def _get_state(self):
+        """A dict of what save must write out."""
+
+
+class PlaylistIndex(ExternalIndex):
+    """Index of the entries of a playlist file.
+
+    Items are pathnames or dicts of literal playlist data. The playlist is
+    read again only when the file changes.
+    """
+
+    def __init__(self, pathname, store, saved=None):
+        ExternalIndex.__init__(self, pathname, store)
+        self._reread = None
+        if saved and saved.get("mtime") == self._mtime():
+            self._items = saved["items"]
+            self._cursor = saved["cursor"]
+            self._mtime_read = saved["mtime"]
+        else:
+            self._items = []
+            self._cursor = saved["cursor"] if saved else -1
+            self._read()
+        self._watch(None, pathname, False)
+
+    def next(self):
+        if not self._items:
+            return None
+        self._cursor += 1
+        if self._cursor >= len(self._items):
+            if gio is None and self._mtime() != self._mtime_read:
+                self._read()
+            self._cursor = 0
+        self._dirty = True
+        return self._items[self._cursor]
+
+    def __len__(self):
+        return len(self._items)
+
+    def _mtime(self):
+        try:
+            return os.stat(self.pathname).st_mtime
+        except OSError:
+            return None
+
+    def _read(self):
+        self._mtime_read = self._mtime()
+        items = []
+        ext = os.path.splitext(self.pathname)[1].lower()
+        try:
+            if ext in (".m3u", ".m3u8"):
+                items.extend(playlistio.read_m3u(self.pathname))
+            elif ext == ".pls":
+                items.extend(x for x in playlistio.read_pls(self.pathname)
+                                                        if os.path.isfile(x))
+            elif ext == ".xspf":
+                for kind, data in playlistio.read_xspf(self.pathname):
+                    if kind == "location":
+                        for url in data:
+                            if os.path.isfile(url[7:] if
+                                        url.startswith("file://") else url):
+                                items.append(url)
+                                break
+                    else:
+                        items.append(data)
+            else:
+                items.append(self.pathname)
+        except (IOError, playlistio.BadPlaylist) as e:
+            print("could not read playlist", self.pathname, e)
+
+        self._items = items
+        if self._cursor >= len(items):
+            self._cursor = -1
+        self._dirty = True
+
+    def _on_monitor_changed(self, monitor, gfile, other, event, key):
+        if event in (gio.FILE_MONITOR_EVENT_CHANGES_DONE_HINT,
+                                            gio.FILE_MONITOR_EVENT_CREATED):
+            if self._reread is not None:
+                source_remove(self._reread)
+            self._reread = timeout_add(SETTLE_TIME, self._on_settled)
+
+    def _on_settled(self):
+        self._reread = None
+        self._read()
+        self.save()
+
+    def _get_state(self):
+        return {"mtime": self._mtime_read, "items": self._items,
+                                                    "cursor": self._cursor}
+
+
+class DirectoryIndex(ExternalIndex):
+    """Index of the media files of a directory and its subdirectories.
+
+    The play order is the files of the top directory then those of each
+    subdirectory in turn, all sorted by name. Hidden subdirectories are
+    skipped.
+    """
+
+    def __init__(self, pathname, store, check_media, depth, saved=None):
+        ExternalIndex.__init__(self, os.path.realpath(pathname), store)
+        self._check_media = check_media
+        self._depth = depth
+        self._pending = set()
+        self._settle = None
+        self._dirs = {}  # reldir: (mtime, [filename, ...])
+        self._keys = []
+        if saved and saved.get("depth") == depth:
+            self._dirs = saved["dirs"]
+            self._cursor = saved["cursor"]
+        else:
+            self._cursor = None
+        # Catch up on changes made while the index was not in use.
+        self._refresh(set(self._dirs) | {""})
+        self._sort()
+        for reldir in self._dirs:
+            self._watch(reldir, self._abspath(reldir), True)
+
+    def next(self):
+        keys = self._keys
+        i = bisect.bisect_right(keys, self._cursor) if self._cursor else 0
+        if i >= len(keys):
+            if gio is None:
+                self._refresh(set(self._dirs) | {""}, check_mtime=True)
+                keys = self._keys
+            i = 0
+        if not keys:
+            return None
+        self._cursor = keys[i]
+        self._dirty = True
+        return self._abspath(keys[i][1], keys[i][2])
+
+    def __len__(self):
+        return len(self._keys)
+
+    def _abspath(self, reldir, filename=None):
+        parts = [self.pathname]
+        if reldir:
+            parts.append(reldir)
+        if filename:
+            parts.append(filename)
+        return "/".join(parts)
+
+    def _refresh(self, reldirs, check_mtime=True):
+        """Read again the directories that have changed."""
+
+        changed = False
+        for reldir in reldirs:
+            pathname = self._abspath(reldir)
+            try:
+                mtime = os.stat(pathname).st_mtime
+            except OSError:
+                if reldir in self._dirs:
+                    del self._dirs[reldir]
+                    self._unwatch(reldir)
+                    changed = True
+                continue
+
+            if check_mtime and reldir in self._dirs and \
+                                        self._dirs[reldir][0] == mtime:
+                continue
+
+            try:
+                names = os.listdir(pathname)
+            except OSError as e:
+                print(e)
+                continue
+
+            files = []
+            subdirs = set()
+            for name in names:
+                child = pathname + "/" + name
+                if os.path.isdir(child):
+                    if not reldir and self._depth > 1 and \
+                                                    not name.startswith("."):
+                        subdirs.add(name)
+                elif self._check_media(child):
+                    files.append(name)
+            files.sort()
+            self._dirs[reldir] = (mtime, files)
+            changed = True
+
+            if not reldir:
+                for subdir in set(x for x in self._dirs if x) - subdirs:
+                    del self._dirs[subdir]
+                    self._unwatch(subdir)
+                new = subdirs - set(self._dirs)
+                self._refresh(new, check_mtime=False)
+                for subdir in new:
+                    self._watch(subdir, self._abspath(subdir), True)
+
+        if changed:
+            self._sort()
+            self._dirty = True
+
+    def _sort(self):
+        """Put the files of all the directories in play order."""
+
+        self._keys = sorted((bool(reldir), reldir, filename) for reldir,
+                            (mtime, files) in self._dirs.iteritems()
+                            for filename in files)
+
+    def _on_monitor_changed(self, monitor, gfile, other, event, reldir):
+        if event in (gio.FILE_MONITOR_EVENT_CREATED,
+                                gio.FILE_MONITOR_EVENT_DELETED,
+                                gio.FILE_MONITOR_EVENT_MOVED,
+                                gio.FILE_MONITOR_EVENT_CHANGES_DONE_HINT):
+            self._pending.add(reldir)
+            if self._settle is not None:
+                source_remove(self._settle)
+            self._settle = timeout_add(SETTLE_TIME, self._on_settled)
+
+    def _on_settled(self):
+        self._settle = None
+        pending = self._pending
+        self._pending = set()
+        self._refresh(pending, check_mtime=False)
+        self.save()
+
+    def _get_state(self):
+        return {"depth": self._depth, "dirs": self._dirs,
+                                                    "cursor": self._cursor}
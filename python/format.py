@@ -17,6 +17,7 @@
 
 from __future__ import print_function
 
+import os
 import json
 import gettext
 import ctypes
@@ -25,7 +26,7 @@ from abc import ABCMeta, abstractmethod, abstractproperty
 import gtk
 import gobject
 
-from idjc import FGlobs
+from idjc import FGlobs, PGlobs
 from .gtkstuff import LEDDict
 from .tooltips import set_tip
 
@@ -75,11 +76,64 @@ class TestEncoder(object):
         
         return tuple()
 
+    @abstractproperty
+    def version(self):
+        """Identifies the encoder library build.
+
+        Probed encoder limits are saved under this name.
+        """
+
+        return str()
+
     @abstractmethod
     def test(self, channels, samplerate, bitrate):
         return bool()
 
 
+class ProbeCache(object):
+    """Encoder limits found by EncoderRange saved across runs.
+
+    There is one table per encoder library version which is shared by all
+    the format controls.
+    """
+
+    pathname = PGlobs.config_dir / "encoder-limits.json"
+
+    def __init__(self):
+        self._tables = None
+        self._used = set()
+        self._dirty = False
+
+    def table(self, version):
+        if self._tables is None:
+            try:
+                with open(self.pathname) as f:
+                    self._tables = json.load(f)
+            except (IOError, ValueError):
+                self._tables = {}
+        self._used.add(version)
+        return self._tables.setdefault(version, {})
+
+    def changed(self):
+        self._dirty = True
+
+    def save(self):
+        if not self._dirty:
+            return
+        try:
+            # Tables for library versions no longer in use are dropped.
+            with open(self.pathname + ".tmp", "w") as f:
+                json.dump(dict((k, v) for k, v in self._tables.iteritems()
+                                                    if k in self._used), f)
+            os.rename(self.pathname + ".tmp", self.pathname)
+        except (IOError, OSError) as e:
+            print("failed to save encoder limits:", e)
+        else:
+            self._dirty = False
+
+probe_cache = ProbeCache()
+
+
 class VorbisTestEncoder(TestEncoder):
     class _VORBIS_INFO(ctypes.Structure):
         _fields_ = [("version", ctypes.c_int), 
@@ -92,12 +146,21 @@ class VorbisTestEncoder(TestEncoder):
                     ("codec_setup", ctypes.c_void_p)]
 
 
-    _lv = ctypes.CDLL("libvorbis.so.0")
-    _lve = ctypes.CDLL("libvorbisenc.so.2")
+    # The libraries are loaded when first needed rather than at import.
+    _lv = _lve = None
 
     def __init__(self):
+        cls = type(self)
+        if cls._lv is None:
+            cls._lv = ctypes.CDLL("libvorbis.so.0")
+            cls._lve = ctypes.CDLL("libvorbisenc.so.2")
+            cls._lv.vorbis_version_string.restype = ctypes.c_char_p
         self._vi = self._VORBIS_INFO()
 
+    @property
+    def version(self):
+        return "vorbis " + self._lv.vorbis_version_string()
+
     @property
     def default_bitrate_stereo(self):
         return 128000
@@ -149,6 +212,27 @@ class EncoderRange(object):
         self._test = encoder.test
         self._working_bitrate = {1: encoder.default_bitrate_mono,
                                  2: encoder.default_bitrate_stereo}
+        self._limits = probe_cache.table(encoder.version)
+        self._depth = 0
+
+    def _cached(self, key, probe):
+        """Look up a probe result or else run the probe and save it."""
+
+        try:
+            return self._limits[key]
+        except KeyError:
+            pass
+
+        self._depth += 1
+        try:
+            value = probe()
+        finally:
+            self._depth -= 1
+        self._limits[key] = value
+        probe_cache.changed()
+        if not self._depth:
+            probe_cache.save()
+        return value
 
     def _boundary_search(self, variable_span, test):
         """Encoder working boundary value finder.
@@ -192,26 +276,30 @@ class EncoderRange(object):
     def lowest_bitrate(self, channels, samplerate):
         """Calculate the lowest working bitrate."""
 
-        return self._boundary_search([8000, 1000000],
-            lambda bitrate: self._test(channels, samplerate, bitrate))
+        return self._cached("lowest_bitrate %d %d" % (channels, samplerate),
+            lambda: self._boundary_search([8000, 1000000],
+            lambda bitrate: self._test(channels, samplerate, bitrate)))
 
     def highest_bitrate(self, channels, samplerate):
         """Calculate the highest working bitrate."""
 
-        return self._boundary_search([1000000, 8000],
-            lambda bitrate: self._test(channels, samplerate, bitrate))
+        return self._cached("highest_bitrate %d %d" % (channels, samplerate),
+            lambda: self._boundary_search([1000000, 8000],
+            lambda bitrate: self._test(channels, samplerate, bitrate)))
 
     def lowest_samplerate(self, channels, bitrate):
         """Calculate the lowest working samplerate."""
 
-        return self._boundary_search([4000, 200000],
-            lambda samplerate: self._test(channels, samplerate, bitrate))
+        return self._cached("lowest_samplerate %d %d" % (channels, bitrate),
+            lambda: self._boundary_search([4000, 200000],
+            lambda samplerate: self._test(channels, samplerate, bitrate)))
 
     def highest_samplerate(self, channels, bitrate):
         """Calculate the highest working samplerate."""
 
-        return self._boundary_search([200000, 4000],
-            lambda samplerate: self._test(channels, samplerate, bitrate))
+        return self._cached("highest_samplerate %d %d" % (channels, bitrate),
+            lambda: self._boundary_search([200000, 4000],
+            lambda samplerate: self._test(channels, samplerate, bitrate)))
 
     def bitrate_bounds(self, channels, samplerate):
         """Lowest and highest working bitrate as a 2 tuple."""
@@ -233,6 +321,11 @@ class EncoderRange(object):
         @channels: 1 for mono, 2 for stereo.
         """
         
+        return dict((k, tuple(v)) for k, v in self._cached(
+                    "bounds %d" % channels,
+                    lambda: self._converge(channels)).iteritems())
+
+    def _converge(self, channels):
         srb = self.samplerate_bounds(channels, self._working_bitrate[channels])
         oldbrb = brb = oldsrb = None, None
         
@@ -1439,3 +1532,45 @@ class FormatControl(gtk.VBox):
         self._back_button.set_sensitive(True)
         self._send("command=encoder_stop\n")
         return self._receive() != "failed"
+
+
+def _benchmark(repeat=6):
+    """Time FormatControl construction with and without cached limits.
+
+    Each control is restored to an Ogg Vorbis configuration as a saved
+    session would do.
+    """
+
+    import time
+    import tempfile
+    global probe_cache
+
+    settings = json.dumps({"family": "ogg", "codec": "vorbis",
+                "mode": "stereo", "samplerate": "44100", "bitrate": "128000",
+                "variability": "0", "metadata_mode": "utf-8",
+                "resample_quality": "medium"})
+
+    def construct():
+        t0 = time.time()
+        control = FormatControl(lambda s: None, lambda: "succeeded")
+        control.unmarshall(settings)
+        return time.time() - t0
+
+    fd, ProbeCache.pathname = tempfile.mkstemp(suffix=".json")
+    os.close(fd)
+    os.remove(ProbeCache.pathname)
+    try:
+        cold = construct()
+        warm = [construct() for i in range(repeat - 1)]
+        probe_cache = ProbeCache()
+        reload = construct()
+    finally:
+        os.remove(ProbeCache.pathname)
+
+    print("FormatControl construction: first %.3fs, then %.3fs average, "
+            "%.3fs loading limits from disk" % (cold,
+            sum(warm) / len(warm), reload))
+
+
+if __name__ == "__main__":
+    _benchmark()
@@ -19,7 +19,10 @@ from __future__ import print_function
 
 import os
 import json
+import time
 import gettext
+import threading
+import traceback
 from abc import ABCMeta, abstractmethod
 from functools import wraps
 from contextlib import contextmanager
@@ -184,6 +187,125 @@ class ErrorMessageDialog(StandardDialog):
         self.get_action_area().add(b)
 
 
+class CallbackStats(object):
+    """Opt-in timing of main loop callbacks.
+
+    Per callback name there are call counts, a histogram of run times,
+    the time spent waiting for the gdk lock, and a count of overruns. An
+    overrun is a timeout callback that took longer than its interval or
+    any other callback that took longer than overrun_time.
+    """
+
+    # Histogram bucket upper bounds in milliseconds. One more for the rest.
+    bounds = (1, 2, 5, 10, 20, 50, 100, 200, 500)
+    overrun_time = 0.05
+
+    def __init__(self):
+        self.enabled = False
+        self._entries = {}
+        self._report_source = None
+        self._context = threading.local()
+
+    def enable(self, report_interval=0):
+        """Start recording and print a report every report_interval seconds.
+
+        Zero means no periodic report.
+        """
+
+        self.enabled = True
+        if self._report_source is not None:
+            source_remove(self._report_source)
+            self._report_source = None
+        if report_interval:
+            self._report_source = timeout_add_seconds(report_interval,
+                                                            self._on_report)
+
+    def disable(self):
+        self.enabled = False
+        if self._report_source is not None:
+            source_remove(self._report_source)
+            self._report_source = None
+
+    def reset(self):
+        self._entries.clear()
+
+    def record(self, name, elapsed, lock_wait=0.0, interval=None):
+        try:
+            entry = self._entries[name]
+        except KeyError:
+            entry = self._entries[name] = {"calls": 0, "total": 0.0,
+                    "max": 0.0, "lock_wait": 0.0, "overruns": 0,
+                    "histogram": [0] * (len(self.bounds) + 1)}
+
+        entry["calls"] += 1
+        entry["total"] += elapsed
+        entry["lock_wait"] += lock_wait
+        if elapsed > entry["max"]:
+            entry["max"] = elapsed
+        if elapsed > (self.overrun_time if interval is None else interval):
+            entry["overruns"] += 1
+        ms = elapsed * 1000.0
+        for i, bound in enumerate(self.bounds):
+            if ms < bound:
+                break
+        else:
+            i = len(self.bounds)
+        entry["histogram"][i] += 1
+
+    def snapshot(self):
+        """A copy of the statistics keyed by callback name."""
+
+        return dict((k, dict(v, histogram=list(v["histogram"])))
+                                            for k, v in self._entries.iteritems())
+
+    def report(self, limit=20):
+        """A text table of the costliest callbacks."""
+
+        lines = ["%9s %8s %8s %9s %8s  %s" % ("total/ms", "calls", "max/ms",
+                                        "lock/ms", "overrun", "callback")]
+        for name, e in sorted(self._entries.iteritems(),
+                            key=lambda x: x[1]["total"], reverse=True)[:limit]:
+            lines.append("%9.1f %8d %8.1f %9.1f %8d  %s" % (e["total"] * 1000,
+                    e["calls"], e["max"] * 1000, e["lock_wait"] * 1000,
+                    e["overruns"], name))
+        return "\n".join(lines)
+
+    def _on_report(self):
+        print("callback statistics\n" + self.report())
+        return True
+
+    @contextmanager
+    def source_interval(self, interval):
+        """The interval of the timeout running a callback that times itself."""
+
+        self._context.interval = interval
+        try:
+            yield
+        finally:
+            self._context.interval = None
+
+    @property
+    def current_interval(self):
+        return getattr(self._context, "interval", None)
+
+    @staticmethod
+    def name_of(callback):
+        """A readable name for a callback function, method or partial."""
+
+        callback = getattr(callback, "func", callback)
+        func = getattr(callback, "im_func", callback)
+        name = getattr(func, "__name__", None)
+        if name is None:
+            return repr(callback)
+        self_ = getattr(callback, "im_self", None)
+        if self_ is not None:
+            cls = self_ if isinstance(self_, type) else type(self_)
+            name = cls.__name__ + "." + name
+        return "%s.%s" % (getattr(func, "__module__", "?"), name)
+
+callback_stats = CallbackStats()
+
+
 def threadslock(inner):
     """Function decorator to safely apply gtk/gdk thread lock to callbacks.
     
@@ -193,9 +315,17 @@ def threadslock(inner):
     Useful for callbacks that mainly manipulate gtk.
     """
     
+    name = "%s.%s" % (inner.__module__, inner.__name__)
+
     @wraps(inner)
     def wrapper(*args, **kwargs):
-        gtk.gdk.threads_enter()
+        if callback_stats.enabled:
+            t0 = time.time()
+            gtk.gdk.threads_enter()
+            t1 = time.time()
+        else:
+            gtk.gdk.threads_enter()
+            t1 = None
         try:
             if gtk.main_level():
                 return inner(*args, **kwargs)
@@ -204,7 +334,14 @@ def threadslock(inner):
                 print("callback cancelled")
                 return False
         finally:
+            if t1 is not None:
+                callback_stats.record(name, time.time() - t1, t1 - t0,
+                                            callback_stats.current_interval)
             gtk.gdk.threads_leave()
+    # Lets the source wrappers know the timing is done here.
+    wrapper.threadslocked = True
+    # For callers that already hold the lock.
+    wrapper.unlocked = inner
     return wrapper
 
 
@@ -726,33 +863,353 @@ class FolderChooserButton(gtk.Button):
 
 def _source_wrapper(data):
     if data[0]:
-        ret = data[1](*data[2], **data[3])
+        if not callback_stats.enabled:
+            ret = data[1](*data[2], **data[3])
+        elif getattr(getattr(data[1], "im_func", data[1]), "threadslocked",
+                                                                        False):
+            # Timed by threadslock which is told the interval.
+            with callback_stats.source_interval(data[5]):
+                ret = data[1](*data[2], **data[3])
+        else:
+            start = time.time()
+            ret = data[1](*data[2], **data[3])
+            callback_stats.record(CallbackStats.name_of(data[1]),
+                                            time.time() - start, 0.0, data[5])
         if ret:
             return ret
         data[0] = False
 
 
 def source_remove(data):
-    if data[0]:
+    if data[0] and data[4] is not None:
         glib.source_remove(data[4])
     data[0] = False
 
 
+# Source data: active, callback, args, kwargs, source id, interval/s.
+
 def timeout_add(interval, callback, *args, **kwargs):
-    data = [True, callback, args, kwargs]
-    data.append(glib.timeout_add(interval, _source_wrapper, data))
+    data = [True, callback, args, kwargs, None, interval / 1000.0]
+    data[4] = glib.timeout_add(interval, _source_wrapper, data)
     return data
 
 
 def timeout_add_seconds(interval, callback, *args, **kwargs):
-    data = [True, callback, args, kwargs]
-    data.append(glib.timeout_add_seconds(interval, _source_wrapper, data))
+    data = [True, callback, args, kwargs, None, float(interval)]
+    data[4] = glib.timeout_add_seconds(interval, _source_wrapper, data)
     return data
 
 
 def idle_add(callback, *args, **kwargs):
-    data = [True, callback, args, kwargs]
-    data.append(glib.idle_add(_source_wrapper, data))
+    data = [True, callback, args, kwargs, None, None]
+    data[4] = glib.idle_add(_source_wrapper, data)
     return data
 
 
+class FrameClock(object):
+    """Runs periodic user interface updates from a single timer.
+
+    Tasks are run on a common tick with the gdk lock taken just once per
+    tick. Task intervals are rounded up to a whole number of ticks but
+    overruns are judged against the interval asked for. Callbacks
+    decorated with threadslock have the lock stripped since it is already
+    held. As with timeout_add a task ends when its callback returns a
+    false value or the handle is passed to source_remove.
+    """
+
+    tick = 50  # milliseconds
+
+    def __init__(self):
+        self._tasks = []
+        self._source_id = None
+
+    def add(self, interval, callback, *args, **kwargs):
+        """Like timeout_add but for a task run on the frame clock."""
+
+        # As source data plus due time, interval asked for/s and throttle.
+        data = [True, self._unlocked(callback), args, kwargs, None, 0.0, 0.0,
+                                                                    0.0, None]
+        self.set_interval(data, interval)
+        data[6] = time.time() + data[5]
+        self._tasks.append(data)
+        if self._source_id is None:
+            self._source_id = glib.timeout_add(self.tick, self._on_tick)
+        return data
+
+    def set_interval(self, data, interval):
+        """Change the period of a task in milliseconds."""
+
+        ticks = max(1, -(-interval // self.tick))
+        data[5] = ticks * self.tick / 1000.0
+        data[7] = interval / 1000.0
+
+    def throttle(self, data, watch, hidden_interval):
+        """Slow a task to hidden_interval while watch reports hidden."""
+
+        interval = int(data[7] * 1000)
+
+        def on_change(visible):
+            self.set_interval(data, interval if visible else hidden_interval)
+            return data[0]
+
+        watch.connect_changed(on_change)
+        data[8] = (watch, on_change)
+        on_change(watch.visible)
+
+    @staticmethod
+    def _unlocked(callback):
+        func = getattr(callback, "im_func", callback)
+        inner = getattr(func, "unlocked", None)
+        if inner is None:
+            return callback
+        self_ = getattr(callback, "im_self", None)
+        if self_ is not None:
+            return inner.__get__(self_, type(self_))
+        return inner
+
+    def _on_tick(self):
+        stats = callback_stats.enabled
+        t0 = time.time()
+        alive = False
+        gtk.gdk.threads_enter()
+        try:
+            now = time.time()
+            if stats:
+                callback_stats.record("gtkstuff.FrameClock.tick", 0.0, now - t0)
+            if not gtk.main_level():
+                alive = True
+                return True
+
+            for data in self._tasks[:]:
+                if not data[0] or now < data[6] - 0.001:
+                    continue
+                # Drop missed ticks rather than run to catch up.
+                data[6] = max(data[6] + data[5], now + data[5] / 2.0)
+                start = time.time() if stats else None
+                try:
+                    if not data[1](*data[2], **data[3]):
+                        data[0] = False
+                except Exception:
+                    # Only the failed task ends, the tick carries on.
+                    traceback.print_exc()
+                    data[0] = False
+                if stats:
+                    callback_stats.record(CallbackStats.name_of(data[1]),
+                                        time.time() - start, 0.0, data[7])
+
+            for data in self._tasks:
+                if not data[0] and data[8] is not None:
+                    data[8][0].disconnect_changed(data[8][1])
+                    data[8] = None
+            self._tasks = [x for x in self._tasks if x[0]]
+            alive = bool(self._tasks)
+            return alive
+        finally:
+            if not alive:
+                # The source is gone so add must start another.
+                self._source_id = None
+            gtk.gdk.threads_leave()
+
+frame_clock = FrameClock()
+
+
+class VisibilityWatch(object):
+    """Tracks whether any of a set of top level windows can be seen.
+
+    Windows may be given directly or found by following the widgets they
+    hold, so widgets moved to another window stay watched.
+
+    A window counts as hidden when it is unmapped, minimised or fully
+    obscured. Focus is not considered since unfocused meters are still
+    being watched.
+    """
+
+    def __init__(self, *windows):
+        self._listeners = []
+        self._hidden = {}
+        for window in windows:
+            self.add_window(window)
+
+    def add_window(self, window):
+        if window in self._hidden:
+            return
+        window.add_events(gtk.gdk.VISIBILITY_NOTIFY_MASK)
+        was = self.visible
+        self._hidden[window] = {"unmapped": not window.get_mapped()}
+        window.connect("map-event", self._on_map, False)
+        window.connect("unmap-event", self._on_map, True)
+        window.connect("window-state-event", self._on_window_state)
+        window.connect("visibility-notify-event", self._on_visibility)
+        self._notify(was)
+
+    def follow(self, widget):
+        """Also watch whichever top level window widget is placed in."""
+
+        def on_hierarchy_changed(widget, previous_toplevel):
+            toplevel = widget.get_toplevel()
+            if toplevel.flags() & gtk.TOPLEVEL:
+                self.add_window(toplevel)
+
+        widget.connect("hierarchy-changed", on_hierarchy_changed)
+        on_hierarchy_changed(widget, None)
+
+    @property
+    def visible(self):
+        return any(not any(x.itervalues()) for x in self._hidden.itervalues())
+
+    def connect_changed(self, func):
+        """Call func(visible) on changes until it returns a false value."""
+
+        self._listeners.append(func)
+
+    def disconnect_changed(self, func):
+        try:
+            self._listeners.remove(func)
+        except ValueError:
+            pass
+
+    def _notify(self, was):
+        now = self.visible
+        if now != was:
+            self._listeners = [f for f in self._listeners if f(now)]
+
+    def _set(self, window, reason, hidden):
+        was = self.visible
+        self._hidden[window][reason] = hidden
+        self._notify(was)
+
+    def _on_map(self, window, event, hidden):
+        self._set(window, "unmapped", hidden)
+
+    def _on_window_state(self, window, event):
+        self._set(window, "iconified", bool(event.new_window_state &
+                        (gtk.gdk.WINDOW_STATE_ICONIFIED |
+                        gtk.gdk.WINDOW_STATE_WITHDRAWN)))
+
+    def _on_visibility(self, window, event):
+        self._set(window, "obscured",
+                    event.state == gtk.gdk.VISIBILITY_FULLY_OBSCURED)
+
+
+class WaveformOverview(gtk.DrawingArea):
+    """A track waveform which lines up with and drives a horizontal scale.
+
+    The overview is a byte string of bins of three bytes: the minimum and
+    maximum sample values offset by 128 and the RMS level. The part of
+    the track already played is drawn in the selection colour. Pointer
+    presses and drags set the adjustment the way the scale itself would.
+    """
+
+    def __init__(self, scale):
+        gtk.DrawingArea.__init__(self)
+        self._scale = scale
+        self._adj = scale.get_adjustment()
+        self._overview = None
+        self._pixmap = None
+        self._played_x = None
+        self.set_size_request(-1, 24)
+        self.add_events(gtk.gdk.BUTTON_PRESS_MASK |
+                        gtk.gdk.BUTTON_RELEASE_MASK |
+                        gtk.gdk.BUTTON1_MOTION_MASK)
+        self.connect("expose-event", self._on_expose)
+        self.connect("size-allocate", self._on_size_allocate)
+        self.connect("style-set", self._on_size_allocate)
+        self.connect("button-press-event", self._on_pointer)
+        self.connect("motion-notify-event", self._on_pointer)
+        self._adj.connect("value-changed", self._on_value_changed)
+        self._adj.connect("changed", self._on_value_changed)
+
+    def set_overview(self, overview):
+        """Show a new overview or none at all."""
+
+        if overview != self._overview:
+            self._overview = overview
+            self._pixmap = None
+            self.queue_draw()
+
+    def _extent(self):
+        """The x offset and width of the range of the scale."""
+
+        width = self.allocation.width
+        inset = self._scale.style_get_property("slider-length") // 2 + \
+                self._scale.style_get_property("trough-border")
+        if self._scale.flags() & gtk.CAN_FOCUS:
+            inset += self._scale.style_get_property("focus-line-width") + \
+                    self._scale.style_get_property("focus-padding")
+        return inset, max(1, width - 2 * inset)
+
+    def _position(self):
+        adj = self._adj
+        span = adj.upper - adj.lower
+        if span <= 0:
+            return 0.0
+        return (adj.value - adj.lower) / span
+
+    def _on_size_allocate(self, *args):
+        self._pixmap = None
+
+    def _on_value_changed(self, adj):
+        if self._overview and self.flags() & gtk.MAPPED:
+            x0, width = self._extent()
+            x = int(self._position() * width)
+            if x != self._played_x:
+                self.queue_draw()
+
+    def _on_pointer(self, widget, event):
+        if event.type == gtk.gdk.BUTTON_PRESS and event.button != 1:
+            return False
+        x0, width = self._extent()
+        adj = self._adj
+        frac = min(1.0, max(0.0, (event.x - x0) / width))
+        adj.set_value(adj.lower + frac * (adj.upper - adj.lower))
+        return False
+
+    def _render(self, width, height):
+        """Draw the played and unplayed waveforms one above the other."""
+
+        pixmap = gtk.gdk.Pixmap(self.window, width, height * 2)
+        cr = pixmap.cairo_create()
+        style = self.style
+        cr.set_source_color(style.bg[gtk.STATE_NORMAL])
+        cr.paint()
+
+        data = [ord(x) for x in self._overview]
+        bins = len(data) // 3
+        x0, span = self._extent()
+        mid = height / 2.0
+        for y0, peak, rms in ((0, style.mid[gtk.STATE_NORMAL],
+                                            style.dark[gtk.STATE_NORMAL]),
+                            (height, style.bg[gtk.STATE_SELECTED],
+                                            style.dark[gtk.STATE_SELECTED])):
+            for colour, index in ((peak, 0), (rms, 2)):
+                cr.set_source_color(colour)
+                for x in xrange(span):
+                    i = x * bins // span * 3
+                    if index:
+                        top = data[i + 2] * mid / 255.0
+                        bottom = -top
+                    else:
+                        top = (data[i + 1] - 128) * mid / 127.5
+                        bottom = (data[i] - 128) * mid / 127.5
+                    cr.rectangle(x0 + x, y0 + mid - top, 1,
+                                                max(1.0, top - bottom))
+                cr.fill()
+        return pixmap
+
+    def _on_expose(self, widget, event):
+        width, height = self.allocation.width, self.allocation.height
+        if not self._overview:
+            self._played_x = None
+            return True
+
+        if self._pixmap is None:
+            self._pixmap = self._render(width, height)
+        x0, span = self._extent()
+        self._played_x = int(self._position() * span)
+        split = x0 + self._played_x
+        gc = self.style.bg_gc[gtk.STATE_NORMAL]
+        self.window.draw_drawable(gc, self._pixmap, 0, height, 0, 0,
+                                                            split, height)
+        self.window.draw_drawable(gc, self._pixmap, split, 0, split, 0,
+                                                    width - split, height)
+        return True
@@ -24,25 +24,28 @@ import re
 import json
 import time
 import sys
+import heapq
+import socket
 import threading
 import traceback
 import gettext
 from inspect import getargspec
 from functools import wraps, partial
+from collections import deque
+from itertools import count
 
 import gobject
 import gtk
 import pango
 
-try:
-    from irc import client
-    from irc import events
-except ImportError:
-    traceback.print_exc()
+from .utils import LazyModule
+
+# The irc library is only imported once a server connection is wanted.
+client = LazyModule("irc.client")
+events = LazyModule("irc.events")
+HAVE_IRC = client.available
+if not HAVE_IRC:
     print("No IRC support")
-    HAVE_IRC = False
-else:
-    HAVE_IRC = True
 
 from idjc import FGlobs
 from idjc.prelims import ProfileManager
@@ -996,6 +999,19 @@ class IRCPane(gtk.VBox):
 
         store.append((path, list(row)))
 
+    @staticmethod
+    def has_active_servers(data):
+        """Whether marshalled data includes an enabled server."""
+
+        if not HAVE_IRC:
+            return False
+        try:
+            store = json.loads(data)
+        except ValueError:
+            return False
+        return any(len(path) == 1 and row[0] == 1 and row[1]
+                                                    for path, row in store[1:])
+
     def unmarshall(self, data):
         """Set the TreeStore with data from a string."""
         
@@ -1224,26 +1240,157 @@ class ConnectionsController(list):
             i = model.iter_next(i)
 
 
-class IRCConnection(gtk.TreeRowReference, threading.Thread):
+class TokenBucket(object):
+    """Flood control allowing bursts of up to burst messages.
+
+    Thereafter messages are permitted at rate per second.
+    """
+
+    def __init__(self, rate, burst):
+        self._rate = rate
+        self._burst = burst
+        self._tokens = float(burst)
+        self._stamp = time.time()
+
+    def take(self, now):
+        """Seconds to wait or 0.0 having taken a token."""
+
+        self._tokens = min(self._burst,
+                            self._tokens + (now - self._stamp) * self._rate)
+        self._stamp = now
+        if self._tokens >= 1.0:
+            self._tokens -= 1.0
+            return 0.0
+        return (1.0 - self._tokens) / self._rate
+
+
+class IRCReactor(threading.Thread):
+    """The one thread that runs all the IRC server connections.
+
+    Work from the user interface is passed in with call. Timed work is
+    kept in a heap in due order. Each connection has a send queue that is
+    drained subject to its flood control.
+    """
+
+    _lock = threading.Lock()
+    _instance = None
+    _users = 0
+
+    @classmethod
+    def acquire(cls):
+        """The running reactor which is started as needed."""
+
+        with cls._lock:
+            if cls._instance is None:
+                cls._instance = cls()
+                cls._instance.start()
+            cls._users += 1
+            return cls._instance
+
+    def release(self):
+        with self._lock:
+            type(self)._users -= 1
+            if self._users:
+                return
+            type(self)._instance = None
+        self.call(self._stop)
+        self.join(1.0)
+
+    def __init__(self):
+        threading.Thread.__init__(self)
+        self.daemon = True
+        self._keepalive = True
+        self._calls = deque()
+        self._heap = []
+        self._seq = count()
+        self._connections = {}  # ServerConnection: IRCConnection
+        try:
+            self.reactor = client.Reactor()
+        except AttributeError:
+            self.reactor = client.IRC()  # Old API compatibility
+        for event in events.all:
+            self.reactor.add_global_handler(event, self._dispatch)
+
+    def server(self, owner):
+        """A new server connection whose events go to owner."""
+
+        server = self.reactor.server()
+        self._connections[server] = owner
+        return server
+
+    def forget(self, server):
+        self._connections.pop(server, None)
+
+    def call(self, func, *args):
+        """Have func run on the reactor thread. Callable from any thread."""
+
+        self._calls.append(partial(func, *args))
+
+    def call_later(self, delay, func, *args):
+        """Schedule func. Only for use on the reactor thread."""
+
+        heapq.heappush(self._heap, (time.time() + delay, next(self._seq),
+                                                        partial(func, *args)))
+
+    def _stop(self):
+        self._keepalive = False
+
+    @staticmethod
+    def _run_safely(func, *args):
+        # An exception must not take down every connection.
+        try:
+            func(*args)
+        except Exception:
+            traceback.print_exc()
+
+    def _dispatch(self, server, event):
+        owner = self._connections.get(server)
+        if owner is not None:
+            target = getattr(owner, "_on_" + event.type,
+                                                    owner._generic_handler)
+            self._run_safely(target, server, event)
+
+    def run(self):
+        calls = self._calls
+        heap = self._heap
+        while self._keepalive:
+            while calls:
+                self._run_safely(calls.popleft())
+
+            now = time.time()
+            while heap and heap[0][0] <= now:
+                self._run_safely(heapq.heappop(heap)[2])
+
+            timeout = 0.2
+            if heap:
+                timeout = min(timeout, heap[0][0] - now)
+            for owner in self._connections.values():
+                wait = owner._flush_sends(now)
+                if wait:
+                    timeout = min(timeout, wait)
+
+            self.reactor.process_once(max(timeout, 0.0))
+
+
+class IRCConnection(gtk.TreeRowReference):
     """Self explanatory really."""
+
+    # Flood control: a burst of messages then one every two seconds.
+    flood_burst = 5
+    flood_rate = 0.5
     
     def __init__(self, model, path, stream_active):
         gtk.TreeRowReference.__init__(self, model, path)
-        threading.Thread.__init__(self)
         self._hooks = []
-        self._queue = []
         self._played = []
         self._message_handlers = []
-        self._keepalive = True
         self._have_welcome = False
         self._stream_active = stream_active
-        try:
-            self.reactor = client.Reactor()
-        except AttributeError:
-            self.reactor = client.IRC()  # Old API compatibility
-            
-        self.server = self.reactor.server()
-        self.start()
+        self._sendq = deque()
+        self._bucket = TokenBucket(self.flood_rate, self.flood_burst)
+        self._attempt = None
+        self._reactor = IRCReactor.acquire()
+        self.server = self._reactor.server(self)
         self._hooks.append((model, model.connect("row-inserted",
                                                         self._on_row_inserted)))
         self._hooks.append((model, model.connect_after("row-changed",
@@ -1272,6 +1419,25 @@ class IRCConnection(gtk.TreeRowReference, threading.Thread):
             mh.connect("privmsg-ready", self._on_privmsg_ready)
             self._message_handlers.append(mh)
 
+    def _send(self, func, *args):
+        """Queue a message for sending subject to flood control."""
+
+        self._sendq.append((func, args))
+
+    def _flush_sends(self, now):
+        """Called by the reactor. Returns any wait for flood control."""
+
+        while self._sendq:
+            wait = self._bucket.take(now)
+            if wait:
+                return wait
+            func, args = self._sendq.popleft()
+            try:
+                func(*args)
+            except client.ServerConnectionError as e:
+                print(e)
+        return None
+
     def _on_channels_changed(self, message_handler, channel_set):
         if self._have_welcome:
             rest = frozenset.union(frozenset(), *(x.props.channels
@@ -1291,13 +1457,13 @@ class IRCConnection(gtk.TreeRowReference, threading.Thread):
                         except ValueError:
                             channel = each[0]
                             key = ""
-                        self.server.join(channel, key)
+                        self._send(self.server.join, channel, key)
                     
                 for each in parts:
                     if each[0] in "#&":
-                        self.server.part(each)
+                        self._send(self.server.part, each)
             
-            self._queue.append(deferred)
+            self._reactor.call(deferred)
 
     def _channels_invalidate(self):
         for each in self._message_handlers:
@@ -1309,15 +1475,15 @@ class IRCConnection(gtk.TreeRowReference, threading.Thread):
             user_targets = [x for x in targets if x[0] not in "#&"]
 
             def deferred():
-                self.server.privmsg_many(chan_targets, message)
+                if chan_targets:
+                    self._send(self.server.privmsg_many, chan_targets, message)
                 for target in user_targets:
-                    self.server.notice(target, message)
+                    self._send(self.server.notice, target, message)
 
             if delay:
-                self._queue.append(
-                        lambda: self.server.execute_delayed(delay, deferred))
+                self._reactor.call(self._reactor.call_later, delay, deferred)
             else:
-                self._queue.append(deferred)
+                self._reactor.call(deferred)
 
     def _on_ui_row_changed(self, model, path, iter):
         if path == self.get_path():
@@ -1336,63 +1502,87 @@ class IRCConnection(gtk.TreeRowReference, threading.Thread):
                             row.nick2, row.nick3, nickname + "_",
                             row.nick2 + "_", row.nick3 + "_", nickname + "__",
                             row.nick2 + "__", row.nick3 + "__"]
+                    self._attempt = attempt = object()
                             
                     connect = partial(self.server.connect, hostname, port,
                                         nickname, password, username, ircname)
-                                        
-                    def try_connect(*delays):
+                    # Old versions of the irc library cannot take a socket.
+                    handover = "connect_factory" in \
+                                        getargspec(self.server.connect).args
+
+                    def wanted():
                         model = ref.get_model()
                         path = ref.get_path()
-                        if not ref.valid() or not model.path_is_active(path):
+                        return self._attempt is attempt and ref.valid() and \
+                                                model.path_is_active(path)
+
+                    def try_connect(*delays):
+                        if not wanted():
                             print("IRC connection attempt cancelled")
                             return
 
                         print("Attempting to connect IRC %s:%d" % 
                               (hostname, port))
+                        if handover:
+                            t = threading.Thread(target=open_socket,
+                                                                args=delays)
+                            t.daemon = True
+                            t.start()
+                        else:
+                            log_on(None, *delays)
+
+                    def open_socket(*delays):
+                        # Name lookup and connect must not stall the reactor.
                         try:
-                            connect()
-                        except client.ServerConnectionError as e:
-                            print(e)
-                            try:
-                                delay = delays[0]
-                            except IndexError:
-                                print("No more connection attempts")
-                                self._ui_set_nick("")
+                            sock = socket.create_connection((hostname, port))
+                        except socket.error as e:
+                            self._reactor.call(retry, e, *delays)
+                        else:
+                            self._reactor.call(log_on, sock, *delays)
+
+                    def log_on(sock, *delays):
+                        if not wanted():
+                            print("IRC connection attempt cancelled")
+                            if sock is not None:
+                                sock.close()
+                            return
+
+                        try:
+                            if sock is None:
+                                connect()
                             else:
-                                print("%d more tries" % len(delays))
-                                self.server.execute_delayed(delay, try_connect,
-                                                                    delays[1:])
+                                connect(connect_factory=lambda addr: sock)
+                        except client.ServerConnectionError as e:
+                            retry(e, *delays)
                         else:
                             self._ui_set_nick(nickname)
                             print("New IRC connection: %s@%s:%d" %
                                   (nickname, hostname, port))
+
+                    def retry(e, *delays):
+                        print(e)
+                        try:
+                            delay = delays[0]
+                        except IndexError:
+                            print("No more connection attempts")
+                            self._ui_set_nick("")
+                        else:
+                            print("%d more tries" % len(delays))
+                            self._reactor.call_later(delay, try_connect,
+                                                                *delays[1:])
                                                     
                     try_connect(1, 2, 3)
             else:
                 def deferred():
+                    self._attempt = None
+                    self._sendq.clear()
                     try:
                         self.server.disconnect()
                     except client.ServerConnectionError as e:
                         print(str(e), file=sys.stderr)
                     self._ui_set_nick("")
 
-            self._queue.append(deferred)
-
-    def run(self):
-        for event in events.all:
-            try:
-                target = getattr(self, "_on_" + event)
-            except AttributeError:
-                target = self._generic_handler
-            self.server.add_global_handler(event, target)
-                
-        while self._keepalive:
-            while len(self._queue):
-                self._queue.pop(0)()
-            
-            self.reactor.process_once(0.2)
-        
-        self.reactor.process_once()
+            self._reactor.call(deferred)
 
     def cleanup(self):
         for each in self._message_handlers:
@@ -1400,23 +1590,19 @@ class IRCConnection(gtk.TreeRowReference, threading.Thread):
         for obj, handler_id in self._hooks:
             obj.disconnect(handler_id)
 
-        if self.server.is_connected():
-            def deferred():
-                self.server.add_global_handler("disconnect", self.end_thread)
+        def deferred():
+            self._attempt = None
+            self._sendq.clear()
+            if self.server.is_connected():
                 try:
                     self.server.disconnect()
                 except client.ServerConnectionError as e:
                     print(str(e), file=sys.stderr)
                 self._ui_set_nick("")
+            self._reactor.forget(self.server)
 
-            self._queue.append(deferred)
-        else:
-            self._keepalive = False
-        
-        self.join(1.0)
-
-    def end_thread(self, server, event):
-        self._keepalive = False
+        self._reactor.call(deferred)
+        self._reactor.release()
 
     @threadslock
     def _ui_set_nick(self, nickname):
@@ -1466,7 +1652,7 @@ class IRCConnection(gtk.TreeRowReference, threading.Thread):
                                 "NickServ", "RELEASE %s %s" % (target, nspw))),
                 (server.nick, (target,))), start=1):
 
-            server.execute_delayed(i, func, args)
+            self._reactor.call_later(i, func, *args)
 
     def _on_privnotice(self, server, event):
         source = event.source
@@ -1496,6 +1682,7 @@ class IRCConnection(gtk.TreeRowReference, threading.Thread):
 
     def _on_disconnect(self, server, event):
         self._have_welcome = False
+        self._sendq.clear()
         self._ui_set_nick("")
         print(event.source, "disconnected")
 
@@ -1517,7 +1704,7 @@ class IRCConnection(gtk.TreeRowReference, threading.Thread):
     def _on_ctcp(self, server, event):
         source = event.source.split("!")[0]
         args = event.arguments
-        reply = partial(server.ctcp_reply, source)
+        reply = partial(self._send, server.ctcp_reply, source)
         
         if args == ["CLIENTINFO"]:
             reply("CLIENTINFO VERSION TIME SOURCE PING ACTION CLIENTINFO "
@@ -1540,19 +1727,18 @@ class IRCConnection(gtk.TreeRowReference, threading.Thread):
             with gdklock():
                 show = [x for x in self._played if t - x[1] < 5400.0]
 
-            for i, each in enumerate(show, start=1):
+            for each in show:
                 age = int((t - each[1]) // 60)
                 if age == 1:
                     message = "PLAYED \x0304%s\x0f, \x0306%d minute ago\x0f."
                 else:
                     message = "PLAYED \x0304%s\x0f, \x0306%d minutes ago\x0f."
-                server.execute_delayed(i, reply, (message %
-                                                        (each[0], age),))
+                reply(message % (each[0], age))
 
             if not show:
                 reply("PLAYED Nothing recent to report.")
             else:
-                server.execute_delayed(i + 1, reply, ("PLAYED End of list.",))
+                reply("PLAYED End of list.")
                 
         elif args == ["STREAMSTATUS"]:
             reply("STREAMSTATUS The stream is %s." % (
@@ -1579,6 +1765,59 @@ class IRCConnection(gtk.TreeRowReference, threading.Thread):
         print("Args:", event.arguments())
 
 
+class MessageTemplate(object):
+    """A message with substitution tokens compiled for fast formatting.
+
+    Tokens are %r %t %l %s %n %d %u %U and %% for a literal %. Substituted
+    values are never themselves scanned for tokens.
+    """
+
+    _cache = {}
+
+    @classmethod
+    def get(cls, text):
+        """A shared compiled template for text."""
+
+        try:
+            return cls._cache[text]
+        except KeyError:
+            if len(cls._cache) > 256:
+                cls._cache.clear()
+            template = cls._cache[text] = cls(text)
+            return template
+
+    def __init__(self, text):
+        lookup = dict(zip(MessageHandler.subst_tokens,
+                                                MessageHandler.subst_keys))
+        lookup["%%"] = None
+        self._literals = literals = []
+        self._keys = keys = []
+        literal = []
+        pos = 0
+        for match in re.finditer("%.", text, re.DOTALL):
+            token = match.group()
+            if token not in lookup:
+                continue
+            literal.append(text[pos:match.start()])
+            pos = match.end()
+            if lookup[token] is None:
+                literal.append("%")
+            else:
+                literals.append("".join(literal))
+                keys.append(lookup[token])
+                literal = []
+        literal.append(text[pos:])
+        literals.append("".join(literal))
+
+    def __call__(self, subst):
+        literals = self._literals
+        parts = [literals[0]]
+        for literal, key in zip(literals[1:], self._keys):
+            parts.append(subst[key])
+            parts.append(literal)
+        return "".join(parts)
+
+
 class MessageHandler(gobject.GObject):
     __gsignals__ = { 
         'channels-changed': (gobject.SIGNAL_RUN_LAST | gobject.SIGNAL_ACTION,
@@ -1612,6 +1851,10 @@ class MessageHandler(gobject.GObject):
 
         self._channels = frozenset()
         self._stream_active = stream_active
+        self._rows = None
+        model.connect("row-inserted", self._rows_invalidate)
+        model.connect("row-deleted", self._rows_invalidate)
+        model.connect_after("row-changed", self._on_row_changed)
         model.connect("row-inserted", self.channels_evaluate)
         model.connect("row-deleted", self.channels_evaluate)
         model.connect_after("row-changed", self.channels_evaluate)
@@ -1642,6 +1885,49 @@ class MessageHandler(gobject.GObject):
         self.subst.update(new_meta)
         self.on_new_metadata()
         
+    def _rows_invalidate(self, *args):
+        # Paths may have shifted so any insertion or deletion counts.
+        self._rows = None
+
+    def _on_row_changed(self, model, path, iter):
+        if self.row_affects(path):
+            self._rows = None
+
+    def row_affects(self, path):
+        """Whether an edit of path can change which rows are active.
+
+        That is any of the message rows or the active flag of this row
+        and those above it.
+        """
+
+        pp = self.tree_row_ref.get_path()
+        return pp is not None and (path[:-1] == pp or pp[:len(path)] == path)
+
+    def active_rows(self):
+        """Cached list of (path, targets, template) for active rows.
+
+        The template is None for rows that carry no message.
+        """
+
+        if self._rows is None:
+            rows = []
+            model = self.tree_row_ref.get_model()
+            iter = model.iter_children(model.get_iter(
+                                                self.tree_row_ref.get_path()))
+            while iter is not None:
+                path = model.get_path(iter)
+                if model.path_is_active(path):
+                    row = model[path]
+                    targets = [x.split("!")[0] for x in row.channels.split(",")]
+                    if "message" in IRCRowReference._lookup[row.type]:
+                        template = MessageTemplate.get(row.message)
+                    else:
+                        template = None
+                    rows.append((path, targets, template))
+                iter = model.iter_next(iter)
+            self._rows = rows
+        return self._rows
+
     def channels_evaluate(self, model, path, iter=None):
         pp = self.tree_row_ref.get_path()
         if path[:-1] == pp:
@@ -1683,24 +1969,13 @@ class MessageHandler(gobject.GObject):
 
     def issue_messages(self, delay_calc=lambda row: 0, forced_message=None):
         model = self.tree_row_ref.get_model()
-        iter = model.get_iter(self.tree_row_ref.get_path())
-        iter = model.iter_children(iter)
-        while iter is not None:
-            path = model.get_path(iter)
-            if model.path_is_active(path):
-                row = model[path]
-                delay_s = delay_calc(row)
-                if delay_s is not None:
-                    targets = [x.split("!")[0] for x in row.channels.split(",")]
-                    table = [("%%", "%")] + zip(self.subst_tokens, (
-                                        self.subst[x] for x in self.subst_keys))
-                    if forced_message is not None:
-                        message = string_multireplace(forced_message, table)
-                    else:
-                        message = string_multireplace(row.message, table)
-                    self.emit("privmsg-ready", targets, message, delay_s)
-          
-            iter = model.iter_next(iter)
+        if forced_message is not None:
+            forced_message = MessageTemplate.get(forced_message)
+        for path, targets, template in self.active_rows():
+            delay_s = delay_calc(model[path])
+            if delay_s is not None:
+                message = (forced_message or template)(self.subst)
+                self.emit("privmsg-ready", targets, message, delay_s)
 
 
 class MessageHandlerForType_3(MessageHandler):
@@ -1709,38 +1984,130 @@ class MessageHandlerForType_3(MessageHandler):
             self.issue_messages(lambda row: row.delay)
 
 
-class MessageHandlerForType_5(MessageHandler):
-    def __init__(self, *args, **kwargs):
+class TimerScheduler(object):
+    """Runs the timed messages of all the IRC connections.
+
+    Due times are kept in a heap and a single timeout is armed for the
+    earliest of them. Rescheduling a handler invalidates its earlier entry.
+    """
+
+    def __init__(self):
+        self._heap = []
+        self._current = {}  # handler: sequence number
+        self._seq = count()
         self._timeout_id = None
-        MessageHandler.__init__(self, *args, **kwargs)
+        self._armed_for = None
+
+    def schedule(self, handler, due):
+        seq = next(self._seq)
+        self._current[handler] = seq
+        heapq.heappush(self._heap, (due, seq, handler))
+        if len(self._heap) > 2 * len(self._current) + 16:
+            self._heap = [x for x in self._heap
+                                        if self._current.get(x[2]) == x[1]]
+            heapq.heapify(self._heap)
+        self._arm()
+
+    def cancel(self, handler):
+        if self._current.pop(handler, None) is not None:
+            self._arm()
+
+    def _arm(self):
+        heap = self._heap
+        while heap and self._current.get(heap[0][2]) != heap[0][1]:
+            heapq.heappop(heap)
+        due = heap[0][0] if heap else None
+        if due == self._armed_for:
+            return
+        if self._timeout_id is not None:
+            source_remove(self._timeout_id)
+            self._timeout_id = None
+        self._armed_for = due
+        if due is not None:
+            delay = max(0, int((due - time.time()) * 1000) + 1)
+            self._timeout_id = timeout_add(delay, self._on_timeout)
+
+    @threadslock
+    def _on_timeout(self):
+        self._timeout_id = None
+        self._armed_for = None
+        now = time.time()
+        heap = self._heap
+        while heap and heap[0][0] <= now:
+            due, seq, handler = heapq.heappop(heap)
+            if self._current.get(handler) == seq:
+                del self._current[handler]
+                handler.on_timer()
+        self._arm()
+        return False
+
+timer_scheduler = TimerScheduler()
+
+
+class MessageHandlerForType_5(MessageHandler):
+    def __init__(self, model, path, stream_active):
+        MessageHandler.__init__(self, model, path, stream_active)
+        model.connect_after("row-inserted", self._on_row_edited)
+        model.connect_after("row-changed", self._on_row_edited)
         if self.stream_active:
             self.on_stream_active()
 
     def on_stream_active(self):
-        self._timeout_id = timeout_add(500, self._timeout)
+        self._reschedule()
 
     def on_stream_inactive(self):
-        if self._timeout_id is not None:
-            source_remove(self._timeout_id)
-            self._timeout_id = None
+        timer_scheduler.cancel(self)
 
-    @threadslock
-    def _timeout(self):
+    def on_timer(self):
         self.issue_messages(partial(self._delay_calc,
                                                 the_time=int(time.time())))
-        return True
+        self._reschedule()
+
+    def _on_row_edited(self, model, path, iter):
+        if self.stream_active and self.row_affects(path):
+            self._reschedule()
+
+    def _reschedule(self):
+        """Schedule for when the next timer row becomes due."""
+
+        model = self.tree_row_ref.get_model()
+        path = self.tree_row_ref.get_path()
+        if path is None:
+            timer_scheduler.cancel(self)
+            return
+
+        now = int(time.time())
+        due = None
+        for rowpath, targets, template in self.active_rows():
+            row = model[rowpath]
+            interval = max(row.interval, 1)
+            last = int(row.issue or 0)
+            if (now - row.offset) // interval > last:
+                row_due = now
+            else:
+                row_due = row.offset + (last + 1) * interval
+            if due is None or row_due < due:
+                due = row_due
+
+        if due is None:
+            timer_scheduler.cancel(self)
+        else:
+            timer_scheduler.schedule(self, due)
         
     def _delay_calc(self, row, the_time):
         """Returns either a delay of 0 or suppression value None."""
         
         issue = (the_time - row.offset) // row.interval
         if issue > int(row.issue or 0):
+            # Bookkeeping only so the active row cache stays valid.
+            model = self.tree_row_ref.get_model()
+            model.row_changed_block()
             row.issue = str(issue)
+            model.row_changed_unblock()
             return 0
             
     def cleanup(self):
-        if self._timeout_id is not None:
-            source_remove(self._timeout_id)
+        timer_scheduler.cancel(self)
 
 
 class MessageHandlerForType_7(MessageHandler):
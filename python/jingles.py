@@ -35,7 +35,7 @@ from .gtkstuff import LEDDict
 from .gtkstuff import WindowSizeTracker
 from .gtkstuff import DefaultEntry
 from .gtkstuff import threadslock
-from .gtkstuff import timeout_add, source_remove
+from .gtkstuff import idle_add, source_remove, frame_clock
 from .tooltips import set_tip
 from .utils import LinkUUIDRegistry
 
@@ -72,6 +72,7 @@ class Effect(gtk.HBox):
         self.pathname = None
         self.uuid = str(uuid.uuid4())
         self._repeat_works = False
+        self._preload_source_id = None
             
         gtk.HBox.__init__(self)
         self.set_border_width(2)
@@ -224,8 +225,10 @@ class Effect(gtk.HBox):
                 if self.effect_length == 0.0:
                     self.effect_length = self.interlude.get_media_metadata(self.pathname, True)
                 self.effect_start = time.time()
-                self.timeout_source_id = timeout_add(playergui.PROGRESS_TIMEOUT,
-                                self._progress_timeout)
+                self.timeout_source_id = frame_clock.add(
+                        playergui.PROGRESS_TIMEOUT, self._progress_timeout)
+                frame_clock.throttle(self.timeout_source_id,
+                                        self.approot.window_visibility, 1000)
                 self.tabeffectname.set_text(self.trigger_label.get_text())
                 self.tabeffecttime.set_text('0.0')
                 self.tabeffectprog.set_fraction(0.0)
@@ -278,6 +281,25 @@ class Effect(gtk.HBox):
             if response_id == gtk.RESPONSE_ACCEPT and pathname is not None:
                 self.uuid = str(uuid.uuid4())
             self.effect_length = 0.0 # Force effect length to be read again.
+            if sens and self._preload_source_id is None:
+                self._preload_source_id = idle_add(self._preload)
+
+    @threadslock
+    def _preload(self):
+        """Have the backend decode the effect into memory ahead of use.
+
+        The effect length is read here too so triggering needs no file
+        access at all.
+        """
+
+        self._preload_source_id = None
+        if self.pathname and os.path.isfile(self.pathname):
+            if self.effect_length == 0.0:
+                self.effect_length = self.interlude.get_media_metadata(
+                                                        self.pathname, True)
+            self.approot.mixer_write("EFCT=%d\nPLRP=%s\nACTN=preloadeffect\n"
+                                    "end\n" % (self.num, self.pathname))
+        return False
 
     def marshall(self):
         link = link_uuid_reg.get_link_filename(self.uuid)
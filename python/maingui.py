@@ -24,7 +24,6 @@ import subprocess
 import ConfigParser
 import operator
 import socket
-import pickle
 import stat
 import signal
 import time
@@ -54,11 +53,15 @@ from .utils import LinkUUIDRegistry
 from .utils import PathStr
 from .gtkstuff import threadslock, WindowSizeTracker, ConfirmationDialog
 from .gtkstuff import IconChooserButton, IconPreviewFileChooserDialog, LEDDict
-from .gtkstuff import LabelSubst, gdklock, nullcm
+from .gtkstuff import LabelSubst, gdklock, nullcm, callback_stats
+from .gtkstuff import frame_clock, VisibilityWatch
 from .gtkstuff import idle_add, timeout_add, timeout_add_seconds, source_remove
 from . import midicontrols
 from .tooltips import set_tip
 from . import songdb
+from .playhistory import PlayHistory
+from .trackanalysis import TrackAnalyser
+from .offlinerender import OfflineRender
 from .prelims import *
 
 
@@ -172,6 +175,7 @@ class MainMenu(gtk.MenuBar, MenuMixin):
         self.submenu(self.filemenu_i, "file")
         self.build(self.filemenu, autowipe=True)((("streams", _('Streams')),
                                 ("recorders", _('Recorders'))))
+        self.build(self.filemenu)((("render", _('Offline Render')),))
 
         self.sep(self.filemenu)
         self.build(self.filemenu)((("quit", gtk.STOCK_QUIT),),
@@ -1184,7 +1188,8 @@ class MicOpener(gtk.HBox):
         self._flashing_mode = False
         self._flashing_timer = 0
         self._headroom = 0.0
-        timeout = timeout_add(700, self.cb_flash_timeout)
+        timeout = frame_clock.add(700, self.cb_flash_timeout)
+        frame_clock.throttle(timeout, approot.window_visibility, 2800)
         self.connect("destroy", lambda w: source_remove(timeout))
         self.opener_settings = OpenerSettings()
         self.opener_settings.connect("changed", self.cb_reconfigure)
@@ -1400,8 +1405,7 @@ class StreamMeter(gtk.Frame):
             self.da.window.draw_rectangle(
                         self.gc, True, 0, 0, self.rect.width, self.rect.height)
         else:
-            valuep = int(float(self.value - self.base) /
-                                float(self.top - self.base) * self.rect.width)
+            valuep = self._valuep()
             self.gc.set_rgb_fg_color(self.red)
             self.da.window.draw_rectangle(
                                 self.gc, True, 0, 0, valuep, self.rect.height)
@@ -1409,19 +1413,18 @@ class StreamMeter(gtk.Frame):
             self.da.window.draw_rectangle(self.gc, True, valuep, 0,
                                     self.rect.width - valuep, self.rect.height)
 
+    def _valuep(self):
+        return int(float(self.value - self.base) /
+                                float(self.top - self.base) * self.rect.width)
+
     def cb_configure(self, widget, event):
         self.rect.width = event.width
         self.rect.height = event.height
+        self.drawn = None
 
     def set_value(self, value):
-        if value < self.base:
-            self.value = self.base
-        elif self.value > self.top:
-            self.value = self.top
-        else:
-            self.value = value
-        if value != self.oldvalue:
-            self.invalidate()
+        self.value = min(max(value, self.base), self.top)
+        self.invalidate()
 
     def set_active(self, active):
         if active != self.active:
@@ -1434,7 +1437,10 @@ class StreamMeter(gtk.Frame):
             self.invalidate()
 
     def invalidate(self):
-        if self.da.flags() & gtk.REALIZED:
+        # Redraw only when what is displayed would change.
+        drawn = (self.flash or not self.active) or (False, self._valuep())
+        if drawn != self.drawn and self.da.flags() & gtk.REALIZED:
+            self.drawn = drawn
             self.da.window.invalidate_rect(self.rect, False)
 
     def __init__(self, base, top):
@@ -1449,14 +1455,19 @@ class StreamMeter(gtk.Frame):
         self.da.connect("expose_event", self.expose)
         self.da.show()
         self.rect = gtk.gdk.Rectangle()
-        self.value = self.oldvalue = self.base
+        self.value = self.base
         self.active = False
         self.flash = False
+        self.drawn = None
 
 
 
 class BasicMeter(gtk.Frame):
-    """A meter widget with a simple rectangular vertical bar."""
+    """A meter widget with a simple rectangular vertical bar.
+
+    The lit and unlit meter are rendered to pixmaps when the size changes
+    and value changes copy across just the rows that differ.
+    """
 
 
     def realize(self, widget):
@@ -1470,11 +1481,8 @@ class BasicMeter(gtk.Frame):
 
 
     def expose(self, widget, event):
-        self.oldvalue = self.top
+        self.drawn = None
         self.set_value(self.value)
-        if self.value != self.base:
-            self.oldvalue = self.base
-            self.set_value(self.value)
 
 
     def cb_configure(self, widget, event):
@@ -1485,6 +1493,31 @@ class BasicMeter(gtk.Frame):
                                                     float(self.top - self.base))
         self.mutp = int(self.height * float(self.mut - self.base) /
                                                     float(self.top - self.base))
+        self._render()
+
+
+    def _render(self):
+        """Draw the meter fully lit and fully unlit."""
+
+        w, h = self.width, self.height
+        gc = self.gc
+        self.lit = gtk.gdk.Pixmap(self.da.window, w, h)
+        self.unlit = gtk.gdk.Pixmap(self.da.window, w, h)
+        gc.set_rgb_fg_color(self.backc)
+        self.unlit.draw_rectangle(gc, True, 0, 0, w, h)
+        for colour, upper, lower in ((self.highc, h, self.mutp),
+                    (self.midc, self.mutp, self.lutp), (self.lowc, self.lutp, 0)):
+            if upper > lower:
+                gc.set_rgb_fg_color(colour)
+                self.lit.draw_rectangle(gc, True, 0, h - upper, w, upper - lower)
+        if self.line is not None:
+            valuel = h - int(h * float(self.line - self.base) /
+                                                    float(self.top - self.base))
+            gc.set_rgb_fg_color(self.linec)
+            for pixmap in (self.lit, self.unlit):
+                pixmap.draw_line(gc, 0, valuel, w, valuel)
+        self.drawn = None
+
 
     def set_value(self, value):
         if value > self.top:
@@ -1492,35 +1525,26 @@ class BasicMeter(gtk.Frame):
         if value < self.base:
             value = self.base
         self.value = value
-        if self.da.flags() & gtk.REALIZED:
+        if self.lit is not None and self.da.flags() & gtk.REALIZED:
             valuep = int(self.height * float(self.value - self.base) /
                                                     float(self.top - self.base))
-            if value < self.oldvalue:
-                self.gc.set_rgb_fg_color(self.backc)
-                self.da.window.draw_rectangle(self.gc, True, 0, 0, self.width,
-                                                    self.height - valuep)
-            if value > self.oldvalue:
-                if valuep > self.mutp:
-                    self.gc.set_rgb_fg_color(self.highc)
-                    self.da.window.draw_rectangle(self.gc, True, 0, self.height
-                                    - valuep, self.width, valuep - self.mutp)
-                    valuep = self.mutp
-                if valuep > self.lutp:
-                    self.gc.set_rgb_fg_color(self.midc)
-                    self.da.window.draw_rectangle(self.gc, True, 0, self.height
-                                    - valuep, self.width, valuep - self.lutp)
-                    valuep = self.lutp
-                if valuep > 0:
-                    self.gc.set_rgb_fg_color(self.lowc)
-                    self.da.window.draw_rectangle(self.gc, True, 0, self.height
-                                    - valuep, self.width, valuep)
-            if self.line is not None:
-                valuel = int(self.height * float(self.line - self.base) /
-                                                    float(self.top - self.base))
-                self.gc.set_rgb_fg_color(self.linec)
-                self.da.window.draw_lines(self.gc, ((0, self.height - valuel),
-                                            (self.width, self.height - valuel))) 
-            self.oldvalue = value
+            drawn = self.drawn
+            if valuep == drawn:
+                return
+            w, h = self.width, self.height
+            window = self.da.window
+            if drawn is None:
+                window.draw_drawable(self.gc, self.unlit, 0, 0, 0, 0,
+                                                            w, h - valuep)
+                window.draw_drawable(self.gc, self.lit, 0, h - valuep,
+                                                0, h - valuep, w, valuep)
+            elif valuep > drawn:
+                window.draw_drawable(self.gc, self.lit, 0, h - valuep,
+                                        0, h - valuep, w, valuep - drawn)
+            else:
+                window.draw_drawable(self.gc, self.unlit, 0, h - drawn,
+                                        0, h - drawn, w, drawn - valuep)
+            self.drawn = valuep
 
 
     def set_line(self, lineval):
@@ -1528,6 +1552,8 @@ class BasicMeter(gtk.Frame):
                                 lineval >= self.top or lineval <= self.base):
             lineval = None
         self.line = lineval
+        if self.lit is not None:
+            self._render()
         self.expose(None, None)
 
 
@@ -1559,8 +1585,8 @@ class BasicMeter(gtk.Frame):
         self.lut = lut
         self.mut = mut
         self.value = base
-        self.oldvalue = self.top
         self.line = None
+        self.lit = self.unlit = self.drawn = None
 
 
 
@@ -1569,15 +1595,17 @@ class StackedMeter(gtk.Frame):
     
     
     def realize(self, widget):
-        self.gc = gtk.gdk.GC(self.window)
-        self.gc.copy(self.da.get_style().fg_gc[gtk.STATE_NORMAL])
-        self.ngc = gtk.gdk.color_parse("#30D030")
-        self.dsc = gtk.gdk.color_parse("#CCCF44")
-        self.compc = gtk.gdk.color_parse("#D05044")
-        self.backc = gtk.gdk.color_parse("darkgray")
+        # One graphics context per colour saves colour changes on redraw.
+        self.gcs = []
+        for colour in ("#30D030", "#CCCF44", "#D05044", "darkgray"):
+            gc = gtk.gdk.GC(self.window)
+            gc.copy(self.da.get_style().fg_gc[gtk.STATE_NORMAL])
+            gc.set_rgb_fg_color(gtk.gdk.color_parse(colour))
+            self.gcs.append(gc)
 
 
     def expose(self, widget, event):
+        self.drawn = None
         self.set_meter_value(self.c, self.d, self.n, True)
 
 
@@ -1585,6 +1613,7 @@ class StackedMeter(gtk.Frame):
         self.width = event.width
         self.height = event.height
         self.uh = self.height / float(self.top - self.base)
+        self.drawn = None
 
 
     def set_meter_value(self, c, d, n, force=False):
@@ -1612,22 +1641,25 @@ class StackedMeter(gtk.Frame):
             ch = int(self.uh * c)
             if ch + dh + nh > self.height:
                 ch = self.height - dh - nh
-            if nh:
-                self.gc.set_rgb_fg_color(self.ngc)
-                self.da.window.draw_rectangle(
-                                    self.gc, True, 0, 0, self.width, nh)
-            if dh:
-                self.gc.set_rgb_fg_color(self.dsc) 
-                self.da.window.draw_rectangle(
-                                    self.gc, True, 0, nh, self.width, dh)
-            if ch:
-                self.gc.set_rgb_fg_color(self.compc)
-                self.da.window.draw_rectangle(
-                                    self.gc, True, 0, nh + dh, self.width, ch)
-
-            self.gc.set_rgb_fg_color(self.backc)
-            self.da.window.draw_rectangle(self.gc, True, 0, nh + dh + ch,
-                                    self.width, self.height - (nh + dh + ch))
+            edges = (nh, nh + dh, nh + dh + ch)
+            drawn = self.drawn
+            if edges == drawn:
+                return
+            if drawn is None:
+                y0, y1 = 0, self.height
+            else:
+                # Just the rows between the band edges that moved.
+                moved = [x for x in zip(edges, drawn) if x[0] != x[1]]
+                y0 = min(min(x) for x in moved)
+                y1 = max(max(x) for x in moved)
+            bounds = (0,) + edges + (self.height,)
+            for gc, upper, lower in zip(self.gcs, bounds, bounds[1:]):
+                upper = max(upper, y0)
+                lower = min(lower, y1)
+                if lower > upper:
+                    self.da.window.draw_rectangle(
+                                    gc, True, 0, upper, self.width, lower - upper)
+            self.drawn = edges
 
 
     def __init__(self, base, top):
@@ -1643,6 +1675,7 @@ class StackedMeter(gtk.Frame):
         self.da.connect("expose_event", self.expose)
         self.da.show()
         self.c = self.d = self.n = base - 1
+        self.drawn = None
 
 
 
@@ -2068,11 +2101,7 @@ class MainWindow(dbus.service.Object):
             self.history_buffer.insert_at_cursor(ts + tstext + "\n")
             adjustment = self.history_window.get_vadjustment()
             adjustment.set_value(adjustment.upper)
-            try:
-                with open(pm.basedir / "history.log", "a") as f:
-                    f.write(time.strftime("%x %X :: ") + tstext + "\n")
-            except IOError:
-                print("failed to write log entry to history.log")
+            self.play_history.log(tstext, filename)
 
         if self._old_metadata_2 == args:
             return
@@ -2263,8 +2292,10 @@ class MainWindow(dbus.service.Object):
                 self.crossdirection = (self.crossadj.get_value() <= 50)
                 self.crosspass = timeout_add(
                 int(self.passspeed_adj.get_value() * 10), self.cb_crosspass)
+            self.crossclock = self.mix_clock()
         if data == "Clear History":
             self.history_buffer.set_text("")
+            self.play_history.set_meta("cleared", repr(time.time()))
 
     def expandercallback(self, expander, param_spec, user_data=None): 
         if expander.get_expanded():
@@ -2276,16 +2307,31 @@ class MainWindow(dbus.service.Object):
         if self.player_right.is_playing:
             self.player_right.reselect_cursor_please = True
 
+    def mix_clock(self):
+        """Seconds of mixed audio, which outpace real time when rendering."""
+
+        if self.offline_render.active:
+            return self.offline_render.clock
+        return time.time()
+
     @threadslock
     def cb_crosspass(self):
         x = self.crossadj.get_value()
         if x == 100 * self.crossdirection:
             self.crosspass = 0
             return False
+        if self.offline_render.active:
+            # Steps follow the audio so the pass keeps to its set duration.
+            now = self.mix_clock()
+            step = (now - self.crossclock) * 100.0 / \
+                                                self.passspeed_adj.get_value()
+            self.crossclock = now
+        else:
+            step = 1
         if self.crossdirection:
-            self.crossfade.set_value(x+1)
+            self.crossfade.set_value(min(100, x + step))
         else:
-            self.crossfade.set_value(x-1)
+            self.crossfade.set_value(max(0, x - step))
         return True
 
     # handles selection of metadata source
@@ -2381,6 +2427,8 @@ class MainWindow(dbus.service.Object):
     def save_session(self, trigger, where=None):
         print("save_session called")
 
+        self.play_history.flush()
+
         if where is None:
             session_filename = pm.basedir / self.session_filename
         else:
@@ -2439,29 +2487,10 @@ class MainWindow(dbus.service.Object):
                 fh.write("playerpage=" +
                     str(self.player_nb.get_current_page()) + "\n")
                 fh.close()
-                
-                # Save a list of files played and timestamps.
-                fh = open(session_filename + "_files_played", "w")
-                cutoff = time.time() - 2592000 # 2592000 = 30 days.
-                recent = {}
-                for key, value in self.files_played.iteritems():
-                    if value > cutoff:
-                        recent[key] = value
-                pickle.Pickler(fh).dump(recent)
-                fh.close()
             
         except Exception as e:
             print("Error writing out main session data", e)
 
-        try:
-            fh = open(session_filename + "_tracks", "w")
-            start, end = self.history_buffer.get_bounds()
-            text = self.history_buffer.get_text(start, end)
-            fh.write(text)
-            fh.close()
-        except Exception as e:
-            print("Error writing out tracks played data", e)
-
         self.prefs_window.save_player_prefs(where)
         self.controls.save_prefs(where)
         self.server_window.save_session_settings(where)
@@ -2547,31 +2576,18 @@ class MainWindow(dbus.service.Object):
                 self.topleftpane.notebook.set_current_page(int(v))
             elif k=="playerpage":
                 self.player_nb.set_current_page(int(v))
-        try:
-            fh = open(self.session_filename + "_files_played", "r")
-        except:
-            pass
-        else:
-            self.files_played = pickle.Unpickler(fh).load()
-            fh.close()
-
-        mst = pm.basedir / (self.session_filename + "_tracks")
-        try:
-            stat = os.stat(mst)
-        except OSError as e:
-            print(e)
-            return
-        if stat.st_ctime + 21600 > time.time():
-            try:
-                fh = open(mst, "r")
-            except Exception as e:
-                print(e)
-                return
-            text = fh.read()
-            fh.close()
-            self.history_buffer.set_text(text)
-        else:
-            print("disregarding out of date track history text")
+        # Files played data from before the play history database.
+        self.play_history.import_pickle(
+                            pm.basedir / (self.session_filename + "_files_played"))
+
+        # Show the tracks played in the last six hours since the last clear.
+        start = max(time.time() - 21600,
+                            float(self.play_history.get_meta("cleared", 0)))
+        lines = []
+        for when, songname, pathname in self.play_history.tracks(start):
+            tm = time.localtime(when)
+            lines.append("%02d:%02d :: %s\n" % (tm[3], tm[4], songname))
+        self.history_buffer.set_text("".join(lines))
 
     def destroy_hard(self, widget=None, data=None):
         if self.session_loaded:
@@ -2589,6 +2605,7 @@ class MainWindow(dbus.service.Object):
         exit(5)
 
     def destroy(self, widget=None, data=None):
+        self.offline_render.stop()
         self.freewheel_button.set_active(False)
         self.save_session("atexit")
         if self.crosspass:
@@ -2605,6 +2622,7 @@ class MainWindow(dbus.service.Object):
         source_remove(self.statstimeout)
         source_remove(self.vutimeout)
         source_remove(self.savetimeout)
+        self.track_analyser.close()
         self._mixer_ctrl.close()
         self.quitting()
         self.window.hide()
@@ -2646,6 +2664,33 @@ class MainWindow(dbus.service.Object):
 
         return int(os.getpid())
 
+    @dbus.service.method(dbus_interface=PGlobs.dbus_bus_basename,
+                                                            in_signature="u")
+    def callback_stats_enable(self, report_interval):
+        """Begin timing main loop callbacks.
+
+        A report is printed every report_interval seconds unless zero.
+        """
+
+        callback_stats.enable(report_interval)
+
+    @dbus.service.method(dbus_interface=PGlobs.dbus_bus_basename)
+    def callback_stats_disable(self):
+        callback_stats.disable()
+        callback_stats.reset()
+
+    @dbus.service.method(dbus_interface=PGlobs.dbus_bus_basename,
+                                                            out_signature="s")
+    def get_callback_stats(self):
+        """Main loop callback timings in JSON keyed by callback name.
+
+        Times are in seconds. Histogram bucket upper bounds are in
+        milliseconds with a final bucket for the remainder.
+        """
+
+        return json.dumps({"bounds": callback_stats.bounds,
+                                    "callbacks": callback_stats.snapshot()})
+
     def delete_event(self, widget, event, data=None):
         qm = ["<span size='12000' weight='bold'>%s</span>" %
                             _("Confirmation to quit IDJC is required."), ""]
@@ -2723,6 +2768,7 @@ class MainWindow(dbus.service.Object):
                     self.comms_reply_pending = False
                     self.server_window.restart_streams_and_recorders()
                     self.jack.restore()
+                    self.track_analyser.backend_restarted()
                     self.mixer_write(message, target)
                 break
             else:
@@ -2756,6 +2802,8 @@ class MainWindow(dbus.service.Object):
             if not gtk.main_level():
                 return False
 
+            # Meters nobody can see are not updated. Everything else is.
+            meters_visible = self.window_visibility.visible
             vu_update_counter[0] += 1
             if vu_update_counter[0] % 20 == 0:
                 self.heartbeat()
@@ -2812,6 +2860,9 @@ class MainWindow(dbus.service.Object):
                         player_metadata.append((target, value))
                     continue
 
+                if not meters_visible and key in self.visual_meters:
+                    continue
+
                 try:
                     self.vumap[key].set_meter_value(value)
                 except KeyError:
@@ -3075,6 +3126,8 @@ class MainWindow(dbus.service.Object):
             raise self.initfailed
 
         self.mixer_write("bootstrap")
+        self.track_analyser = TrackAnalyser(self,
+                                        PGlobs.config_dir / "analysis.db")
   
         # create the GUI elements
         self.window_group = gtk.WindowGroup()
@@ -3083,6 +3136,7 @@ class MainWindow(dbus.service.Object):
         self.window_group.add_window(self.window)
         self.window.set_title(self.appname + pm.title_extra)
         self.window.connect("delete_event", self.delete_event)
+        self.window_visibility = VisibilityWatch(self.window)
         self.hbox10 = gtk.HBox(False)
         self.hbox10.set_spacing(6)
         self.paned = gtk.HPaned()
@@ -3775,6 +3829,7 @@ class MainWindow(dbus.service.Object):
         self._old_metadata_2 = None
         self.simplemixer = False
         self.crosspass = 0
+        self.crossclock = 0.0
         self.old_meta_context = None
         self.old_cf = 0
 
@@ -3839,7 +3894,9 @@ class MainWindow(dbus.service.Object):
         self.in_vu_timeout = False
         self.vucounter = 0
         self.session_filename = "main_session"
-        self.files_played = {}
+        self.play_history = PlayHistory(pm.basedir / "history.db",
+                                                pm.basedir / "history.log")
+        self.files_played = self.play_history.played
         self.files_played_offline = {}
         
         # Variable map for stuff read from the mixer
@@ -3879,6 +3936,14 @@ class MainWindow(dbus.service.Object):
         for i, mic in enumerate(self.mic_meters):
             self.vumap.update({"mic_%d_levels" % (i + 1): mic})
 
+        # Purely for display so not needed when the window is hidden.
+        self.visual_meters = frozenset(["str_l_peak", "str_r_peak",
+                "str_l_rms", "str_r_rms"] + ["mic_%d_levels" % (i + 1)
+                for i in xrange(len(self.mic_meters))])
+        for each in (self.streammeterbox, self.micmeterbox, self.mic_opener,
+                                                self.jingles.nb_effects_box):
+            self.window_visibility.follow(each)
+
         self.controls= midicontrols.Controls(self)
         self.controls.load_prefs()
 
@@ -3909,12 +3974,16 @@ class MainWindow(dbus.service.Object):
         self.jack.load(startup=True)
         
         self.server_window = SourceClientGui(self)
+        self.offline_render = OfflineRender(self)
+        self.menu.rendermenu_i.connect(
+                    "activate", lambda w: self.offline_render.present())
         self.prefs_window = mixprefs(self)
         self.prefs_window.load_player_prefs()
         self.prefs_window.apply_player_prefs()
 
-        self.vutimeout = timeout_add(50, self.vu_update)
-        self.statstimeout = timeout_add(100, self.stats_update)
+        # Both run on the shared frame clock under one gdk lock.
+        self.vutimeout = frame_clock.add(50, self.vu_update, locking=False)
+        self.statstimeout = frame_clock.add(100, self.stats_update)
 
         self.savetimeout = timeout_add_seconds(
                                 120, threadslock(self.save_session), "periodic")
@@ -3961,6 +4030,9 @@ class MainWindow(dbus.service.Object):
         dbus.service.Object.__init__(self,
                     pm.dbus_bus_name, PGlobs.dbus_objects_basename + "/main")
 
+        if args.callback_stats is not None:
+            callback_stats.enable(args.callback_stats[0])
+
         if args.channels is not None:
             for each in args.channels:
                 self.mic_opener.open(each)
@@ -0,0 +1,198 @@
+"""Faster than real time rendering of playlists to a recorder.
+
+JACK is put into freewheel mode so the backend mixes as fast as it can
+while a recorder captures the output. Playlist transitions are driven by
+the user interface so the backend is granted a short step of audio on
+each frame clock tick and waits for the next. Player progress updates run
+on every tick for the duration so none of the per-second checks that
+trigger fades and transitions are skipped.
+"""
+
+#   Copyright (C) 2026 Stephen Fairchild (s-fairchild@users.sourceforge.net)
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 2 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program in the file entitled COPYING.
+#   If not, see <http://www.gnu.org/licenses/>.
+
+from __future__ import print_function
+
+__all__ = ["OfflineRender"]
+
+import time
+import gettext
+
+import gtk
+
+from idjc import FGlobs
+from .gtkstuff import frame_clock, threadslock
+from .prelims import ProfileManager
+
+
+_ = gettext.translation(FGlobs.package_name, FGlobs.localedir,
+                                                        fallback=True).gettext
+
+PM = ProfileManager()
+
+# Seconds of audio per step. This matches RENDER_STEP_MS in the backend and
+# must not exceed one second.
+STEP = 1.0
+
+
+def _hms(seconds):
+    seconds = int(seconds)
+    return "%d:%02d:%02d" % (seconds // 3600, seconds // 60 % 60, seconds % 60)
+
+
+class OfflineRender(gtk.Dialog):
+    """Renders the playlist of a player to a recorder.
+
+    The render ends when both main players have stopped.
+    """
+
+    def __init__(self, approot):
+        gtk.Dialog.__init__(self, _('Offline Render') + PM.title_extra,
+                                                            approot.window)
+        self._approot = approot
+        self._task = None
+        self._recorder = None
+        self._started = None
+        self.active = False
+        self.clock = 0.0  # seconds of audio rendered
+
+        self.set_border_width(6)
+        self.set_resizable(False)
+        self.connect("delete-event", self._on_delete)
+
+        table = gtk.Table(2, 2)
+        table.set_row_spacings(4)
+        table.set_col_spacings(8)
+        table.set_border_width(6)
+        self._player = gtk.combo_box_new_text()
+        for each in (_('Player 1'), _('Player 2')):
+            self._player.append_text(each)
+        self._player.set_active(0)
+        self._recorder_ix = gtk.combo_box_new_text()
+        for i in xrange(len(approot.server_window.recordtabframe.tabs)):
+            self._recorder_ix.append_text(_('Recorder %d') % (i + 1))
+        self._recorder_ix.set_active(0)
+        for row, (text, widget) in enumerate(((_('Play from'), self._player),
+                                    (_('Record with'), self._recorder_ix))):
+            label = gtk.Label(text)
+            label.set_alignment(0.0, 0.5)
+            table.attach(label, 0, 1, row, row + 1)
+            table.attach(widget, 1, 2, row, row + 1)
+        self.get_content_area().pack_start(table, False)
+
+        self._status = gtk.Label()
+        self._status.set_alignment(0.0, 0.5)
+        self._status.set_width_chars(40)
+        self.get_content_area().pack_start(self._status, False)
+
+        self._button = gtk.Button(_('Start'))
+        self._button.connect("clicked", self._on_button)
+        self.get_action_area().pack_start(self._button)
+        close = gtk.Button(stock=gtk.STOCK_CLOSE)
+        close.connect("clicked", lambda w: self.hide())
+        self.get_action_area().pack_start(close)
+        self.get_content_area().show_all()
+        self.get_action_area().show_all()
+
+    def start(self):
+        approot = self._approot
+        player = (approot.player_left, approot.player_right)[
+                                                    self._player.get_active()]
+        tab = approot.server_window.recordtabframe.tabs[
+                                                self._recorder_ix.get_active()]
+        if approot.server_window.is_streaming:
+            self._status.set_text(_('Streams cannot be rendered offline.'))
+            return
+        if approot.player_left.is_playing or approot.player_right.is_playing:
+            self._status.set_text(_('The players must be stopped first.'))
+            return
+        if tab.record_buttons.recording:
+            self._status.set_text(_('That recorder is in use.'))
+            return
+
+        tab.record_buttons.record_button.set_active(True)
+        if not tab.record_buttons.recording:
+            self._status.set_text(_('The recorder failed to start.'))
+            return
+        self._recorder = tab
+        approot.mixer_write("ACTN=render_start\nend\n")
+        self.active = True
+        self.clock = 0.0
+        self._started = time.time()
+        self._task = frame_clock.add(frame_clock.tick, self._step)
+        self._button.set_label(_('Stop'))
+        self._player.set_sensitive(False)
+        self._recorder_ix.set_sensitive(False)
+        player.play.clicked()
+
+    def stop(self):
+        if not self.active:
+            return
+        approot = self._approot
+        self.active = False
+        for player in (approot.player_left, approot.player_right):
+            if player.is_playing:
+                player.stop.clicked()
+        # Back to real time before the recorder waits on the audio feed.
+        approot.mixer_write("ACTN=render_stop\nend\n")
+        self._recorder.record_buttons.stop_button.clicked()
+        self._recorder = None
+        self._button.set_label(_('Start'))
+        self._player.set_sensitive(True)
+        self._recorder_ix.set_sensitive(True)
+        self._report()
+        print("offline render finished:", self._status.get_text())
+
+    def _report(self):
+        elapsed = time.time() - self._started
+        self._status.set_text(_('Rendered %s in %s, %.1f\xc3\x97 real time') % (
+                        _hms(self.clock), _hms(elapsed),
+                        self.clock / elapsed if elapsed > 0.0 else 0.0))
+
+    @threadslock
+    def _step(self):
+        approot = self._approot
+        if not self.active:
+            self._task = None
+            return False
+
+        approot.mixer_write("ACTN=render_step\nend\n")
+        while 1:
+            line = approot.mixer_read()
+            if line.startswith("render_frames="):
+                rate = approot.sample_rate.value
+                if rate:
+                    self.clock = int(line[14:]) / float(rate)
+            elif line in ("end\n", ""):
+                break
+        self._report()
+
+        if self.clock > STEP and not (approot.player_left.is_playing or
+                                            approot.player_right.is_playing):
+            self._task = None
+            self.stop()
+            return False
+        return True
+
+    def _on_button(self, widget):
+        if self.active:
+            self.stop()
+        else:
+            self.start()
+
+    def _on_delete(self, widget, event):
+        self.hide()
+        return True
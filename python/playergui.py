@@ -25,9 +25,10 @@ import time
 import urllib
 import subprocess
 import random
+import heapq
 import signal
 import re
-import xml.dom.minidom as mdom
+import itertools
 import warnings
 import gettext
 import uuid
@@ -50,12 +51,14 @@ from mutagen.id3 import ID3
 
 from idjc import FGlobs, PGlobs
 from . import popupwindow
-from .mutagentagger import *
+from . import playlistio
+from .externalindex import open_index
 from .utils import SlotObject
 from .utils import LinkUUIDRegistry
 from .utils import PathStr
 from .gtkstuff import threadslock, FolderChooserButton
 from .gtkstuff import idle_add, timeout_add, source_remove, nullcm, gdklock
+from .gtkstuff import frame_clock, WaveformOverview
 from .prelims import *
 from .tooltips import set_tip
 
@@ -93,9 +96,22 @@ RGDEF = "0 DEFAULT"
 # Playlist value indicating a file isn't valid.
 NOTVALID = PlayerRow("<s>valid</s>", "", 0, "", "latin1", "", "", RGDEF, None, "", "")
 
+def literal_entry(data):
+    """Playlist row from literal playlist data such as playlist controls."""
+
+    try:
+        return NOTVALID._replace(**dict((k, type(getattr(NOTVALID, k))(v))
+                                                for k, v in data.iteritems()))
+    except Exception as e:
+        print(e)
+        return None
+
 # Delay in milliseconds between progress bar updates.
 PROGRESS_TIMEOUT = 200
 
+# Seconds before the end of a track that the next one is prefetched.
+PREFETCH_LEAD = 30
+
 # Pathname is an absolute file path or 'missing' or 'pregap'.
 CueSheetTrack = namedtuple("CueSheetTrack",
     "pathname play tracknum index performer title offset duration replaygain album")
@@ -145,6 +161,125 @@ class IndexingIterator(object):
         return val
 
 
+class RandomSelector(object):
+    """Least recently played track picker for the Random playlist modes.
+
+    A heap of pathnames ordered by play time is kept alongside the playlist
+    model and is repaired lazily as the play history moves on, so a pick
+    costs O(log n) rather than a scan of the playlist. Row insertions and
+    changes are tracked incrementally using the persistent iterators of
+    gtk.ListStore. Row deletions invalidate those iterators so they just
+    flag the pathname index for rebuilding on the next pick.
+    """
+
+    def __init__(self, model, column=1):
+        self._model = model
+        self._column = column
+        self._history = None
+        self._heap = []
+        self._queued = {}
+        self._rows = {}
+        self._stale = True
+        model.connect("row-inserted", self._on_row_set)
+        model.connect("row-changed", self._on_row_set)
+        model.connect("row-deleted", self._on_row_deleted)
+
+    def pick(self, history, window=1):
+        """Choose a row at random from the least recently played.
+
+        history: mapping of pathname to time last played. Its get is used
+        so PlayHistory.played answers for times beyond its recent past.
+        window: the number of least recently played pathnames to choose from.
+        Returns a gtk.TreeIter or None if there is nothing to pick.
+        """
+
+        if self._stale:
+            self._rebuild_rows()
+        if history is not self._history:
+            self._history = history
+            self._rebuild_heap()
+
+        candidates = []
+        while self._heap and len(candidates) < window:
+            entry = heapq.heappop(self._heap)
+            when, tiebreak, pathname = entry
+            if self._queued.get(pathname) != when:
+                continue  # Superseded entry.
+            actual = history.get(pathname, 0)
+            if actual != when:
+                self._push(pathname, actual)
+                continue
+            candidates.append(entry)
+
+        for entry in candidates:
+            heapq.heappush(self._heap, entry)
+        if len(self._heap) > 2 * len(self._queued) + 64:
+            self._rebuild_heap()  # Shed the superseded entries.
+
+        while candidates:
+            entry = random.choice(candidates)
+            iter = self._get_iter(entry[2])
+            if iter is not None:
+                return iter
+            candidates.remove(entry)
+            del self._queued[entry[2]]
+        return None
+
+    def _get_iter(self, pathname):
+        iters = self._rows.get(pathname, [])
+        while iters:
+            iter = random.choice(iters)
+            # A row whose pathname was edited leaves behind a stale iterator.
+            if self._model.get_value(iter, self._column) == pathname:
+                return iter
+            iters.remove(iter)
+        self._rows.pop(pathname, None)
+        return None
+
+    def _push(self, pathname, when):
+        self._queued[pathname] = when
+        heapq.heappush(self._heap, (when, random.random(), pathname))
+
+    def _add_row(self, pathname, iter):
+        iters = self._rows.setdefault(pathname, [])
+        if not iters and pathname not in self._queued and \
+                                                self._history is not None:
+            self._push(pathname, self._history.get(pathname, 0))
+        iters.append(iter)
+
+    def _rebuild_rows(self):
+        self._rows = {}
+        model = self._model
+        iter = model.get_iter_first()
+        while iter is not None:
+            pathname = model.get_value(iter, self._column)
+            if pathname:
+                self._rows.setdefault(pathname, []).append(iter)
+            iter = model.iter_next(iter)
+        self._stale = False
+        if self._history is not None:
+            self._rebuild_heap()
+
+    def _rebuild_heap(self):
+        history = self._history
+        self._queued = dict((x, history.get(x, 0)) for x in self._rows)
+        self._heap = [(v, random.random(), k) for k, v in
+                                                    self._queued.iteritems()]
+        heapq.heapify(self._heap)
+
+    def _on_row_set(self, model, path, iter):
+        if self._stale:
+            return
+        pathname = model.get_value(iter, self._column)
+        if pathname:
+            iters = self._rows.get(pathname, ())
+            if not any(model.get_path(x) == path for x in iters):
+                self._add_row(pathname, iter)
+
+    def _on_row_deleted(self, model, path):
+        self._stale = True
+
+
 class CueSheetListStore(gtk.ListStore):
     _columns = (str, int, int, int, str, str, int, int, str, str)
     assert len(_columns) == len(CueSheetTrack._fields)
@@ -389,30 +524,33 @@ class ButtonFrame(gtk.Frame):
 
 class ExternalPL(gtk.Frame):
     def get_next(self):
-        next = self._get_next()
-        if next is None:
-            return self._get_next()
-        return next
-
-    def _get_next(self):
-        if self.active.get_active():
-            try:
-                line = self.gen.next()
-            except StopIteration:
-                self.gen = self.player.get_elements_from([self.pathname])
-                line = None
-            return line
+        if self.active.get_active() and self.index is not None:
+            for i in xrange(len(self.index)):
+                item = self.index.next()
+                if item is None:
+                    break
+                if isinstance(item, dict):
+                    line = literal_entry(item)
+                else:
+                    line = self.player.get_media_metadata(item)
+                if line:
+                    return line
         return None
 
+    def save(self):
+        if self.index is not None:
+            self.index.save()
+
     def cb_active(self, widget):
         if widget.get_active():
             self.pathname = (self.filechooser, self.directorychooser
                             )[self.radio_directory.get_active()].get_filename()
             if self.pathname is not None:
-                self.gen = self.player.get_elements_from([self.pathname])
-                try:
-                    line = self.gen.next()
-                except StopIteration:
+                self.index = open_index(self.pathname, PM.basedir / (
+                                self.player.playername + "_external_index"),
+                                supported.check_media)
+                line = self.get_next()
+                if line is None:
                     widget.set_active(False)
                 else:
                     self.player.stop.clicked()
@@ -423,6 +561,9 @@ class ExternalPL(gtk.Frame):
             else:
                 widget.set_active(False)
         else:
+            if self.index is not None:
+                self.index.close()
+                self.index = None
             self.vbox.set_sensitive(True)
 
     def cb_newselection(self, widget, radio):
@@ -440,6 +581,7 @@ class ExternalPL(gtk.Frame):
 
     def __init__(self, player):
         self.player = player
+        self.index = None
         gtk.Frame.__init__(self, " %s " % _('External Playlist'))
         self.set_border_width(4)
         hbox = gtk.HBox()
@@ -1339,6 +1481,11 @@ class IDJC_Media_Player:
             # Used if only requesting the length of the track
             return length
 
+        analysis = self.parent.track_analyser.lookup(filename)
+        if rg == RGDEF and analysis is not None:
+            # Untagged so use a measurement where there is one.
+            rg = analysis.gain or RGDEF
+
         length = 1 if length < 1.0 else float(length)
         uuid_ = str(uuid.uuid4())
 
@@ -1394,6 +1541,7 @@ class IDJC_Media_Player:
         if where is None:
             where = PM.basedir
        
+        self.external_pl.save()
         fh = open(where / self.session_filename, "w")
         extlist = self.external_pl.filechooser.get_filename()
         if extlist is not None:
@@ -1497,6 +1645,12 @@ class IDJC_Media_Player:
                     if not playlist_entry or self.playlist_todo:
                         self.playlist_todo.append(playlist_entry.filename)
                     else:
+                        analysis = self.parent.track_analyser.lookup(
+                                                    playlist_entry.filename)
+                        if playlist_entry.replaygain == RGDEF and \
+                                analysis is not None and analysis.gain:
+                            playlist_entry = playlist_entry._replace(
+                                                    replaygain=analysis.gain)
                         try:
                             self.liststore.append(playlist_entry)
                         except TypeError:
@@ -1692,6 +1846,19 @@ class IDJC_Media_Player:
                 self.start_time = 0
         else:
             self.start_time = rt    # Seek to the end when file is missing.
+
+        if model.get_value(iter, 8):
+            self.analysis = None
+            self.waveform.set_overview(None)
+        else:
+            analysis = self.parent.track_analyser.lookup(
+                    self.music_filename) if self.music_filename else None
+            self.waveform.set_overview(analysis and analysis.overview)
+            self.analysis = self.track_analysis(analysis)
+            # Unattended play skips leading silence in whole seconds.
+            if self.analysis is not None and self.start_time == 0 and \
+                            self.pl_mode.get_active() in self.segue_modes:
+                self.start_time = int(self.analysis.lead)
         print("Seek time is %d seconds" % self.start_time)
 
         # Now we recalibrate the progress bar to the current song length
@@ -1782,7 +1949,8 @@ class IDJC_Media_Player:
         else:
             print("player context id is %d\n" % self.player_cid)
             if self.player_cid & 1:
-                self.timeout_source_id = timeout_add(PROGRESS_TIMEOUT,
+                self.timeout_source_id = frame_clock.add(
+                                self.progress_interval(),
                                 self.cb_play_progress_timeout, self.player_cid)
             else:
                 self.invoke_end_of_track_policy()
@@ -1811,6 +1979,7 @@ class IDJC_Media_Player:
         self.playtime_elapsed.set_value(0)
         self.progressadj.set_value(0.0)
         self.progressadj.value_changed()
+        self.waveform.set_overview(None)
 
         if self.gapless == False:
             self.parent.mixer_write("ACTN=stop%s\nend\n" % self.playername)
@@ -1883,11 +2052,22 @@ class IDJC_Media_Player:
 
         print("player context id is %d\n" % self.player_cid)
         # Restart a callback to update the progressbar.
-        self.timeout_source_id = timeout_add(
-            PROGRESS_TIMEOUT, self.cb_play_progress_timeout, self.player_cid)
+        self.timeout_source_id = frame_clock.add(self.progress_interval(),
+                                self.cb_play_progress_timeout, self.player_cid)
         self.parent.send_new_mixer_stats()
         return True
 
+    def progress_interval(self):
+        """Milliseconds between play progress updates.
+
+        An offline render advances a second of audio per frame clock tick
+        so updates must then come on every tick.
+        """
+
+        if self.parent.offline_render.active:
+            return frame_clock.tick
+        return PROGRESS_TIMEOUT
+
     def next_real_track(self, i):
         if i == None:
             return None
@@ -1911,6 +2091,41 @@ class IDJC_Media_Player:
                 return i
             i = m.get_iter_next(i)
 
+    def prefetch_next(self, pl_mode):
+        """Prefetch the track that is to play next if it is known.
+
+        That is the next one in Play All and Loop All and the one selected
+        in the other player for Fade Over.
+        """
+
+        if pl_mode == 0:
+            iter = self.model_playing.iter_next(self.iter_playing)
+            if iter is not None and \
+                            self.model_playing.get_value(iter, 0)[0] != ">":
+                self.prefetch(self.model_playing, iter)
+        elif pl_mode == 1:
+            iter = self.next_real_track(self.iter_playing) or \
+                                                    self.first_real_track()
+            if iter is not None:
+                self.prefetch(self.model_playing, iter)
+        elif pl_mode == 7 and self.playername in ("left", "right"):
+            other = self.parent.player_right if self.playername == "left" \
+                                                else self.parent.player_left
+            model, iter = other.treeview.get_selection().get_selected()
+            if iter is not None and model.get_value(iter, 0)[0] != ">":
+                other.prefetch(model, iter)
+
+    def prefetch(self, model, iter):
+        """Have the backend decode the opening of a track ahead of play.
+
+        This hides the time taken to open files on slow storage.
+        """
+
+        pathname, cuesheet = model.get(iter, 1, 8)
+        if pathname and cuesheet is None:
+            self.parent.mixer_write("PLRP=%s\nACTN=prefetch%s\nend\n" % (
+                                                    pathname, self.playername))
+
     def invoke_end_of_track_policy(self, mode_text=None):
         # This is where we implement the playlist modes for the most part.
         if mode_text is None:
@@ -1958,37 +2173,20 @@ class IDJC_Media_Player:
                 poolsize = 50
             elif poolsize < 10:
                 poolsize = 10
-                if poolsize > len(self.liststore):
-                    poolsize = len(self.liststore)
 
             if self.parent.server_window.is_streaming or \
                                         self.parent.server_window.is_recording:
                 fp = self.parent.files_played
             else:
                 fp = self.parent.files_played_offline
-            timestamped_pathnames = []
-            while not timestamped_pathnames:
-                random_pathnames = [PlayerRow(*x).filename 
-                            for x in random.sample(self.liststore, poolsize)]
-                timestamped_pathnames = [(fp.get(pn, 0), pn) 
-                                            for pn in random_pathnames if pn]
-                timestamped_pathnames.sort()
-                try:
-                    least_recent_ts = timestamped_pathnames[0][0]
-                except IndexError:
-                    print("cannot select from an empty playlist")
-                    return
-                timestamped_pathnames = [x for x in timestamped_pathnames
-                                                    if x[0] == least_recent_ts]
-                least_recent = random.choice(timestamped_pathnames)[1]
 
-            for path, entry in enumerate(self.liststore):
-                entry_filename = PlayerRow(*entry).filename
-                if least_recent == entry_filename:
-                    break
+            iter = self.random_selector.pick(fp, poolsize)
+            if iter is None:
+                print("cannot select from an empty playlist")
+                return
 
             treeselection = self.treeview.get_selection()
-            treeselection.select_path(path)
+            treeselection.select_iter(iter)
             self.play.clicked()
         elif mode_text == N_('External'):
             path = self.model_playing.get_path(self.iter_playing)[0]
@@ -2272,12 +2470,22 @@ class IDJC_Media_Player:
                 self.invoke_end_of_track_policy()
                 self.gapless = False
                 return False
+
+            # Precomputed end of audio as used by unattended modes.
+            if self.analysis is not None and pl_mode in (2, 6, 8) and \
+                                not self.is_paused and \
+                                self.playtime_elapsed.value >= self.segue_time():
+                print("termination at the end of audio")
+                self.invoke_end_of_track_policy()
+                return False
                 
-            # Mid-track silence killer.
+            # Mid-track silence killer. Silence is counted in seconds played
+            # so it holds for offline rendering too.
             if self.mixer_signal_f.value == False:
-                self.silence_count += 1
+                self.silence_count += max(0, self.playtime_elapsed.value -
+                                                self.progress_current_figure)
                 if self.parent.feature_set.get_active() and \
-                            self.silence_count >= 120 and \
+                            self.silence_count >= 24 and \
                             self.playtime_elapsed.value > 15 and \
                             self.parent.prefs_window.bonus_killer.get_active():
                     print("termination due to excessive silence")
@@ -2391,6 +2599,11 @@ class IDJC_Media_Player:
                     self.invoke_end_of_track_policy()
                     self.set_fade_mode(0)
 
+        # Have the backend open the next track before it is needed.
+        if rem <= PREFETCH_LEAD and self.prefetch_cid != cid:
+            self.prefetch_cid = cid
+            self.prefetch_next(pl_mode)
+
         # Calclulate whether to sound the DJ alarm (end of music notification)
         if self.playername in ("left", "right"):
             if rem == 10 and self.progressadj.upper > 11 and \
@@ -2408,8 +2621,8 @@ class IDJC_Media_Player:
 
             # Check if the crossfade needs scheduling.
             if pl_mode == 7 or (pl_mode == 0 and self.fade_inspect()):
-                eot_crosstime = int(self.progress_stop_figure) - \
-                                    self.parent.passspeed_adj.props.value - \
+                eot_crosstime = self.segue_time(
+                                    self.parent.passspeed_adj.props.value) - \
                                     int(self.progress_current_figure)
                 # Start other player.
                 if not self.other_player_initiated and eot_crosstime <= 1:
@@ -2437,6 +2650,37 @@ class IDJC_Media_Player:
         self.parent.tracks_finishing()
         return False
 
+    # Playlist modes that use precomputed silence offsets: Random,
+    # Alternate, Fade Over and Random Hop.
+    segue_modes = (2, 6, 7, 8)
+
+    def track_analysis(self, analysis):
+        """The analysis if its precomputed offsets are to be used.
+
+        Use is tied to the silence killer which they stand in for.
+        """
+
+        if analysis is None or analysis.end is None or \
+                not self.parent.feature_set.get_active() or \
+                not self.parent.prefs_window.silence_killer.get_active():
+            return None
+        return analysis
+
+    def segue_time(self, overlap=0.0):
+        """The play position at which to move to the next track.
+
+        overlap: the duration of a crossfade which is made to start at
+        the beginning of any fade-out but to finish before trailing
+        silence. Only unattended modes use the analysis.
+        """
+
+        analysis = self.analysis
+        if analysis is None or self.pl_mode.get_active() not in self.segue_modes:
+            return int(self.progress_stop_figure) - overlap
+        if overlap:
+            return min(analysis.fade, analysis.end - overlap)
+        return analysis.end
+
     def stop_inspect(self):
         stoppers = (">stopplayer", ">stopplayer2", ">announcement")
         horizon = (">transfer", ">crossfade", ">jumptotop")
@@ -2685,7 +2929,7 @@ class IDJC_Media_Player:
 
         if ext != ".xspf":
             # Filter out playlist controls.
-            data = [x for x in self.liststore if x[0][0] != ">" and x[2] >= 0]
+            data = (x for x in self.liststore if x[0][0] != ">" and x[2] >= 0)
         else:
             data = self.liststore
 
@@ -2697,106 +2941,13 @@ class IDJC_Media_Player:
                         proc = lambda x: x.decode("UTF-8").encode("ISO8859-1", "replace")
                     else:
                         proc = lambda x: x
-                    self.write_m3u_playlist(h, data, proc)
+                    playlistio.write_m3u(h, data, proc)
                 elif ext == ".pls":
-                    self.write_pls_playlist(h, data)
+                    playlistio.write_pls(h, data)
                 elif ext == ".xspf":
-                    self.write_xspf_playlist(h, data)
+                    playlistio.write_xspf(h, data, PlayerRow._fields)
         except IOError:
             print("problem writing out playlist file")
-            
-    def write_m3u_playlist(self, h, data, proc):
-        h.write("#EXTM3U\r\n")
-        for each in data:
-            h.write("#EXTINF:%d,%s\r\n" % (each[2], proc(each[3])))
-            h.write("file://" + urllib.quote(each[1]) + "\r\n")
-
-    def write_pls_playlist(self, h, data):
-        h.write("[playlist]\r\nNumberOfEntries=%d\r\n\r\n" % len(data))
-        for i in range(1, len(data) + 1):
-            each = data[i - 1]
-            h.write("File%d=%s\r\n" % (i, each[1]))
-            h.write("Title%d=%s\r\n" % (i, each[3]))
-            h.write("Length%d=%d\r\n\r\n" % (i, each[2]))
-        h.write("Version=2\r\n")
-
-    def write_xspf_playlist(self, h, data):
-        doc = mdom.getDOMImplementation().createDocument(
-                            'http://xspf.org/ns/0/', 'playlist', None)
-
-        playlist = doc.documentElement
-        playlist.setAttribute('version', '1')
-        playlist.setAttribute('xmlns', 'http://xspf.org/ns/0/')
-        playlist.setAttribute('xmlns:idjc', 'http://idjc.sourceforge.net/ns/')
-
-        trackList = doc.createElement('trackList')
-        playlist.appendChild(trackList)
-
-        for each in data:
-            row = PlayerRow(*each)
-
-            track = doc.createElement('track')
-            trackList.appendChild(track)
-
-            if row.rsmeta.startswith(">"):
-                extension = doc.createElement('extension')
-                track.appendChild(extension)
-                extension.setAttribute(
-                    'application', 'http://idjc.sourceforge.net/ns/')
-
-                pld = doc.createElementNS(
-                    'http://idjc.sourceforge.net/ns/', 'idjc:pld')
-                extension.appendChild(pld)
-                
-                for field, value in zip(row._fields, row):
-                    if isinstance(value, (str, int, float)):
-                        pld.setAttribute(field, str(value))                
-
-            else:
-                location = doc.createElement('location')
-                track.appendChild(location)
-                locationText = doc.createTextNode(
-                                    "file://" + urllib.quote(each[1]))
-                location.appendChild(locationText)
-
-                if each[6]:
-                    creator = doc.createElement('creator')
-                    track.appendChild(creator)
-                    creatorText = doc.createTextNode(each[6])
-                    creator.appendChild(creatorText)
-
-                if each[5]:
-                    title = doc.createElement('title')
-                    track.appendChild(title)
-                    titleText = doc.createTextNode(each[5])
-                    title.appendChild(titleText)
-
-                if each[9]:
-                    album = doc.createElement('album')
-                    track.appendChild(album)
-                    albumText = doc.createTextNode(each[9])
-                    album.appendChild(albumText)
-
-                duration = doc.createElement('duration')
-                track.appendChild(duration)
-                durationText = doc.createTextNode(str(each[2] * 1000))
-                duration.appendChild(durationText)
-
-        xmltext = doc.toxml("UTF-8").replace("><", ">\n<").splitlines()
-        spc = ""
-        for i in range(len(xmltext)):
-            if xmltext[i][1] == "/":
-                spc = spc[2:]
-            if len(xmltext[i]) < 3 or xmltext[i].startswith("<?") or \
-                    xmltext[i][-2] == "/" or xmltext[i].count("<") == 2:
-                xmltext[i] = spc + xmltext[i]
-            else:
-                xmltext[i] = spc + xmltext[i]
-                if xmltext[i][len(spc) + 1] != "/":
-                    spc = spc + "  "
-        h.write("\r\n".join(xmltext))
-        h.write("\r\n")
-        doc.unlink()
 
     def plfile_destroy(self, widget):
         self.showing_pl_save_requester = False
@@ -2982,169 +3133,58 @@ class IDJC_Media_Player:
 
     def get_elements_from_m3u(self, filename):
         try:
-            file = open(filename, "r")
-            data = file.read().strip()
-            file.close()
+            gen = playlistio.read_m3u(filename)
+            first = next(gen, None)
+            if first is None:
+                return
+            second = next(gen, None)
         except IOError:
             print("Problem reading file", filename)
             return
-        basepath = os.path.split(filename)[0] + "/"
-        data = data.splitlines()
-        
-        for line, each in enumerate(data):
-            if each[0] == "#":
-                continue
-            if each[0] != "/":
-                if each.startswith("file://"):
-                    host, abspathname = each[7:].split("/", 1)
-                    if host not in ("", "localhost", "127.0.0.1", "::1"):
-                        continue
-                    each = "/" + urllib.unquote(abspathname)
-                else:
-                    each = basepath + each
-            # handle special case of a single element referring to a directory
-            if line == 0 and len(data) == 1 and os.path.isdir(each):
-                gen = self.get_elements_from_directory(each)
-                for meta in gen:
-                    yield meta
-                return
-            meta = self.get_media_metadata(each)
-            if meta:
+
+        # handle special case of a single element referring to a directory
+        if second is None and os.path.isdir(first):
+            for meta in self.get_elements_from_directory(first):
                 yield meta
-            line += 1
+            return
 
-    def get_elements_from_pls(self, filename):
-        import ConfigParser
-        cfg = ConfigParser.RawConfigParser()
         try:
-            cfg.readfp(open(filename))
+            for each in itertools.chain((first, second), gen):
+                if each is not None:
+                    meta = self.get_media_metadata(each)
+                    if meta:
+                        yield meta
         except IOError:
-            print("Problem reading file")
-            return
-        if cfg.sections() != ['playlist']:
-            print("wrong number of sections in pls file")
-            return
-        if cfg.getint('playlist', 'Version') != 2:
-            print("can handle version 2 pls playlists only")
-            return
+            print("Problem reading file", filename)
+
+    def get_elements_from_pls(self, filename):
         try:
-            n = cfg.getint('playlist', 'NumberOfEntries')
-        except ConfigParser.NoOptionError:
-            print("NumberOfEntries is missing from playlist")
-            return
-        except ValueError:
-            print("NumberOfEntries is not an int")
-        for i in range(1, n + 1):
-            try:
-                path = cfg.get('playlist', 'File%d' % i)
-            except:
-                print("Problem getting file path from playlist")
-            else:
+            for path in playlistio.read_pls(filename):
                 if os.path.isfile(path):
                     meta = self.get_media_metadata(path)
                     if meta:
                         yield meta
+        except IOError:
+            print("Problem reading file")
+        except playlistio.BadPlaylist as e:
+            print(e)
 
     def get_elements_from_xspf(self, filename):
-        class BadXspf(ValueError):
-            pass
-        class GotLocation(Exception):
-            pass
-
         try:
-            baseurl = []
-
-            try:
-                dom = mdom.parse(filename)
-            except:
-                raise BadXspf
-
-            if dom.hasChildNodes() and len(dom.childNodes) == 1 and \
-                                    dom.documentElement.nodeName == u'playlist':
-                playlist = dom.documentElement
-            else:
-                raise BadXspf
-
-            if playlist.namespaceURI != u"http://xspf.org/ns/0/":
-                raise BadXspf
-
-            try:
-                v = int(playlist.getAttribute('version'))
-            except:
-                raise BadXspf
-            if v < 0 or v > 1:
-                print("only xspf playlist versions 0 and 1 supported")
-                raise BadXspf
-            del v
-
-            # obtain base URLs for relative URLs encountered in trackList
-            # only one location tag is allowed
-            locations = [x for x in playlist.childNodes 
-                                                if x.nodeName == u"location"]
-            if len(locations) == 1:
-                url = locations[0].childNodes[0].wholeText
-                if url.startswith(u"file:///"):
-                    baseurl.append(url)
-            elif locations:
-                raise BadXspf
-                
-            def append_baseurl(fname):
-                baseurl.append(u"file://" + urllib.quote(os.path.split(
-                                            fname)[0].decode("ASCII") + u"/"))
-                
-            for each in (os.path.realpath(filename), filename):
-                append_baseurl(each)
-
-            if baseurl[-1] == baseurl[-2]:
-                del baseurl[-1]
-
-            trackLists = playlist.getElementsByTagName('trackList')
-            if len(trackLists) != 1:
-                raise BadXspf
-            trackList = trackLists[0]
-            if trackList.parentNode != playlist:
-                raise BadXspf
-
-            tracks = trackList.getElementsByTagName('track')
-            for track in tracks:
-                if track.parentNode != trackList:
-                    raise BadXspf
-                locations = track.getElementsByTagName('location')
-                try:
-                    for location in locations:
-                        for base in baseurl:
-                            url = urllib.unquote(urllib.basejoin(base, 
-                                location.firstChild.wholeText).encode("ASCII"))
-                            meta = self.get_media_metadata(url)
-                            if meta:
-                                yield meta
-                                raise GotLocation
-                    # Support namespaced pld tag for literal playlist data.
-                    # This is only used for data such as playlist controls.
-                    extensions = track.getElementsByTagName('extension')
-                    for extension in extensions:
-                        if extension.getAttribute("application") == \
-                                            "http://idjc.sourceforge.net/ns/":
-                            customtags = extension.getElementsByTagNameNS(
-                                    "http://idjc.sourceforge.net/ns/", "pld")
-                            for tag in customtags:
-                                try:
-                                    literal_entry = NOTVALID._replace(**dict((
-                                            k, type(getattr(NOTVALID, k))(
-                                            tag.attributes.get(k).nodeValue))
-                                            for k in tag.attributes.keys()))
-                                except Exception as e:
-                                    print(e)
-                                    pass
-                                else:
-                                    yield literal_entry
-                                    raise GotLocation
-                except GotLocation:
-                    pass
-            return
-        except BadXspf:
+            for kind, data in playlistio.read_xspf(filename):
+                if kind == "location":
+                    for url in data:
+                        meta = self.get_media_metadata(url)
+                        if meta:
+                            yield meta
+                            break
+                else:
+                    entry = literal_entry(data)
+                    if entry is not None:
+                        yield entry
+        except (IOError, playlistio.BadPlaylist) as e:
+            print(e)
             print("could not parse playlist", filename)
-            return
 
     def drag_data_delete(self, treeview, context):
         if context.action == gtk.gdk.ACTION_MOVE:
@@ -3317,6 +3357,16 @@ class IDJC_Media_Player:
     def cb_playlist_changed(self, treemodel, path, iter = None):
         self.playlist_changed = True        # used by the request system
 
+    def _on_track_analysed(self, pathname, analysis):
+        if self.player_is_playing and pathname == self.music_filename and \
+                                            self.cuesheet is None:
+            self.waveform.set_overview(analysis.overview)
+        gain = analysis.gain
+        if gain is not None:
+            for row in self.liststore:
+                if row[1] == pathname and row[7] == RGDEF:
+                    row[7] = gain
+
     def menu_activate(self, widget, event):
         if event.type == gtk.gdk.BUTTON_PRESS and event.button == 3:
             self.menu_model = self.treeview.get_model()
@@ -3329,6 +3379,8 @@ class IDJC_Media_Player:
                 selection.select_path(path)
                 self.menu_iter = self.menu_model.get_iter(path)
                 pathname = self.menu_model.get_value(self.menu_iter, 1)
+                # The tagger is imported on demand to speed up startup.
+                from .mutagentagger import MutagenGUI  # pylint: disable=W0404
                 self.item_tag.set_sensitive(
                                     MutagenGUI.is_supported(pathname) != False)
             else:
@@ -3435,6 +3487,7 @@ class IDJC_Media_Player:
             except TypeError:
                 pass
             else:
+                from .mutagentagger import MutagenGUI  # pylint: disable=W0404
                 MutagenGUI(pathname, model.get_value(iter, 4) , self.parent)
 
         if text == "Add File":
@@ -3775,57 +3828,91 @@ class IDJC_Media_Player:
             return False
         return True
 
+    def _cell_props(self, key, build, *args):
+        """Cached cell renderer properties for the playlist columns.
+
+        Rows with the same key render identically so the properties need only
+        be worked out once. The cache is emptied when the playlist mode changes.
+        """
+
+        try:
+            return self._cell_cache[key]
+        except KeyError:
+            if len(self._cell_cache) > 4096:
+                self._cell_cache.clear()
+            props = self._cell_cache[key] = build(*args)
+            return props
+
     def rgrowconfig(self, tv_column, cell_renderer, model, iter):
         if self.exiting:
             return
-            
-        self.rowconfig(tv_column, cell_renderer, model, iter)
-        cell_renderer.set_property("markup", " ")
-        if model.get_value(iter, 0)[0] != ">":
-            rg = model.get_value(iter, 7)
+
+        celltext = model.get_value(iter, 0)
+        rg = model.get_value(iter, 7)
+        key = ("rg", self._control_text(celltext), rg)
+        cell_renderer.set_properties(**self._cell_props(key,
+                        self._build_rgrow_props, model, iter, celltext, rg))
+
+    def _build_rgrow_props(self, model, iter, celltext, rg):
+        props = dict(self._row_props(model, iter, celltext))
+        props.pop("text", None)
+        props["markup"] = " "
+        if celltext[0] != ">":
             if rg is not None:
                 if rg == RGDEF:
                     # Red triangle.
-                    cell_renderer.set_property("markup",
-                                    '<span foreground="dark red">&#x25b5;</span>')
+                    props["markup"] = \
+                                '<span foreground="dark red">&#x25b5;</span>'
                 elif rg.endswith(" RG"):
                     # Small green bullet point.
-                    cell_renderer.set_property("markup",
-                                    '<span foreground="dark green">&#x2022;</span>')
+                    props["markup"] = \
+                                '<span foreground="dark green">&#x2022;</span>'
                 elif rg.endswith(" R128"):
                     # Small blue bullet point.
-                    cell_renderer.set_property("markup",
-                                    '<span foreground="dark blue">&#x2022;</span>')
+                    props["markup"] = \
+                                '<span foreground="dark blue">&#x2022;</span>'
+        return props
 
     def playtimerowconfig(self, tv_column, cell_renderer, model, iter):
         if self.exiting:
             return
+
+        celltext = model.get_value(iter, 0)
         playtime = model.get_value(iter, 2)
-        self.rowconfig(tv_column, cell_renderer, model, iter)
-        cell_renderer.set_property("xalign", 1.0)
+        key = ("playtime", self._control_text(celltext), playtime)
         if playtime == -11:
-            if model.get_value(iter, 0) == ">announcement":
+            key += (model.get_value(iter, 3),)
+        cell_renderer.set_properties(**self._cell_props(key,
+                        self._build_playtime_props, model, iter, celltext))
+
+    def _build_playtime_props(self, model, iter, celltext):
+        playtime = model.get_value(iter, 2)
+        props = dict(self._row_props(model, iter, celltext))
+        props.pop("markup", None)
+        props["xalign"] = 1.0
+        if playtime == -11:
+            if celltext == ">announcement":
                 length = model.get_value(iter, 3)[2:6]
                 if not length:
                     length = "0000"
                 if length == "0000":
-                    cell_renderer.set_property("text", "")
+                    props["text"] = ""
                 else:
                     if length[0] == "0":
                         length = " " + length[1] + ":" + length[2:]
                     else:
                         length = length[:2] + ":" + length[2:]
-                    cell_renderer.set_property("text", length)
+                    props["text"] = length
             else:
-                cell_renderer.set_property("text", "")
+                props["text"] = ""
         elif playtime == 0:
-            cell_renderer.set_property("text", "? : ??")
+            props["text"] = "? : ??"
         else:
             secs = playtime % 60
             playtime -= secs
             mins = playtime / 60
-            text = "%d:%02d" % (mins, secs)
-            cell_renderer.set_property("text", text)
+            props["text"] = "%d:%02d" % (mins, secs)
+        return props
 
     gray = gtk.gdk.color_parse("#BBB")
     # Class variable for use by rowconfig.
@@ -3890,63 +3977,86 @@ class IDJC_Media_Player:
     def rowconfig(self, tv_column, cell_renderer, model, iter):
         if self.exiting:
             return
-        crprop = cell_renderer.set_property
-        celltext = model.get_value(iter, 0)
+
+        cell_renderer.set_properties(**self._row_props(model, iter))
+
+    @staticmethod
+    def _control_text(celltext):
+        """The cell text of playlist controls else None for regular tracks."""
+
+        if celltext[0] == ">" or celltext[:4] == "<b>>":
+            return celltext
+        return None
+
+    def _row_props(self, model, iter, celltext=None):
+        if celltext is None:
+            celltext = model.get_value(iter, 0)
+        key = ("row", self._control_text(celltext))
+        if key[1] is not None and "announcement" in celltext:
+            key += (model.get_value(iter, 4),)
+        return self._cell_props(key, self._build_row_props, model, iter,
+                                                                    celltext)
+
+    def _build_row_props(self, model, iter, celltext):
+        props = {}
         if celltext[:4] == "<b>>":
             celltext = celltext[3:-4]
         if celltext[0] == ">":
-            crprop("xalign", 0.45)
-            crprop("ypad", 0)
-            crprop("scale", 0.75)
-            crprop("cell-background-set", True)
-            crprop("background-set", True)
-            crprop("foreground-set", True)
-            if self.pl_mode.get_active() == 0:
+            props["xalign"] = 0.45
+            props["ypad"] = 0
+            props["scale"] = 0.75
+            props["cell-background-set"] = True
+            props["background-set"] = True
+            props["foreground-set"] = True
+            if self._controls_active:
                 try:
                     properties = self.control_cell_properties[celltext]
                 except KeyError:
                     pass
                 else:
-                    for name, value in properties:
-                        crprop(name, value)
+                    props.update(properties)
 
                 if celltext == ">announcement":
-                    crprop("text", _('Announcement:') + " " + urllib.unquote(
-                                                    model.get_value(iter, 4)))
+                    props["text"] = _('Announcement:') + " " + urllib.unquote(
+                                                    model.get_value(iter, 4))
 
                 if celltext == ">transfer":
                     if self.playername == "left":
                         # TC: Playlist control.
-                        crprop("text", _('>>> Transfer across >>>'))
+                        props["text"] = _('>>> Transfer across >>>')
                     elif self.playername == "right":
                         # TC: Playlist control.
-                        crprop("text", _('<<< Transfer across <<<'))
+                        props["text"] = _('<<< Transfer across <<<')
                 
                 if celltext == ">crossfade":
                     if self.playername == "left":
                         # TC: Playlist control.
-                        crprop("text", _('>>> Fade across >>>'))
+                        props["text"] = _('>>> Fade across >>>')
                     elif self.playername == "right":
                         # TC: Playlist control.
-                        crprop("text", _('<<< Fade across <<<'))
+                        props["text"] = _('<<< Fade across <<<')
             else:
-                crprop("cell-background", "darkgray")
-                crprop("background", "darkgray")
-                crprop("foreground", "white")
+                props["cell-background"] = "darkgray"
+                props["background"] = "darkgray"
+                props["foreground"] = "white"
                 # TC: Playlist control.
-                crprop("markup", "<i>%s</i>" % _("Ignored playlist control"))
+                props["markup"] = "<i>%s</i>" % _("Ignored playlist control")
         else:
-            crprop("foreground-set", False)
-            crprop("cell-background-set", False)
-            crprop("background-set", False)
-            crprop("scale", 1.0)
-            crprop("xalign", 0.0)
-            crprop("ypad", 2)
+            props["foreground-set"] = False
+            props["cell-background-set"] = False
+            props["background-set"] = False
+            props["scale"] = 1.0
+            props["xalign"] = 0.0
+            props["ypad"] = 2
+        return props
 
     def cb_playlist_delay(self, widget):
         print("inter track fade was changed")
 
     def cb_playlist_mode(self, widget):
+        self._controls_active = widget.get_active() == 0
+        self._cell_cache.clear()
+        self.treeview.queue_draw()
         self.pl_delay.set_sensitive(self.pl_mode.get_active() in (0, 1, 2, 5))
         if widget.get_active() in (0, 3, 4):
             self.update_time_stats()
@@ -4052,6 +4162,8 @@ class IDJC_Media_Player:
             return
         self.playername = name
         self.exiting = False
+        self._cell_cache = {}
+        self._controls_active = False
         # A box for the Stop/Start/Pause widgets
         self.hbox1 = gtk.HBox(True, 0)
         self.hbox1.set_border_width(2)
@@ -4094,12 +4206,23 @@ class IDJC_Media_Player:
                                                             "ProgressPress")
         self.progressbar.connect("button_release_event", self.cb_event,
                                                             "ProgressRelease")
-        self.progressbox.pack_start(self.progressbar, True, True, 0)
+        vbox = gtk.VBox()
+        self.progressbox.pack_start(vbox, True, True, 0)
+        vbox.pack_start(self.progressbar, False, False, 0)
         self.progressbar.show()
         set_tip(self.progressbar, _('This slider acts as both a play progress '
                                     'indicator and as a means for seeking'
                                     ' within the currently playing track.'))
 
+        # The waveform of the playing track lined up with the seek bar.
+        self.waveform = WaveformOverview(self.progressbar)
+        self.waveform.connect("button_press_event", self.cb_event,
+                                                            "ProgressPress")
+        self.waveform.connect("button_release_event", self.cb_event,
+                                                            "ProgressRelease")
+        vbox.pack_start(self.waveform, True, True, 0)
+        vbox.show_all()
+
         # Finished filling the progress box so lets show it.
         self.progressbox.show()
 
@@ -4165,6 +4288,8 @@ class IDJC_Media_Player:
 
         self.liststore.connect("row-inserted", self.cb_playlist_changed)
         self.liststore.connect("row-deleted", self.cb_playlist_changed)
+        parent.track_analyser.connect(self._on_track_analysed)
+        self.random_selector = RandomSelector(self.liststore)
 
         self.scrolllist.add(self.treeview)
         self.treeview.show()
@@ -4343,6 +4468,7 @@ class IDJC_Media_Player:
             self.pl_mode.set_active(1)
         else:
             self.pl_mode.set_active(0)
+        self._controls_active = self.pl_mode.get_active() == 0
         self.pl_mode.connect("changed", self.cb_playlist_mode)
         set_tip(self.pl_mode, _("This sets the playlist mode which defines "
         "player behaviour after a track has finished playing.\n\n'Play All' is"
@@ -4773,6 +4899,7 @@ class IDJC_Media_Player:
         self.cuesheet_track_performer = None
         self.cuesheet_track_album = None
         self.gapless = False
+        self.analysis = None
         self.seek_file_valid = False
         self.digiprogress_type = 0
         self.digiprogress_f = 0
@@ -4785,6 +4912,7 @@ class IDJC_Media_Player:
         self.pbspeedfactor = 1.0
         self.playlist_changed = True
         self.alarm_cid = 0
+        self.prefetch_cid = 0
         self.playlist_todo = deque()
         self.no_more_files = False
         self.model_playing = None
@@ -0,0 +1,200 @@
+"""Persistent track play history.
+
+Records when each file was last played on air and keeps a time indexed log
+of played tracks in an SQLite database. The log may also be mirrored to a
+plain text file for people to read.
+"""
+
+#   Copyright (C) 2026 Stephen Fairchild (s-fairchild@users.sourceforge.net)
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 2 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program in the file entitled COPYING.
+#   If not, see <http://www.gnu.org/licenses/>.
+
+from __future__ import print_function
+
+__all__ = ["PlayHistory"]
+
+import os
+import time
+import pickle
+import sqlite3
+
+
+# Last played times older than this are not loaded into memory up front.
+RECENT = 2592000  # 30 days.
+
+# Queued log entries beyond which a write is forced.
+LOG_BATCH = 16
+
+
+class PlayedDict(dict):
+    """Mapping of pathname to time last played that tracks changes.
+
+    A dict for the benefit of fast lookups by the playlist code. It holds
+    the recent past and get refers anything else to lookup.
+    """
+
+    def __init__(self, lookup, *args, **kwds):
+        dict.__init__(self, *args, **kwds)
+        self.dirty = set()
+        self._lookup = lookup
+
+    def __setitem__(self, key, value):
+        dict.__setitem__(self, key, value)
+        self.dirty.add(key)
+
+    def get(self, key, default=None):
+        try:
+            return dict.__getitem__(self, key)
+        except KeyError:
+            return self._lookup(key) or default
+
+
+class PlayHistory(object):
+    """Play history store.
+
+    Last played times are held in memory for the recent past and written
+    back in batches. Older times are read from the database as needed. The
+    track log is appended to in batches and may be queried by time range.
+    """
+
+    _schema = """
+        CREATE TABLE IF NOT EXISTS played (
+            pathname TEXT PRIMARY KEY,
+            time REAL NOT NULL);
+        CREATE INDEX IF NOT EXISTS played_time ON played (time);
+        CREATE TABLE IF NOT EXISTS log (
+            id INTEGER PRIMARY KEY,
+            time REAL NOT NULL,
+            songname TEXT NOT NULL,
+            pathname TEXT NOT NULL);
+        CREATE INDEX IF NOT EXISTS log_time ON log (time);
+        CREATE INDEX IF NOT EXISTS log_pathname ON log (pathname);
+        CREATE TABLE IF NOT EXISTS meta (
+            key TEXT PRIMARY KEY,
+            value TEXT);
+        """
+
+    def __init__(self, pathname, text_log=None):
+        self._text_log = text_log
+        self._older = {}
+        self._conn = sqlite3.connect(pathname)
+        self._conn.text_factory = str
+        try:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+        except sqlite3.DatabaseError as e:
+            print("play history:", e)
+        with self._conn:
+            self._conn.executescript(self._schema)
+
+        self._log_queue = []
+        cursor = self._conn.execute(
+                "SELECT pathname, time FROM played WHERE time > ?",
+                (time.time() - RECENT,))
+        self.played = PlayedDict(self._stored_time, cursor)
+
+    def import_pickle(self, pathname):
+        """Absorb a legacy files_played pickle then delete it."""
+
+        try:
+            with open(pathname, "r") as f:
+                data = pickle.Unpickler(f).load()
+        except (IOError, EOFError, pickle.UnpicklingError):
+            return
+
+        for key, value in data.iteritems():
+            if value > self.played.get(key, 0):
+                self.played[key] = value
+        self.flush()
+        try:
+            os.remove(pathname)
+        except OSError:
+            pass
+
+    def log(self, songname, pathname, when=None):
+        """Add an entry to the played tracks log."""
+
+        if when is None:
+            when = time.time()
+        self._log_queue.append((when, songname, pathname or ""))
+        if len(self._log_queue) >= LOG_BATCH:
+            self.flush()
+
+    def flush(self):
+        """Write out pending changes in a single transaction."""
+
+        played = self.played
+        updates = [(k, played[k]) for k in played.dirty if k in played]
+        log_queue = self._log_queue
+        if not updates and not log_queue:
+            return
+
+        try:
+            with self._conn:
+                self._conn.executemany(
+                    "INSERT OR REPLACE INTO played VALUES (?, ?)", updates)
+                self._conn.executemany("INSERT INTO log (time, songname, "
+                                        "pathname) VALUES (?, ?, ?)", log_queue)
+        except sqlite3.Error as e:
+            print("play history write failed:", e)
+            return
+
+        played.dirty.clear()
+        if log_queue and self._text_log is not None:
+            try:
+                with open(self._text_log, "a") as f:
+                    f.writelines(time.strftime("%x %X :: ",
+                                    time.localtime(when)) + songname + "\n"
+                                    for when, songname, pathname in log_queue)
+            except IOError as e:
+                print("failed to write to", self._text_log, e)
+        del log_queue[:]
+
+    def last_played(self, pathname):
+        """Time last played or 0 if never."""
+
+        return self.played.get(pathname, 0)
+
+    def _stored_time(self, pathname):
+        # Times from before the recent past are looked up once.
+        try:
+            return self._older[pathname]
+        except KeyError:
+            row = self._conn.execute("SELECT time FROM played WHERE "
+                                    "pathname = ?", (pathname,)).fetchone()
+            when = self._older[pathname] = row[0] if row else 0
+            return when
+
+    def tracks(self, start=None, end=None):
+        """List of (time, songname, pathname) in play order for a period."""
+
+        self.flush()
+        return self._conn.execute("SELECT time, songname, pathname FROM log "
+                "WHERE time >= ? AND time < ? ORDER BY time",
+                (start or 0, end or float("inf"))).fetchall()
+
+    def get_meta(self, key, default=None):
+        row = self._conn.execute("SELECT value FROM meta WHERE key = ?",
+                                                            (key,)).fetchone()
+        return row[0] if row else default
+
+    def set_meta(self, key, value):
+        with self._conn:
+            self._conn.execute("INSERT OR REPLACE INTO meta VALUES (?, ?)",
+                                                                (key, value))
+
+    def close(self):
+        self.flush()
+        self._conn.close()
@@ -0,0 +1,326 @@
+"""Streaming playlist file readers and writers.
+
+The readers are generators that yield entries as soon as they are parsed so
+the caller can start work on the first entry without waiting on the rest of
+the file. The writers take any iterable of playlist rows. In neither case is
+the whole playlist held in memory.
+
+Run this module as a script for a benchmark over generated playlists.
+"""
+
+#   Copyright (C) 2026 Stephen Fairchild (s-fairchild@users.sourceforge.net)
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 2 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program in the file entitled COPYING.
+#   If not, see <http://www.gnu.org/licenses/>.
+
+from __future__ import print_function
+
+__all__ = ["BadPlaylist", "read_m3u", "read_pls", "read_xspf",
+                                    "write_m3u", "write_pls", "write_xspf"]
+
+import os
+import urllib
+from xml.sax.saxutils import escape, quoteattr
+try:
+    import xml.etree.cElementTree as ElementTree
+except ImportError:
+    import xml.etree.ElementTree as ElementTree
+
+
+XSPF_NS = "http://xspf.org/ns/0/"
+IDJC_NS = "http://idjc.sourceforge.net/ns/"
+
+# Playlist row column indices.
+FILENAME, LENGTH, META, TITLE, ARTIST, ALBUM = 1, 2, 3, 5, 6, 9
+
+
+class BadPlaylist(ValueError):
+    """The playlist file is malformed."""
+
+    pass
+
+
+def _file_url_to_path(url):
+    """Local pathname for a file:// URL or None for a remote host."""
+
+    host, abspathname = url[7:].split("/", 1)
+    if host not in ("", "localhost", "127.0.0.1", "::1"):
+        return None
+    return "/" + urllib.unquote(abspathname)
+
+
+def read_m3u(filename):
+    """Generate absolute pathnames from an m3u or m3u8 playlist."""
+
+    basepath = os.path.split(filename)[0] + "/"
+    with open(filename, "r") as f:
+        for line in f:
+            line = line.strip()
+            if not line or line[0] == "#":
+                continue
+            if line[0] != "/":
+                if line.startswith("file://"):
+                    line = _file_url_to_path(line)
+                    if line is None:
+                        continue
+                else:
+                    line = basepath + line
+            yield line
+
+
+def read_pls(filename):
+    """Generate pathnames from a version 2 pls playlist.
+
+    Entries are yielded in file order. Unlike a configuration file parser
+    this does not need NumberOfEntries or Version to appear first.
+    """
+
+    with open(filename, "r") as f:
+        section = None
+        for line in f:
+            line = line.strip()
+            if not line or line[0] in "#;":
+                continue
+            if line[0] == "[":
+                section = line[1:-1].strip().lower()
+                if section != "playlist":
+                    raise BadPlaylist("unexpected section: " + section)
+                continue
+            if section is None:
+                raise BadPlaylist("missing playlist section")
+            try:
+                key, value = line.split("=", 1)
+            except ValueError:
+                continue
+            key = key.strip().lower()
+            value = value.strip()
+            if key == "version":
+                if value != "2":
+                    raise BadPlaylist("can handle version 2 pls playlists only")
+            elif key.startswith("file") and key[4:].isdigit():
+                if value.startswith("file://"):
+                    value = _file_url_to_path(value)
+                    if value is None:
+                        continue
+                yield value
+
+
+def read_xspf(filename):
+    """Generate track entries from an xspf playlist.
+
+    Entries are of the form ("location", [pathname, ...]) where the
+    pathnames are alternative resolutions of the track's location URLs or
+    ("pld", {field: value}) for idjc literal playlist data such as playlist
+    controls. Parsed elements are discarded as soon as they have been
+    consumed so memory use does not grow with the playlist length.
+    """
+
+    def ns(tag):
+        return "{%s}%s" % (XSPF_NS, tag)
+
+    def append_baseurl(fname):
+        baseurl.append(u"file://" + urllib.quote(os.path.split(
+                                    fname)[0].decode("ASCII") + u"/"))
+
+    baseurl = []
+    for each in (os.path.realpath(filename), filename):
+        append_baseurl(each)
+    if baseurl[-1] == baseurl[-2]:
+        del baseurl[-1]
+
+    stack = []
+    track_lists = 0
+    try:
+        for event, elem in ElementTree.iterparse(filename, ("start", "end")):
+            if event == "start":
+                stack.append(elem)
+                if len(stack) == 1:
+                    if elem.tag != ns("playlist"):
+                        raise BadPlaylist("not an xspf playlist")
+                    try:
+                        v = int(elem.get("version"))
+                    except (TypeError, ValueError):
+                        raise BadPlaylist("bad xspf version")
+                    if v < 0 or v > 1:
+                        raise BadPlaylist(
+                                "only xspf playlist versions 0 and 1 supported")
+                elif elem.tag == ns("trackList"):
+                    track_lists += 1
+                    if len(stack) != 2 or track_lists > 1:
+                        raise BadPlaylist("misplaced trackList")
+                elif elem.tag == ns("track") and \
+                                        stack[-2].tag != ns("trackList"):
+                    raise BadPlaylist("misplaced track")
+                continue
+
+            stack.pop()
+            if len(stack) == 2 and elem.tag == ns("track"):
+                entry = _xspf_track(elem, baseurl, ns)
+                # Only the track just parsed is present to be removed.
+                stack[-1].remove(elem)
+                if entry is not None:
+                    yield entry
+            elif len(stack) == 1 and elem.tag != ns("trackList"):
+                if elem.tag == ns("location"):
+                    # A playlist base URL which takes precedence.
+                    url = (elem.text or u"").strip()
+                    if url.startswith(u"file:///"):
+                        baseurl.insert(0, url)
+                stack[-1].remove(elem)
+    except SyntaxError as e:
+        # ElementTree.ParseError derives from SyntaxError.
+        raise BadPlaylist(str(e))
+
+
+def _xspf_track(track, baseurl, ns):
+    locations = []
+    for location in track.findall(ns("location")):
+        text = (location.text or u"").strip()
+        for base in baseurl:
+            try:
+                locations.append(urllib.unquote(urllib.basejoin(base,
+                                                    text).encode("ASCII")))
+            except UnicodeError:
+                pass
+    if locations:
+        return "location", locations
+
+    for extension in track.findall(ns("extension")):
+        if extension.get("application") == IDJC_NS:
+            for tag in extension.findall("{%s}pld" % IDJC_NS):
+                return "pld", dict((k, v.encode("UTF-8")
+                            if isinstance(v, unicode) else v)
+                            for k, v in tag.attrib.iteritems())
+    return None
+
+
+def write_m3u(h, rows, proc=lambda x: x):
+    """Write an m3u playlist from rows of playlist data.
+
+    proc: conversion to apply to the track meta text.
+    """
+
+    h.write("#EXTM3U\r\n")
+    for each in rows:
+        h.write("#EXTINF:%d,%s\r\n" % (each[LENGTH], proc(each[META])))
+        h.write("file://" + urllib.quote(each[FILENAME]) + "\r\n")
+
+
+def write_pls(h, rows):
+    """Write a version 2 pls playlist from rows of playlist data.
+
+    The entry count follows the entries so the rows need not be counted
+    in advance.
+    """
+
+    h.write("[playlist]\r\n\r\n")
+    i = 0
+    for i, each in enumerate(rows, 1):
+        h.write("File%d=%s\r\n" % (i, each[FILENAME]))
+        h.write("Title%d=%s\r\n" % (i, each[META]))
+        h.write("Length%d=%d\r\n\r\n" % (i, each[LENGTH]))
+    h.write("NumberOfEntries=%d\r\nVersion=2\r\n" % i)
+
+
+def write_xspf(h, rows, fields=None):
+    """Write an xspf playlist from rows of playlist data.
+
+    Rows with meta beginning ">" are playlist controls and their scalar
+    values are recorded literally as attributes of an idjc:pld tag. fields
+    are the names of the row columns for that purpose.
+    """
+
+    w = h.write
+    w('<?xml version="1.0" encoding="UTF-8"?>\r\n'
+      '<playlist version="1" xmlns="%s" xmlns:idjc="%s">\r\n'
+      '  <trackList>\r\n' % (XSPF_NS, IDJC_NS))
+
+    for each in rows:
+        w("    <track>\r\n")
+        if each[0].startswith(">"):
+            attrs = " ".join("%s=%s" % (k, quoteattr(str(v)))
+                    for k, v in zip(fields, each)
+                    if isinstance(v, (str, int, float)))
+            w('      <extension application="%s">\r\n'
+              '        <idjc:pld %s/>\r\n'
+              '      </extension>\r\n' % (IDJC_NS, attrs))
+        else:
+            w("      <location>%s</location>\r\n" % escape(
+                                    "file://" + urllib.quote(each[FILENAME])))
+            for tag, col in (("creator", ARTIST), ("title", TITLE),
+                                                        ("album", ALBUM)):
+                if each[col]:
+                    w("      <%s>%s</%s>\r\n" % (tag, escape(each[col]), tag))
+            w("      <duration>%d</duration>\r\n" % (each[LENGTH] * 1000))
+        w("    </track>\r\n")
+
+    w("  </trackList>\r\n</playlist>\r\n")
+
+
+def _benchmark(entries=100000):
+    """Time reading and writing generated playlists of each type."""
+
+    import time
+    import shutil
+    import tempfile
+    import resource
+
+    fields = ("rsmeta", "filename", "length", "meta", "encoding", "title",
+                    "artist", "replaygain", "cuesheet", "album", "uuid")
+
+    def rows():
+        for i in xrange(entries):
+            if i % 100 == 99:
+                yield (">fade5", "", -11, "", "latin1", "", "", "", None,
+                                                                    "", "")
+            else:
+                name = "Artist %d - Title & Co %d" % (i % 997, i)
+                yield (name, "/music/library/%05d/track %d.ogg" % (i % 1000, i),
+                        180 + i % 240, name, "utf-8", "Title & Co %d" % i,
+                        "Artist %d" % (i % 997), "-3.2 RG", None, "Album", "")
+
+    def maxrss():
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss // 1024
+
+    tempdir = tempfile.mkdtemp()
+    try:
+        for ext, writer, reader in (
+                    ("m3u", write_m3u, read_m3u),
+                    ("pls", write_pls, read_pls),
+                    ("xspf", lambda h, r: write_xspf(h, r, fields), read_xspf)):
+            pathname = os.path.join(tempdir, "bench." + ext)
+            if ext != "xspf":
+                data = (x for x in rows() if x[0][0] != ">")
+            else:
+                data = rows()
+            t0 = time.time()
+            with open(pathname, "w") as h:
+                writer(h, data)
+            t1 = time.time()
+            gen = reader(pathname)
+            gen.next()
+            t2 = time.time()
+            count = 1 + sum(1 for x in gen)
+            t3 = time.time()
+            print("%-4s %d entries, %d kB: write %.3fs, first entry %.4fs, "
+                    "read %.3fs, max rss %d MB" % (ext, count,
+                    os.path.getsize(pathname) // 1024, t1 - t0, t2 - t1,
+                    t3 - t1, maxrss()))
+    finally:
+        shutil.rmtree(tempdir)
+
+
+if __name__ == "__main__":
+    import sys
+    _benchmark(*(int(x) for x in sys.argv[1:2]))
@@ -27,6 +27,7 @@ import tempfile
 import time
 import math
 import fcntl
+import pickle
 import re
 import glob
 import uuid
@@ -59,7 +60,7 @@ default = "default"
 
 # Regular expressions of files to copy when cloning a profile.
 config_files = ("config", "controls", "left_session", "main_session",
-    "main_session_files_played", "playerdefaults",
+    "history\\.db(-wal)?", "playerdefaults",
     "right_session", "interlude_session", "effects[12]_session", "s_data",
     "ports-.+-.+")
 
@@ -180,6 +181,19 @@ class ArgumentParserImplementation(object):
                         dest="no_default_jack_connections", action="store_true",
                 help=_('No JACK ports will be connected except those listed in'
                 ' the session file.'))
+        sp_run.add_argument("--profile-startup", dest="profile_startup",
+                nargs=1,
+                # TC: command line help placeholder.
+                metavar=_("report_pathname"),
+                help=_("time module imports and object construction up to "
+                "the point the user interface is ready and write a report"))
+        sp_run.add_argument("--callback-stats", dest="callback_stats",
+                nargs=1, type=int,
+                # TC: command line help placeholder.
+                metavar=_("seconds"),
+                help=_("time the main loop callbacks and print a report at "
+                "this interval -- zero for no reports, in which case the "
+                "statistics are still available over DBus"))
 
         group = sp_run.add_argument_group(_("user interface settings"))
         group.add_argument("-c", "--channels", dest="channels", nargs="+",
@@ -279,7 +293,7 @@ class DBusUptimeReporter(dbus.service.Object):
 
     def __init__(self):
         self._uptime_cache = defaultdict(float)
-        self._interface_cache = {}
+        self._in_flight = set()
         # Defer base class initialisation.
 
 
@@ -295,53 +309,123 @@ class DBusUptimeReporter(dbus.service.Object):
         dbus.service.Object.__init__(self, bus_name, self.obj_path)
 
 
-    def get_uptime_for_profile(self, profile):
-        """Ask and return the uptime of an active profile.
+    def get_uptimes(self, profiles, timeout=2.0):
+        """Ask for and return the uptimes of a number of active profiles.
 
-        Step 1, Issue an async request for new data.
-        Step 2, Return immediately with the cached value.
+        All the requests are issued at once without first resolving the
+        bus name owners. With an event loop running the cached values
+        are returned immediately and the replies update the cache.
 
-        Note: On error the cache is purged.
+        Note: On error the cache entry is purged.
 
-        Supports synchronous mode in the absence of an event loop.
+        Supports synchronous mode in the absence of an event loop in which
+        case the replies are awaited for at most timeout seconds.
         """
 
+        bus = dbus.SessionBus()
+        loop = None if glib.main_depth() else glib.MainLoop()
 
-        def rh(retval):
-            self._uptime_cache[profile] = retval
+        def done(profile):
+            self._in_flight.discard(profile)
+            if loop is not None and not self._in_flight:
+                loop.quit()
 
+        def rh(profile):
+            def inner(retval):
+                self._uptime_cache[profile] = retval
+                done(profile)
+            return inner
 
-        def eh(exception):
-            try:
-                del self._uptime_cache[profile]
-            except KeyError:
-                pass
-            try:
-                del self._interface_cache[profile]
-            except KeyError:
-                pass
+        def eh(profile):
+            def inner(exception):
+                try:
+                    del self._uptime_cache[profile]
+                except KeyError:
+                    pass
+                done(profile)
+            return inner
+
+        for profile in profiles:
+            if profile not in self._in_flight:
+                self._in_flight.add(profile)
+                bus.call_async(PGlobs.dbus_bus_basename + "." + profile,
+                        self.obj_path, self.interface_name, "get_uptime",
+                        "", (), rh(profile), eh(profile), timeout=timeout)
+
+        if loop is not None and self._in_flight:
+            source_id = glib.timeout_add(int(timeout * 1000), loop.quit)
+            loop.run()
+            glib.source_remove(source_id)
+            self._in_flight.clear()
+
+        return dict((x, self._uptime_cache[x]) for x in profiles)
+
+
+
+class ProfileIndex(object):
+    """On-disk cache of the optional files of each profile.
+
+    An entry is read again only when the modification time of the
+    profile directory or of one of its optional files has changed.
+    """
+
+
+    pathname = PGlobs.config_dir / "profile-index"
 
 
+    def __init__(self, optionals):
+        self._optionals = optionals
+        self._dirty = False
         try:
-            interface = self._interface_cache[profile]
-        except KeyError:
+            with open(self.pathname, "rb") as f:
+                self._entries = pickle.load(f)
+        except Exception:
+            self._entries = {}
+
+
+    def get(self, profname):
+        """A dict of optional file contents for the profile."""
+
+        d = PGlobs.profile_dir / profname
+        stamp = []
+        for each in ("",) + self._optionals:
             try:
-                p = dbus.SessionBus().get_object(PGlobs.dbus_bus_basename + \
-                                                "." + profile, self.obj_path)
-                interface = dbus.Interface(p, self.interface_name)
-            except dbus.exceptions.DBusException as e:
-                eh(e)
-                return self._uptime_cache.default_factory()
-
-            self._interface_cache[profile] = interface
-
-        if glib.main_depth():
-            # asynchronous: more CPU efficient but requires event loop
-            interface.get_uptime(reply_handler=rh, error_handler=eh)
-            return self._uptime_cache[profile]
+                stamp.append(os.stat(d / each).st_mtime)
+            except OSError:
+                stamp.append(None)
+
+        entry = self._entries.get(profname)
+        if entry is None or entry[0] != stamp:
+            data = {}
+            for each in self._optionals:
+                try:
+                    with open(d / each) as f:
+                        data[each] = f.read()
+                except EnvironmentError:
+                    data[each] = None
+            entry = self._entries[profname] = (stamp, data)
+            self._dirty = True
+        return dict(entry[1])
+
+
+    def save(self, profiles):
+        """Write out the index keeping only the named profiles."""
+
+        for each in set(self._entries).difference(profiles):
+            del self._entries[each]
+            self._dirty = True
+        if not self._dirty:
+            return
+
+        # The index is just a cache so failure to save is not critical.
+        try:
+            with open(self.pathname + ".tmp", "wb") as f:
+                pickle.dump(self._entries, f, pickle.HIGHEST_PROTOCOL)
+            os.rename(self.pathname + ".tmp", self.pathname)
+        except EnvironmentError:
+            pass
         else:
-            # synchronous
-            return interface.get_uptime()
+            self._dirty = False
 
 
 
@@ -396,6 +480,7 @@ class ProfileManager(object):
 
 
     _profile = _dbus_bus_name = _profile_dialog = _init_time = None
+    _profile_index = None
     _iconpathname = PGlobs.default_icon
 
     _textoptionals = ("nickname", "description")
@@ -966,22 +1051,24 @@ class ProfileManager(object):
             profdirs = os.walk(d).next()[1]
         except (EnvironmentError, StopIteration):
             return
+        profdirs = [x for x in profdirs if profile_name_valid(x)]
+
+        if self._profile_index is None:
+            self._profile_index = ProfileIndex(self._optionals)
+        busbase = PGlobs.dbus_bus_basename + "."
+        # One bus round trip in place of one per profile.
+        owned = set(dbus.SessionBus().list_names())
+        active = [x for x in profdirs if busbase + x in owned]
+        uptimes = self._uprep.get_uptimes(active)
+
         for profname in profdirs:
-            if profile_name_valid(profname):
-                files = os.walk(d / profname).next()[2]
-                rslt = {"profile": profname}
-                for each in self._optionals:
-                    try:
-                        with open(d / profname / each) as f:
-                            rslt[each] = f.read()
-                    except EnvironmentError:
-                        rslt[each] = None
-
-                rslt["active"] = self._profile_has_owner(profname)
-                rslt["uptime"] = math.floor(self._uprep.get_uptime_for_profile(
-                                                                    profname))
-                rslt["auto"] = (1 if a == profname else 0)
-                yield rslt
+            rslt = self._profile_index.get(profname)
+            rslt["profile"] = profname
+            rslt["active"] = profname in uptimes
+            rslt["uptime"] = math.floor(uptimes.get(profname, 0.0))
+            rslt["auto"] = (1 if a == profname else 0)
+            yield rslt
+        self._profile_index.save(profdirs)
 
 
     def _ls(self):
@@ -992,8 +1079,10 @@ class ProfileManager(object):
             row.append("*" if pd["auto"] else " ")
             row.append(str(datetime.timedelta(seconds=pd["uptime"])))
             for each in self._textoptionals:
-                row.append(self._grab_profile_filetext(pd["profile"], each) or
-                                                                        "\b")
+                text = pd[each]
+                if text is not None:
+                    text = text.partition("\n")[0].strip()
+                row.append(text or "\b")
             table.append(row)
 
         for row in sorted(table):
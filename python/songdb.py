@@ -35,19 +35,19 @@ import glib
 import gobject
 import pango
 import gtk
-try:
-    import MySQLdb as sql
-except ImportError:
-    have_songdb = False
-else:
-    have_songdb = True
 
 from idjc import FGlobs
+from .utils import LazyModule
 from .tooltips import set_tip
 from .gtkstuff import threadslock, gdklock, DefaultEntry, NotebookSR
 from .gtkstuff import idle_add, timeout_add, source_remove
 
 
+# MySQLdb is imported on first use of the database.
+sql = LazyModule("MySQLdb")
+have_songdb = sql.available
+
+
 __all__ = ['MediaPane', 'have_songdb']
 
 AMPACHE = "Ampache"
@@ -26,16 +26,18 @@ import fcntl
 import subprocess
 import urllib
 import urllib2
+import httplib
 import base64
 import gettext
 import traceback
 import datetime
 import xml.dom.minidom as mdom
 import xml.etree.ElementTree
+import xml.etree.cElementTree
 import ctypes
 from collections import namedtuple
-from threading import Thread
-from contextlib import closing
+from threading import Thread, Lock
+from Queue import Queue
 
 import dbus
 import pango
@@ -46,7 +48,7 @@ from idjc import FGlobs, PGlobs
 from .utils import string_multireplace
 from .gtkstuff import DefaultEntry, threadslock, HistoryEntry
 from .gtkstuff import WindowSizeTracker, FolderChooserButton
-from .gtkstuff import timeout_add, source_remove
+from .gtkstuff import timeout_add, source_remove, frame_clock
 from .dialogs import *
 from .irc import IRCPane
 from .format import FormatControl, FormatCodecMPEG
@@ -366,102 +368,265 @@ class ConnectionDialog(gtk.Dialog):
             chooser.unselect_all()
 
 
-class StatsThread(Thread):
-    def __init__(self, d):
-        Thread.__init__(self)
-        self.is_shoutcast = d["server_type"] % 2
-        self.host = d["host"]
-        self.port = d["port"]
-        self.mount = d["mount"]
-        if self.is_shoutcast:
-            self.login = "admin"
-        else:
-            self.login = d["login"]
-        self.passwd = d["password"]
-        self.listeners = -2         # preset error code for failed/timeout
-        self.url = "http://%s:%d%s" % (self.host, self.port, self.mount)
+class StatsPoller(object):
+    """Listener statistics collection shared by all stream tabs.
 
+    Requests are grouped by server so that one worker makes a single request
+    over a persistent connection for all the mounts on a host where the
+    server allows it. A fixed set of worker threads does the network
+    activity so hung servers cannot cause threads to pile up. A server
+    that fails is left alone for increasing amounts of time.
+    """
 
-    def run(self):
-        class BadXML(ValueError):
-            pass
-        class GoodXML(Exception):
-            pass
-        
-        hostport = "%s:%d" % (self.host, self.port)
-        if self.is_shoutcast:
-            stats_url = "http://%s/admin.cgi?mode=viewxml" % hostport
-            realm = "Shoutcast Server"
-        else:
-            stats_url = "http://%s/admin/listclients?mount=%s" % (
-                                                        hostport, self.mount)
-            realm = "Icecast2 Server"
-        auth_handler = urllib2.HTTPBasicAuthHandler()
-        auth_handler.add_password(realm, hostport, self.login, self.passwd)
-        opener = urllib2.build_opener(auth_handler)
-        opener.addheaders = [('User-agent', 'Mozilla/5.0')]
+    workers = 4
+    timeout = 5.0
+    backoff_max = 600.0
 
-        try:
-            # Logged in method works with Shoutcast 1 and Icecast 2.
+    class _Host(object):
+        def __init__(self):
+            self.mounts = {}        # mount: (login, password)
+            self.busy = False
+            self.failures = 0
+            self.retry_time = 0.0
+            self.connection = None
+            self.all_mounts_auth = None
+
+    def __init__(self):
+        self._lock = Lock()
+        self._queue = Queue()
+        self._hosts = {}
+        self._results = {}
+        self._threads = []
+
+    def poll(self, d):
+        """Request fresh stats for the server described by dict d."""
+
+        is_shoutcast = d["server_type"] % 2
+        hostkey = (d["host"], d["port"], is_shoutcast)
+        login = "admin" if is_shoutcast else d["login"]
+        with self._lock:
+            host = self._hosts.get(hostkey)
+            if host is None:
+                host = self._hosts[hostkey] = self._Host()
+            host.mounts[d["mount"]] = (login, d["password"])
+            if host.busy or time.time() < host.retry_time:
+                return
+            host.busy = True
+
+        if not self._threads:
+            for i in xrange(self.workers):
+                thread = Thread(target=self._worker)
+                thread.daemon = True
+                thread.start()
+                self._threads.append(thread)
+        self._queue.put(hostkey)
+
+    def listeners(self, d):
+        """Last known listener count or -2 for failed/timeout."""
+
+        hostkey = (d["host"], d["port"], d["server_type"] % 2)
+        with self._lock:
+            return self._results.get((hostkey, d["mount"]), -2)
+
+    def _worker(self):
+        while 1:
+            hostkey = self._queue.get()
+            with self._lock:
+                host = self._hosts[hostkey]
+                mounts = dict(host.mounts)
+                host.mounts.clear()
             try:
-                with closing(opener.open(stats_url)) as h:
-                    data = h.read()
-            except IOError:
-                if self.is_shoutcast:
-                    # Shoutcast 2 servers don't require a login.
-                    with closing(urllib2.urlopen("http://%s/statistics" %
-                                                            hostport)) as h:
-                        data = h.read()
+                if hostkey[2]:
+                    results = self._shoutcast(hostkey, host, mounts)
                 else:
-                    raise
-        except IOError:
-            print("failed to obtain server stats data for", self.url)
-            return
+                    results = self._icecast(hostkey, host, mounts)
+            except Exception as e:
+                print("failed to obtain server stats data for "
+                                                "%s:%d" % hostkey[:2], e)
+                if host.connection is not None:
+                    host.connection.close()
+                    host.connection = None
+                results = dict.fromkeys(mounts, -2)
+                host.failures += 1
+                delay = min(self.backoff_max, 5.0 * 2 ** host.failures)
+            else:
+                host.failures = 0
+                delay = 0.0
+
+            with self._lock:
+                for mount, listeners in results.iteritems():
+                    self._results[(hostkey, mount)] = listeners
+                host.retry_time = time.time() + delay
+                host.busy = False
+
+    def _get(self, hostkey, host, path, auth=None):
+        """Stream parse the XML at path using a keep-alive connection.
+
+        Returns an iterparse generator or None for a refused login.
+        """
+
+        if host.connection is None:
+            host.connection = httplib.HTTPConnection(hostkey[0], hostkey[1],
+                                                        timeout=self.timeout)
+        headers = {"User-Agent": "Mozilla/5.0"}
+        if auth is not None:
+            headers["Authorization"] = "Basic " + base64.b64encode(
+                                                                "%s:%s" % auth)
+        host.connection.request("GET", path, headers=headers)
+        response = host.connection.getresponse()
+        if response.status in (401, 403):
+            response.read()
+            return None
+        if response.status != 200:
+            response.read()
+            raise IOError("HTTP status %d" % response.status)
+        return self._drain(xml.etree.cElementTree.iterparse(response,
+                                                ("start", "end")), response)
 
-        try:
-            dom = mdom.parseString(data)
-        except Exception as e:
-            print("server stats data is not valid xml: %s" % e)
-            return
+    @staticmethod
+    def _drain(events, response):
+        for event_elem in events:
+            yield event_elem
+        # Leave the connection ready for reuse.
+        response.read()
+
+    def _shoutcast(self, hostkey, host, mounts):
+        listeners = -2
+        for path, auth in (("/admin.cgi?mode=viewxml", ("admin",
+                                    mounts.values()[0][1])), ("/statistics",
+                                    None)):
+            # Logged in method works with Shoutcast 1. Shoutcast 2 servers
+            # don't require a login.
+            elems = self._get(hostkey, host, path, auth)
+            if elems is None:
+                continue
+            for event, elem in elems:
+                if event == "end":
+                    if elem.tag == "CURRENTLISTENERS" and listeners == -2:
+                        listeners = int(elem.text.strip())
+                    elem.clear()
+            if listeners != -2:
+                break
+        else:
+            raise IOError("login refused")
+        print("server %s:%d has %d listeners" % (hostkey[:2] + (listeners,)))
+        return dict.fromkeys(mounts, listeners)
+
+    def _icecast(self, hostkey, host, mounts):
+        def parse(elems, wanted):
+            mount = count = None
+            for event, elem in elems:
+                if elem.tag == "source":
+                    if event == "start":
+                        mount = elem.get("mount")
+                    else:
+                        if mount in wanted and count is not None:
+                            results[mount] = count
+                        mount = count = None
+                        elem.clear()
+                elif event == "end" and mount is not None and \
+                                            elem.tag.lower() == "listeners":
+                    count = int(elem.text.strip())
+
+        results = {}
+        # One request for every mount on the server when the credentials of
+        # any mount are good enough.
+        auths = set(mounts.itervalues())
+        if host.all_mounts_auth is not False:
+            if host.all_mounts_auth in auths:
+                auths.remove(host.all_mounts_auth)
+                auths = [host.all_mounts_auth] + list(auths)
+            for auth in auths:
+                elems = self._get(hostkey, host, "/admin/stats", auth)
+                if elems is not None:
+                    host.all_mounts_auth = auth
+                    parse(elems, mounts)
+                    break
+            else:
+                host.all_mounts_auth = False
+
+        # Otherwise a request per mount but on the same connection.
+        for mount, auth in mounts.iteritems():
+            if mount not in results and host.all_mounts_auth is False:
+                elems = self._get(hostkey, host, "/admin/listclients?mount=" +
+                                                    urllib.quote(mount), auth)
+                if elems is None:
+                    raise IOError("login refused for " + mount)
+                parse(elems, (mount,))
+
+        for mount in mounts:
+            listeners = results.setdefault(mount, -2)
+            print("server %s:%d%s has %d listeners" % (hostkey[:2] +
+                                                        (mount, listeners)))
+        return results
+
+
+class MetadataDispatcher(object):
+    """Delivery of song metadata updates to encoders and IRC.
+
+    Updates arriving within a short window of one another are merged so
+    that only the last is sent. Each destination is then updated no more
+    often than its minimum interval allows. An update that has to wait
+    replaces any older one still waiting for the same destination.
+    """
 
-        try:
-            if self.is_shoutcast:
-                if dom.documentElement.tagName == u'SHOUTCASTSERVER':
-                    shoutcastserver = dom.documentElement
-                else:
-                    raise BadXML
-                currentlisteners = shoutcastserver.getElementsByTagName(
-                                                            'CURRENTLISTENERS')
-                try:
-                    self.listeners = int(currentlisteners[
-                                                0].firstChild.wholeText.strip())
-                except:
-                    raise BadXML
-                else:
-                    raise GoodXML
+    window = 250                # Milliseconds.
+    encoder_interval = 2.0      # Seconds.
+    irc_interval = 5.0
+
+    def __init__(self, apply_song, destinations):
+        """apply_song: called with the song metadata once per batch.
+        destinations: returns (key, min_interval, deliver) for each
+            destination where deliver takes the song metadata.
+        """
+
+        self._apply_song = apply_song
+        self._destinations = destinations
+        self._pending = None
+        self._window_timeout = None
+        self._last_sent = {}
+        self._deferred = {}     # key: [timeout, deliver, meta]
+        self.counters = dict.fromkeys(("submitted", "merged", "batches",
+                                                    "sent", "dropped"), 0)
+
+    def submit(self, meta):
+        """Queue song metadata for delivery."""
+
+        self.counters["submitted"] += 1
+        if self._pending is not None:
+            self.counters["merged"] += 1
+        self._pending = meta
+        if self._window_timeout is None:
+            self._window_timeout = timeout_add(self.window, self._on_window)
+
+    def _on_window(self):
+        self._window_timeout = None
+        meta = self._pending
+        self._pending = None
+        self.counters["batches"] += 1
+        self._apply_song(meta)
+        now = time.time()
+        for key, interval, deliver in self._destinations():
+            wait = self._last_sent.get(key, 0.0) + interval - now
+            if wait <= 0.0 and key not in self._deferred:
+                self._deliver(key, deliver, meta)
+            elif key in self._deferred:
+                self.counters["dropped"] += 1
+                self._deferred[key][1:] = deliver, meta
             else:
-                
-                if dom.documentElement.tagName == u'icestats':
-                    icestats = dom.documentElement
-                else:
-                    raise BadXML
-                for child in icestats.childNodes:
-                    if child.nodeName == u'source':
-                        if child.getAttribute('mount') == self.mount:
-                            for child in child.childNodes:
-                                if child.nodeName.lower() == u'listeners':
-                                    self.listeners = int(
-                                            child.firstChild.wholeText.strip())
-                                    raise GoodXML
-                else:
-                    raise BadXML                
+                self._deferred[key] = [timeout_add(int(wait * 1000) + 1,
+                                    self._on_deferred, key), deliver, meta]
+        return False
+
+    def _on_deferred(self, key):
+        timeout, deliver, meta = self._deferred.pop(key)
+        self._deliver(key, deliver, meta)
+        return False
 
-        except GoodXML:
-            print("server", self.url, "has", self.listeners, "listeners")
-        except BadXML:
-            print("unexpected to parse server stats XML file")
-        finally:
-            dom.unlink()
+    def _deliver(self, key, deliver, meta):
+        self._last_sent[key] = time.time()
+        self.counters["sent"] += 1
+        deliver(meta)
 
 
 class ActionTimer(object):
@@ -675,24 +840,24 @@ class ConnectionPane(gtk.VBox):
                     ap = self.tab.admin_password_entry.get_text().strip()
                     if ap:
                         d["password"] = ap
-                stats_thread = StatsThread(d)
-                stats_thread.start()
+                self.tab.scg.stats_poller.poll(d)
                 ref = gtk.TreeRowReference(self.liststore, i)
-                self.stats_rows.append((ref, stats_thread))
+                self.stats_rows.append((ref, d))
             else:
                 row[5] = -1      # sets listeners text to 'unknown'
 
     def stats_collate(self):
         count = 0
-        for ref, thread in self.stats_rows:
+        for ref, d in self.stats_rows:
             if ref.valid() == False:
-                print("stats_collate:", thread.url, 
-                      "invalidated by its removal from the stats list")
+                print("stats_collate: %s:%d%s" % (d["host"], d["port"],
+                    d["mount"]), "invalidated by its removal from the stats list")
                 continue
+            listeners = self.tab.scg.stats_poller.listeners(d)
             row = ref.get_model()[ref.get_path()[0]]
-            row[5] = thread.listeners
-            if thread.listeners > 0:
-                count += thread.listeners
+            row[5] = listeners
+            if listeners > 0:
+                count += listeners
         self.listeners_display.set_text(str(count))
         self.listeners = count
 
@@ -1081,6 +1246,15 @@ class Tab(gtk.VBox):
     def receive(self):
         return self.source_client_gui.receive()
 
+    @staticmethod
+    def needed_at_startup(settings):
+        """Whether saved settings call for the tab to be built right away.
+
+        settings: dict of the tab's saved session values.
+        """
+
+        return False
+
     def __init__(self, scg, numeric_id, indicator_lookup):
         self.indicator_lookup = indicator_lookup
         self.numeric_id = numeric_id
@@ -1176,6 +1350,15 @@ class Troubleshooting(gtk.VBox):
 
 
 class StreamTab(Tab):
+    tab_type = "streamer"
+
+    @staticmethod
+    def needed_at_startup(settings):
+        # Timers and IRC bots work without the tab being shown.
+        return settings.get("timer_start_active") == "1" or \
+                settings.get("timer_stop_active") == "1" or \
+                IRCPane.has_active_servers(settings.get("irc_data", ""))
+
     def make_combo_box(self, items):
         combobox = gtk.combo_box_new_text()
         for each in items:
@@ -1370,7 +1553,7 @@ class StreamTab(Tab):
                     proc = self.get_utf8_text
 
             self.connection_string = "\n".join((
-                    "stream_source=" + str(self.numeric_id),
+                    "stream_source=" + str(self.encoder_id),
                     "server_type=" + (
                     "Icecast 2", "Shoutcast")[d["server_type"]],
                     "host=" + d["host"],
@@ -1426,17 +1609,72 @@ class StreamTab(Tab):
             self.start_stop_encoder(ENCODER_STOP)
 
     def start_stop_encoder(self, command):
-        """Reference counting starter and stopper for the encoder."""
+        """Reference counting starter and stopper for the encoder.
+
+        When another stream tab is already running an encoder with the same
+        settings that encoder is used rather than starting a second one.
+        """
                 
         if command == ENCODER_START:
-            if not self.format_control.running:
+            if not self._encoder_users:
+                if self.format_control.running:
+                    self.encoder_host = self
+                else:
+                    self.encoder_host = self._find_shared_encoder() or self
+                    if self.encoder_host is not self:
+                        self._set_encoder_controls_sensitive(False)
+                        print("stream tab %d sharing the encoder of tab %d" % (
+                            self.numeric_id, self.encoder_host.numeric_id))
+            self._encoder_users += 1
+
+            host = self.encoder_host
+            if not host.format_control.running:
                 # Custom metadata encoding may have been changed.
-                self.metadata_update.clicked()
+                host.metadata_update.clicked()
 
             # Must run this to bump reference counter regardless of if running.
-            self.format_control.start_encoder_rc()
+            host.format_control.start_encoder_rc()
         elif command == ENCODER_STOP:
-            self.format_control.stop_encoder_rc()
+            if self._encoder_users:
+                self.encoder_host.format_control.stop_encoder_rc()
+                self._encoder_users -= 1
+                if not self._encoder_users:
+                    self.encoder_host = None
+                    self._set_encoder_controls_sensitive(True)
+
+    def _set_encoder_controls_sensitive(self, sensitive):
+        """Lock what would change the output of a borrowed encoder."""
+
+        for each in (self.format_control, self.metadata,
+                                self.metadata_fallback, self.metadata_update):
+            each.set_sensitive(sensitive)
+
+    @property
+    def encoder_id(self):
+        """The numeric id of the encoder in use by this tab."""
+
+        return (self.encoder_host or self).numeric_id
+
+    def _encoder_key(self):
+        """Everything that determines the encoder output of this tab."""
+
+        if not self.format_control.finalised:
+            return None
+        return (sorted(self.format_control.get_settings().iteritems()),
+                self.metadata.get_text().strip(),
+                self.metadata_fallback.get_text())
+
+    def _find_shared_encoder(self):
+        """A stream tab running its own encoder with identical settings."""
+
+        key = self._encoder_key()
+        if key is None:
+            return None
+        for tab in self.scg.streamtabframe.tabs:
+            if tab is not self and tab.format_control.running and \
+                                                tab._encoder_key() == key:
+                return tab
+        return None
     
     def server_type_cell_data_func(self, celllayout, cell, model, iter):
         text = model.get_value(iter, 0)
@@ -1447,6 +1685,9 @@ class StreamTab(Tab):
 
     
     def cb_metadata(self, widget):
+        # The custom metadata of a shared encoder belongs to its own tab.
+        if self.encoder_host not in (None, self):
+            return
         if self.format_control.finalised:
             fallback = self.metadata_fallback.get_text()
             songname = self.scg.songname.encode("utf-8") or fallback
@@ -1487,7 +1728,7 @@ class StreamTab(Tab):
             self.metadata_update.set_relief(gtk.RELIEF_HALF)
             self.scg.send("tab_id=%d\ndev_type=encoder\ncustom_meta=%s\n"
                     "command=new_custom_metadata\n" % (
-                    self.numeric_id, cm))
+                    self.encoder_id, cm))
             self.scg.receive()
 
     def cb_new_metadata_format(self, widget):
@@ -1557,7 +1798,6 @@ class StreamTab(Tab):
         Tab.__init__(self, scg, numeric_id, indicator_lookup)
         self.scg = scg
         self.show_indicator("clear")
-        self.tab_type = "streamer"
         self.set_spacing(10)
               
         self.ic_expander = gtk.Expander(_('Individual Controls'))
@@ -1661,9 +1901,11 @@ class StreamTab(Tab):
             vseparator.show()
         
         # TC: [x] Start recorder (*) 1 ( ) 2
+        rectabs = self.source_client_gui.recordtabframe.tabs
         self.start_recorder_action = AutoAction(_('Start recorder'), [
-            (chr(ord("1") + i), t.record_buttons.record_button.activate)
-            for i, t in enumerate(self.source_client_gui.recordtabframe.tabs)])
+            (chr(ord("1") + i), lambda i=i:
+                                rectabs[i].record_buttons.record_button.activate())
+            for i in range(len(rectabs))])
         
         hbox.pack_end(self.start_recorder_action, False, False, 0)
         if PGlobs.num_recorders:
@@ -1744,6 +1986,8 @@ class StreamTab(Tab):
          
         label = gtk.Label(_('Format'))  # Format box
         self.format_control = FormatControl(self.send, self.receive)
+        self.encoder_host = None
+        self._encoder_users = 0
         self.details_nb.append_page(self.format_control, label)
         self.format_control.connect("notify::cap-icecast", lambda a, b: self.connection_pane.set_button(self))
         self.format_control.connect("notify::cap-shoutcast", lambda a, b: self.connection_pane.set_button(self))
@@ -1897,6 +2141,8 @@ class StreamTab(Tab):
 
 
 class RecordTab(Tab):
+    tab_type = "recorder"
+
     class RecordButtons(CategoryFrame):
         def cb_recbuttons(self, widget, userdata):
             changed_state = False
@@ -1906,7 +2152,7 @@ class RecordTab(Tab):
                         sd = self.parentobject.source_dest
                         if sd.streamtab is not None:
                             sd.streamtab.start_stop_encoder(ENCODER_START)
-                            num_id = sd.streamtab.numeric_id
+                            num_id = sd.streamtab.encoder_id
                         else:
                             num_id = -1
    
@@ -2040,15 +2286,15 @@ class RecordTab(Tab):
                 self.streamtab = None
                 sens(self.cansave and self.source_store[self.source_combo.get_active()][1])
 
-        def populate_stream_selector(self, text, tabs):
-            self.streamtabs = tabs
+        def populate_stream_selector(self, text, tabframe):
+            self.streamtabs = tabs = tabframe.tabs
             for index in range(len(tabs)):
                 self.source_store.append((" ".join((text, str(index + 1))), 1))
             self.source_combo.connect("changed", self.cb_source_combo)
             self.source_combo.set_active(0)
-            for tab in tabs:
-                tab.format_control.connect("notify::cap-recordable",
-                                lambda w, v: self.source_combo.emit("changed"))
+            tabframe.on_tab_built(lambda tab: tab.format_control.connect(
+                                "notify::cap-recordable",
+                                lambda w, v: self.source_combo.emit("changed")))
 
         def cb_new_folder(self, folder_chooser_button, path):
             self.cansave = os.access(path, os.W_OK)
@@ -2115,7 +2361,6 @@ class RecordTab(Tab):
         self.scg = scg
         self.numeric_id = numeric_id
         self.show_indicator("clear")
-        self.tab_type = "recorder"
         hbox = gtk.HBox()
         hbox.set_spacing(10)
         self.pack_start(hbox, False, False, 0)
@@ -2135,15 +2380,66 @@ class RecordTab(Tab):
         }
 
 
+class LazyTabs(object):
+    """The tabs of a TabFrame, each built when first needed.
+
+    Indexing builds the tab if need be. Iteration covers only the tabs that
+    have been built since the rest are idle by definition. Saved session
+    settings of tabs yet to be built are held as lines of text in session.
+    """
+
+    def __init__(self, build, setup, qty):
+        self._build = build
+        self._setup = setup
+        self._tabs = [None] * qty
+        self.session = {}  # index: ["key=value", ...]
+
+    def __len__(self):
+        return len(self._tabs)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        tab = self._tabs[index]
+        if tab is None:
+            index %= len(self._tabs)
+            tab = self._tabs[index] = self._build(index)
+            self._setup(index, tab)
+        return tab
+
+    def __iter__(self):
+        return iter([x for x in self._tabs if x is not None])
+
+    def is_built(self, index):
+        return self._tabs[index] is not None
+
+    def all(self):
+        """Every tab, building any not yet built."""
+
+        return self[:]
+
+    def build_needed(self, needed):
+        """Build the tabs whose saved settings satisfy needed."""
+
+        for index, lines in self.session.items():
+            if needed(dict(x.split("=", 1) for x in lines if "=" in x)):
+                self[index]
+
+
 class TabFrame(ModuleFrame):
     def __init__(self, scg, frametext, q_tabs, tabtype, indicatorlist,
                                                                 tab_tip_text):
         ModuleFrame.__init__(self, " %s " % frametext)
+        self.scg = scg
+        self.tabtype = tabtype
         self.notebook = gtk.Notebook()
         self.notebook.set_border_width(8)
         self.vbox.add(self.notebook)
         self.notebook.show()
-        self.tabs = []
+        self.tabs = LazyTabs(self._build_tab, self._setup_tab, q_tabs)
+        self._pages = []
+        self._indicator_lookups = []
+        self._build_hooks = []
         self.indicator_image_qty = len(indicatorlist)
         for index in range(q_tabs):
             labelbox = gtk.HBox()
@@ -2159,17 +2455,48 @@ class TabFrame(ModuleFrame):
                 image.set_from_pixbuf(pixbuf)
                 labelbox.add(image)
                 indicator_lookup[colour] = image
-            self.tabs.append(tabtype(scg, index, indicator_lookup))
-            self.notebook.append_page(self.tabs[-1], labelbox)
+            # Tabs not yet built are idle.
+            indicator_lookup[indicatorlist[0][0]].show()
+            self._indicator_lookups.append(indicator_lookup)
+            # The tab proper is packed in here when first displayed.
+            page = gtk.VBox()
+            self._pages.append(page)
+            self.notebook.append_page(page, labelbox)
+            page.show()
             labelbox.show()
             set_tip(labelbox, tab_tip_text)
+        self.notebook.connect("switch-page", self._on_switch_page)
+        if q_tabs:
+            self.tabs[self.notebook.get_current_page()]
+
+    def on_tab_built(self, func):
+        """Have func called on every tab now and when built in future."""
+
+        for tab in self.tabs:
+            func(tab)
+        self._build_hooks.append(func)
+
+    def _on_switch_page(self, notebook, page, page_num):
+        self.tabs[page_num]
+
+    def _build_tab(self, index):
+        tab = self.tabtype(self.scg, index, self._indicator_lookups[index])
+        self._pages[index].pack_start(tab)
+        return tab
+
+    def _setup_tab(self, index, tab):
+        for func in self._build_hooks:
+            func(tab)
+        lines = self.tabs.session.pop(index, None)
+        if lines:
+            self.scg.load_tab_settings(tab, lines)
 
 
 class StreamTabFrame(TabFrame):
     def forall(self, widget, f, *args):
-        for cb, tab in zip(self.togglelist, self.tabs):
+        for i, cb in enumerate(self.togglelist):
             if cb.get_active():
-                f(tab, *args)
+                f(self.tabs[i], *args)
 
     def cb_metadata_group_set(self, tab):
         tab.metadata.set_text(self.metadata_group.get_text())
@@ -2300,26 +2627,23 @@ class SourceClientGui(dbus.service.Object):
     def monitor(self):
         self.led_alternate = not self.led_alternate
         streaming = recording = False
+        reports = self._get_reports()
         # update the recorder LED indicators 
         for rectab in self.recordtabframe.tabs:
-            self.send("dev_type=recorder\ntab_id=%d\ncommand=get_report\n" %
-                                                            rectab.numeric_id)
-            while 1:
-                reply = self.receive()
-                if reply == "succeeded" or reply == "failed":
-                    break
-                if reply.startswith("recorder%dreport=" % rectab.numeric_id):
-                    recorder_state, recorded_seconds = reply.split("=")[
-                                                                1].split(":")
+            key = "recorder%dreport" % rectab.numeric_id
+            report = reports.get(key)
+            if report is not None:
+                recorder_state, recorded_seconds = report.split(":")
+                if self._report_changed(key, report):
                     rectab.show_indicator(("clear", "red", "amber", "clear")[
                                                         int(recorder_state)])
                     rectab.time_indicator.set_value(int(recorded_seconds))
-                    rec_state = recorder_state != "0"
-                    if rec_state:
-                        recording = True
-                        
-                    self._handle_recordstate(rectab.numeric_id, rec_state,
-                                            rectab.record_buttons.path)
+                rec_state = recorder_state != "0"
+                if rec_state:
+                    recording = True
+                    
+                self._handle_recordstate(rectab.numeric_id, rec_state,
+                                        rectab.record_buttons.path)
         update_listeners = False
         l_count = 0
         for streamtab in self.streamtabframe.tabs:
@@ -2329,55 +2653,54 @@ class SourceClientGui(dbus.service.Object):
                 update_listeners = True
                 l_count += cp.listeners
             
-            self.send("dev_type=streamer\ntab_id=%d\ncommand=get_report\n" % \
-                                                        streamtab.numeric_id)
-            reply = self.receive()
-            if reply != "failed":
-                self.receive()
-                if reply.startswith("streamer%dreport=" % streamtab.numeric_id):
-                    streamer_state, stream_sendbuffer_pc, brand_new = \
-                                                    reply.split("=")[1].split(":")
-                    state = int(streamer_state)
-                    self._handle_streamstate(streamtab.numeric_id,
-                                            int(state > 1), streamtab)
+            key = "streamer%dreport" % streamtab.numeric_id
+            report = reports.get(key)
+            if report is not None:
+                streamer_state, stream_sendbuffer_pc, brand_new = \
+                                                            report.split(":")
+                state = int(streamer_state)
+                buffer_full = int(stream_sendbuffer_pc) >= 100
+                # A full buffer makes the indicator flash so redraw anyway.
+                changed = self._report_changed(key, (streamer_state,
+                                    stream_sendbuffer_pc)) or buffer_full
+                self._handle_streamstate(streamtab.numeric_id,
+                                        int(state > 1), streamtab)
+                if changed:
                     streamtab.show_indicator(
                                     ("clear", "amber", "green", "clear")[state])
                     streamtab.ircpane.connections_controller.set_stream_active(
                                                                     state > 1)
-                    mi = self.parent.stream_indicator[streamtab.numeric_id]
-                    if (streamer_state == "2"):
+                mi = self.parent.stream_indicator[streamtab.numeric_id]
+                if (streamer_state == "2"):
+                    if changed:
                         mi.set_active(True)
                         mi.set_value(int(stream_sendbuffer_pc))
-                        if int(stream_sendbuffer_pc
-                                                ) >= 100 and self.led_alternate:
-                            tshoot = streamtab.troubleshooting
-                            if tshoot.sbf_discard_audio.get_active():
-                                streamtab.show_indicator("amber")
-                                mi.set_flash(True)
-                            else:
-                                streamtab.server_connect.set_active(False)
-                                streamtab.server_connect.set_active(True)
-                                print("remade the connection "
-                                      "because stream buffer was full")
-                            del tshoot
+                    if buffer_full and self.led_alternate:
+                        tshoot = streamtab.troubleshooting
+                        if tshoot.sbf_discard_audio.get_active():
+                            streamtab.show_indicator("amber")
+                            mi.set_flash(True)
                         else:
-                            mi.set_flash(False)
+                            streamtab.server_connect.set_active(False)
+                            streamtab.server_connect.set_active(True)
+                            print("remade the connection "
+                                  "because stream buffer was full")
+                        del tshoot
                     else:
-                        mi.set_active(False)
                         mi.set_flash(False)
-                    if brand_new == "1":
-                        # Streamer connected triggers.
-                        streamtab.start_recorder_action.activate()
-                        streamtab.start_player_action.activate()
-                        streamtab.reconnection_dialog.deactivate()
-                    if streamer_state != "0":
-                        streaming = True
-                    elif streamtab.server_connect.get_active():
-                        streamtab.server_connect.set_active(False)
-                        streamtab.reconnection_dialog.activate()
-                else:
-                    print("sourceclientgui.monitor: "
-                          "bad reply for streamer data:", reply)
+                elif changed:
+                    mi.set_active(False)
+                    mi.set_flash(False)
+                if brand_new == "1":
+                    # Streamer connected triggers.
+                    streamtab.start_recorder_action.activate()
+                    streamtab.start_player_action.activate()
+                    streamtab.reconnection_dialog.deactivate()
+                if streamer_state != "0":
+                    streaming = True
+                elif streamtab.server_connect.get_active():
+                    streamtab.server_connect.set_active(False)
+                    streamtab.reconnection_dialog.activate()
             else:
                 print("sourceclientgui.monitor: "
                       "failed to get a report from the streamer")
@@ -2414,6 +2737,26 @@ class SourceClientGui(dbus.service.Object):
             self.parent.listener_indicator.set_text(str(l_count))
         return True
 
+    def _get_reports(self):
+        """All the streamer and recorder reports in one round trip."""
+
+        reports = {}
+        self.send("command=get_all_reports\n")
+        while 1:
+            reply = self.receive()
+            if reply == "succeeded" or reply == "failed":
+                break
+            key, sep, value = reply.partition("=")
+            if sep:
+                reports[key] = value
+        return reports
+
+    def _report_changed(self, key, value):
+        if self._report_cache.get(key) == value:
+            return False
+        self._report_cache[key] = value
+        return True
+
     def _handle_streamstate(self, numeric_id, connected, streamtab):
         cache = self._streamstate_cache
         
@@ -2508,28 +2851,52 @@ class SourceClientGui(dbus.service.Object):
             each.record_buttons.record_button.set_active(whichrecorders.pop(0))
                 
     def new_metadata(self, artist, title, album, songname):
-        self.artist = artist
-        self.title = title
-        self.album = album
-        self.songname = songname
+        self.metadata_dispatcher.submit({"artist": artist, "title": title,
+                                        "album": album, "songname": songname})
+
+    def _apply_song_metadata(self, meta):
+        """Send song metadata to all the encoders and recorders at once."""
+
+        self.artist = meta["artist"]
+        self.title = meta["title"]
+        self.album = meta["album"]
+        self.songname = meta["songname"]
         self.send("artist=%s\ntitle=%s\nalbum=%s\n"
                                     "command=new_song_metadata\n" % (
-                                    artist.strip(), title.strip(),
-                                    album.strip()))
+                                    self.artist.strip(), self.title.strip(),
+                                    self.album.strip()))
         if self.receive() == "succeeded":
             print("updated song metadata successfully")
 
-        ircmetadata = {"artist": artist, "title": title, "album": album,
-                                                        "songname": songname}
-        # Update the song metadata on all stream tabs.
-        for tab in self.streamtabframe.tabs:  
-            tab.metadata_update.clicked()
-            tab.ircpane.connections_controller.new_metadata(ircmetadata)
+    def _metadata_destinations(self):
+        """Per encoder custom metadata and per stream tab IRC updates."""
+
+        tabs = self.streamtabframe.tabs
+        # A shared encoder is updated once, preferably by its own tab.
+        encoders = {}
+        for tab in tabs:
+            if tab.encoder_id not in encoders or \
+                                        tab.encoder_id == tab.numeric_id:
+                encoders[tab.encoder_id] = tab
+        for encoder_id, tab in sorted(encoders.iteritems()):
+            yield (("encoder", encoder_id), MetadataDispatcher.encoder_interval,
+                            lambda meta, tab=tab: tab.metadata_update.clicked())
+        for tab in tabs:
+            yield (("irc", tab.numeric_id), MetadataDispatcher.irc_interval,
+                            tab.ircpane.connections_controller.new_metadata)
+
+    @dbus.service.method(dbus_interface=PGlobs.dbus_bus_basename,
+                                                        out_signature="a{su}")
+    def metadata_dispatch_stats(self):
+        """Counts of submitted, merged, dropped and sent metadata updates."""
+
+        return self.metadata_dispatcher.counters
         
     def source_client_open(self):
         global lame_enabled
 
         self.comms_reply_pending = False
+        self._report_cache = {}
         self.send("command=jack_samplerate_request\n")
         reply = self.receive()
         if reply != "failed" and self.receive() == "succeeded":
@@ -2593,7 +2960,17 @@ class SourceClientGui(dbus.service.Object):
         try:
             with open((where or pm.basedir) / "s_data", "w") as f:
                 for tabframe in tabframes:
-                    for tab in tabframe.tabs:
+                    for index in range(len(tabframe.tabs)):
+                        if tabframe is not self and \
+                                            not tabframe.tabs.is_built(index):
+                            # Settings of a tab never built pass through.
+                            f.write("[%s %d]\n" % (tabframe.tabtype.tab_type,
+                                                                        index))
+                            for line in tabframe.tabs.session.get(index, ()):
+                                f.write(line + "\n")
+                            f.write("\n")
+                            continue
+                        tab = tabframe.tabs[index]
                         f.write("".join(("[", tab.tab_type, " ", 
                                                 str(tab.numeric_id), "]\n")))
                         for lvalue, (widget, method) in tab.objects.iteritems():
@@ -2637,7 +3014,7 @@ class SourceClientGui(dbus.service.Object):
     def load_previous_session(self):
         try:
             with open(pm.basedir / "s_data") as f:
-                tabframe = None
+                tabframe = pending = None
                 while 1:
                     line = f.readline()
                     if line == "":
@@ -2662,113 +3039,154 @@ class SourceClientGui(dbus.service.Object):
                             else:
                                 print("unsupported element:", line, "in serverdata file")
                                 tabframe = None
+                            pending = None
                             if tabframe is not None:
                                 try:
-                                    tab = tabframe.tabs[int(numeric_id)]
+                                    index = int(numeric_id)
+                                    if tabframe is self:
+                                        tab = self
+                                    elif tabframe.tabs.is_built(index):
+                                        tab = tabframe.tabs[index]
+                                    else:
+                                        pending = tabframe.tabs.session[index] = []
                                 except:
                                     print("unsupported tab number:", line, "in serverdata file")
                                     tabframe = None
-                    else:
-                        if tabframe is not None:
-                            try:
-                                lvalue, rvalue = line.split("=", 1)
-                            except:
-                                print("not a valid key, value pair:", line, "in serverdata file")
-                            else:
-                                if not lvalue:
-                                    print("key value is missing:", line, "in serverdata file")
-                                else:
-                                    try:
-                                        (widget, method) = tab.objects[lvalue]
-                                    except KeyError:
-                                        print("key value not recognised:", line, "in serverdata file")
-                                    else:
-                                        try:
-                                            int_rvalue = int(rvalue)
-                                        except:
-                                            int_rvalue = None
-                                        try:
-                                            float_rvalue = float(rvalue)
-                                        except:
-                                            float_rvalue = None
-                                        if type(method) == tuple:
-                                            widget.__getattribute__(method[0])(rvalue)
-                                        elif method == "active":
-                                            if int_rvalue is not None:
-                                                widget.set_active(int_rvalue)
-                                        elif method == "expanded":
-                                            if int_rvalue is not None:
-                                                widget.set_expanded(int_rvalue)
-                                        elif method == "value":
-                                            if float_rvalue is not None:
-                                                widget.set_value(float_rvalue)
-                                        elif method == "notebookpage":
-                                            if int_rvalue is not None:
-                                                widget.set_current_page(int_rvalue)
-                                        elif method == "radioindex":
-                                            if int_rvalue is not None:
-                                                widget.set_radio_index(int_rvalue)
-                                        elif method == "current_page":
-                                            widget.set_current_page(int_rvalue)
-                                        elif method == "text":
-                                            widget.set_text(rvalue)
-                                        elif method == "password":
-                                            widget.set_text(rvalue)
-                                        elif method == "history":
-                                            widget.set_history(rvalue)
-                                        elif method == "directory":
-                                            if rvalue:
-                                                widget.set_current_folder(rvalue)
-                                        elif method == "filename":
-                                            if rvalue:
-                                                rvalue = widget.set_filename(rvalue)
-                                        elif method == "marshall":
-                                            widget.unmarshall(rvalue)
-                                        else:
-                                            print("method", method, "is unsupported at this time hence widget pertaining to", lvalue, "will not be set")
+                    elif pending is not None:
+                        pending.append(line)
+                    elif tabframe is not None:
+                        self.load_tab_settings(tab, (line,))
         except Exception as e:
             if isinstance(e, IOError):
                 print(e)
             else:
                 traceback.print_exc()
 
+        for tabframe in (self.streamtabframe, self.recordtabframe):
+            tabframe.tabs.build_needed(tabframe.tabtype.needed_at_startup)
+
+    def load_tab_settings(self, tab, lines):
+        """Apply saved session lines of the form key=value to a tab."""
+
+        for line in lines:
+            try:
+                lvalue, rvalue = line.split("=", 1)
+            except:
+                print("not a valid key, value pair:", line, "in serverdata file")
+            else:
+                if not lvalue:
+                    print("key value is missing:", line, "in serverdata file")
+                else:
+                    try:
+                        (widget, method) = tab.objects[lvalue]
+                    except KeyError:
+                        print("key value not recognised:", line, "in serverdata file")
+                    else:
+                        try:
+                            int_rvalue = int(rvalue)
+                        except:
+                            int_rvalue = None
+                        try:
+                            float_rvalue = float(rvalue)
+                        except:
+                            float_rvalue = None
+                        if type(method) == tuple:
+                            widget.__getattribute__(method[0])(rvalue)
+                        elif method == "active":
+                            if int_rvalue is not None:
+                                widget.set_active(int_rvalue)
+                        elif method == "expanded":
+                            if int_rvalue is not None:
+                                widget.set_expanded(int_rvalue)
+                        elif method == "value":
+                            if float_rvalue is not None:
+                                widget.set_value(float_rvalue)
+                        elif method == "notebookpage":
+                            if int_rvalue is not None:
+                                widget.set_current_page(int_rvalue)
+                        elif method == "radioindex":
+                            if int_rvalue is not None:
+                                widget.set_radio_index(int_rvalue)
+                        elif method == "current_page":
+                            widget.set_current_page(int_rvalue)
+                        elif method == "text":
+                            widget.set_text(rvalue)
+                        elif method == "password":
+                            widget.set_text(rvalue)
+                        elif method == "history":
+                            widget.set_history(rvalue)
+                        elif method == "directory":
+                            if rvalue:
+                                widget.set_current_folder(rvalue)
+                        elif method == "filename":
+                            if rvalue:
+                                rvalue = widget.set_filename(rvalue)
+                        elif method == "marshall":
+                            widget.unmarshall(rvalue)
+                        else:
+                            print("method", method, "is unsupported at this time hence widget pertaining to", lvalue, "will not be set")
+
     def cb_after_realize(self, widget):
         self.wst.apply()
         #widget.resize(int(self.win_x), 1)
         self.streamtabframe.connect_group.grab_focus()
         
-    def cb_stream_details_expand(self, expander, param_spec, next_expander, sw):
+    def _link_stream_expanders(self, tab):
+        """Keep the expanders of a newly built stream tab in step."""
+
+        tab.details.connect("notify::expanded",
+                    self.cb_stream_details_expand, "details", tab.details_nb)
+        tab.ic_expander.connect("notify::expanded",
+                    self.cb_stream_controls_expand, "ic_expander", tab.ic_frame)
+        for other in self.streamtabframe.tabs:
+            if other is not tab:
+                tab.details.set_expanded(other.details.get_expanded())
+                tab.ic_expander.set_expanded(other.ic_expander.get_expanded())
+                break
+
+    def _sync_stream_expanders(self, expander, name):
+        """Pass the expander state on to the next stream tab that differs.
+
+        Returns False once all the built stream tabs agree.
+        """
+
+        expanded = expander.get_expanded()
+        for tab in self.streamtabframe.tabs:
+            other = getattr(tab, name)
+            if other.get_expanded() != expanded:
+                other.set_expanded(expanded)
+                return True
+        return False
+
+    def cb_stream_details_expand(self, expander, param_spec, name, sw):
         if expander.get_expanded():
             sw.show()
         else:
             sw.hide()
         
-        if expander.get_expanded() == next_expander.get_expanded():
+        if not self._sync_stream_expanders(expander, name):
             if not expander.get_expanded():
                 self.window.resize((self.wst.get_x()), 1)
-            else:
-                pass
-        else:
-            next_expander.set_expanded(expander.get_expanded())
 
-    def cb_stream_controls_expand(self, expander, param_spec, next_expander,
-                                                        frame, details_shown):
+    def cb_stream_controls_expand(self, expander, param_spec, name, frame):
         if expander.get_expanded():
             frame.show()
         else:
             frame.hide()
         
-        if expander.get_expanded() == next_expander.get_expanded():
+        if not self._sync_stream_expanders(expander, name):
             self.window.resize((self.wst.get_x()), 1)
-        else:
-            next_expander.set_expanded(expander.get_expanded())
         
     def update_metadata(self, text=None, filter=None):
-        for tab in self.streamtabframe.tabs:
-            if filter is None or str(tab.numeric_id) in filter:
-                if text is not None:
-                    tab.metadata.set_text(text)
-                tab.metadata_update.clicked()
+        tabs = self.streamtabframe.tabs
+        for i in range(len(tabs)):
+            if filter is None or str(i) in filter:
+                # Unbuilt tabs are idle and need only a new template.
+                if text is not None or tabs.is_built(i):
+                    tab = tabs[i]
+                    if text is not None:
+                        tab.metadata.set_text(text)
+                    tab.metadata_update.clicked()
 
     def cb_populate_recorder_menu(self, mi, tabs):
         menu = mi.get_submenu()
@@ -2779,6 +3197,7 @@ class SourceClientGui(dbus.service.Object):
             menu.append(mi)
             mi.show()
         
+        tabs = tabs.all()
         if not tabs:
             none(_('Recording Facility Unavailable'))
         elif not any(tab.record_buttons.record_button.get_sensitive() \
@@ -2818,6 +3237,7 @@ class SourceClientGui(dbus.service.Object):
             menu.append(mi)
             mi.show()
         
+        tabs = tabs.all()
         if not tabs:
             none(_('Streaming Facility Unavailable'))
         elif not any(tab.server_connect.get_sensitive() for tab in tabs):
@@ -2857,6 +3277,9 @@ class SourceClientGui(dbus.service.Object):
         parent.server_window = self
         self.source_client_crash_count = 0
         self.source_client_open()
+        self.stats_poller = StatsPoller()
+        self.metadata_dispatcher = MetadataDispatcher(
+                    self._apply_song_metadata, self._metadata_destinations)
 
         self.window = gtk.Window(gtk.WINDOW_TOPLEVEL)
         self.parent.window_group.add_window(self.window)
@@ -2890,21 +3313,14 @@ class SourceClientGui(dbus.service.Object):
             'connection Yellow=Awaiting authentication. Green=Connected. '
             'Flashing=Packet loss due to a bad connection.'))
             
-        tab = self.streamtabframe.tabs[-1]
-        for next_tab in self.streamtabframe.tabs:
-            tab.details.connect("notify::expanded",
-                self.cb_stream_details_expand, next_tab.details, tab.details_nb)
-            tab.ic_expander.connect("notify::expanded",
-                self.cb_stream_controls_expand, next_tab.ic_expander,
-                tab.ic_frame, self.streamtabframe.tabs[0].details.get_expanded)
-            tab = next_tab
+        self.streamtabframe.on_tab_built(self._link_stream_expanders)
 
         self.streamtabframe.set_sensitive(True)
         vbox.pack_start(self.streamtabframe, True, True, 0)
         self.streamtabframe.show()
-        for rectab in self.recordtabframe.tabs:
-            rectab.source_dest.populate_stream_selector(_(' Stream '),
-                                                    self.streamtabframe.tabs)
+        self.recordtabframe.on_tab_built(lambda rectab:
+                    rectab.source_dest.populate_stream_selector(_(' Stream '),
+                                                    self.streamtabframe))
               
         self.parent.menu.recordersmenu_i.connect("activate",
                     self.cb_populate_recorder_menu, self.recordtabframe.tabs)
@@ -2946,7 +3362,7 @@ class SourceClientGui(dbus.service.Object):
             _('<span weight="bold" size="12000">A scheduled stream'
             ' disconnection has occurred.</span>'))
         
-        self.monitor_source_id = timeout_add(250, threadslock(self.monitor))
+        self.monitor_source_id = frame_clock.add(250, self.monitor)
         self.window.realize()   # Prevent a rendering bug.
         
         dbus.service.Object.__init__(self,
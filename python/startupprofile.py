@@ -0,0 +1,160 @@
+"""Startup time profiling for the idjc launcher.
+
+Times every module imported and the construction of each object whose
+class is defined within the idjc package from when the profiler is
+installed until the main loop first goes idle. The report lists the
+slowest items first.
+"""
+
+#   Copyright (C) 2026 Stephen Fairchild (s-fairchild@users.sourceforge.net)
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 2 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program in the file entitled COPYING.
+#   If not, see <http://www.gnu.org/licenses/>.
+
+from __future__ import print_function
+
+__all__ = ["StartupProfiler"]
+
+import sys
+import time
+import types
+import __builtin__
+from functools import wraps
+
+
+class StartupProfiler(object):
+    """Collects import and constructor timings.
+
+    Import times are both inclusive of nested imports and exclusive
+    (self). Constructor times are inclusive.
+    """
+
+    def __init__(self, package="idjc"):
+        self._package = package
+        self._real_import = None
+        self._stack = []
+        self._wrapped = []
+        self.imports = {}  # name: [inclusive, self]
+        self.constructors = {}  # class name: [calls, inclusive]
+        self.start = None
+
+    def install(self):
+        """Begin timing."""
+
+        if self._real_import is not None:
+            return
+        self.start = time.time()
+        self._real_import = __builtin__.__import__
+        __builtin__.__import__ = self._import
+
+    def finish(self, pathname=None):
+        """Stop timing and write a report to pathname or stdout.
+
+        Returns False for use as an idle callback.
+        """
+
+        if self._real_import is not None:
+            __builtin__.__import__ = self._real_import
+            self._real_import = None
+            for cls, init in self._wrapped:
+                cls.__init__ = init
+            del self._wrapped[:]
+
+        total = time.time() - self.start
+        try:
+            if pathname is None:
+                self._write(sys.stdout, total)
+            else:
+                with open(pathname, "w") as f:
+                    self._write(f, total)
+                print("startup profile written to", pathname)
+        except IOError as e:
+            print("failed to write startup profile:", e)
+        return False
+
+    def _write(self, f, total):
+        f.write("Time to main loop idle: %.3fs\n\n" % total)
+        f.write("%9s %9s  %s\n" % ("total/ms", "self/ms", "module"))
+        for name, (incl, self_) in sorted(self.imports.iteritems(),
+                                            key=lambda x: x[1][1], reverse=True):
+            f.write("%9.1f %9.1f  %s\n" % (incl * 1000, self_ * 1000, name))
+        f.write("\n%9s %9s  %s\n" % ("total/ms", "calls", "constructor"))
+        for name, (calls, incl) in sorted(self.constructors.iteritems(),
+                                            key=lambda x: x[1][1], reverse=True):
+            f.write("%9.1f %9d  %s\n" % (incl * 1000, calls, name))
+
+    def _import(self, name, globals=None, locals=None, fromlist=None, level=-1):
+        before = set(sys.modules)
+        frame = [0.0]
+        self._stack.append(frame)
+        start = time.time()
+        try:
+            return self._real_import(name, globals, locals, fromlist, level)
+        finally:
+            elapsed = time.time() - start
+            self._stack.pop()
+            new = [x for x in sys.modules if x not in before and
+                                                    sys.modules[x] is not None]
+            if new:
+                key = self._requested(name, fromlist, new)
+                entry = self.imports.setdefault(key, [0.0, 0.0])
+                entry[0] += elapsed
+                entry[1] += elapsed - frame[0]
+                for each in new:
+                    if each == self._package or \
+                                each.startswith(self._package + "."):
+                        self._wrap_classes(sys.modules[each])
+            else:
+                elapsed = 0.0
+            if self._stack:
+                self._stack[-1][0] += elapsed
+
+    @staticmethod
+    def _requested(name, fromlist, new):
+        """Which of the newly loaded modules the import statement named."""
+
+        wanted = [name] + ["%s.%s" % (name, x) for x in fromlist or ()
+                                                        if isinstance(x, str)]
+        for want in wanted:
+            for each in new:
+                if each == want or each.endswith("." + want):
+                    return each
+        return min(new, key=len)
+
+    def _wrap_classes(self, module):
+        for obj in vars(module).values():
+            if isinstance(obj, (type, types.ClassType)) and \
+                                        obj.__module__ == module.__name__ \
+                                        and "__init__" in vars(obj):
+                self._wrap_init(obj)
+
+    def _wrap_init(self, cls):
+        init = vars(cls)["__init__"]
+        name = "%s.%s" % (cls.__module__, cls.__name__)
+        entry = self.constructors.setdefault(name, [0, 0.0])
+
+        @wraps(init)
+        def __init__(*args, **kwds):
+            start = time.time()
+            try:
+                return init(*args, **kwds)
+            finally:
+                entry[0] += 1
+                entry[1] += time.time() - start
+
+        try:
+            cls.__init__ = __init__
+        except TypeError:
+            return
+        self._wrapped.append((cls, init))
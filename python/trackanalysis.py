@@ -0,0 +1,230 @@
+"""Background analysis of the loudness, silences and waveform of tracks.
+
+Files are queued for measurement by the backend which decodes them on
+analyser threads of its own. It computes the EBU R128 integrated
+loudness, the extent of leading and trailing silence, where any
+fade-out starts and a downsampled waveform overview. Results are cached by file identity in an SQLite
+database so each file is measured once. The cache is shared by all
+profiles.
+"""
+
+#   Copyright (C) 2026 Stephen Fairchild (s-fairchild@users.sourceforge.net)
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 2 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program in the file entitled COPYING.
+#   If not, see <http://www.gnu.org/licenses/>.
+
+from __future__ import print_function
+
+__all__ = ["TrackAnalyser", "TrackAnalysis"]
+
+import os
+import math
+import sqlite3
+import binascii
+import collections
+
+from .gtkstuff import threadslock, timeout_add, source_remove
+
+
+# The loudness R128 gains are relative to.
+R128_TARGET = -23.0
+
+# Milliseconds between checks on the backend for finished analyses.
+POLL_INTERVAL = 500
+
+
+class TrackAnalysis(collections.namedtuple("TrackAnalysis",
+                                    "loudness lead end fade overview")):
+    """The measurements of a track.
+
+    loudness: integrated loudness in LUFS.
+    lead: seconds of silence at the start.
+    end: seconds at which the audio ends, trailing silence excluded.
+    fade: seconds at which the fade-out starts or end if there is none.
+    overview: the waveform as a byte string of up to 512 bins of three
+    bytes in time order. These are the minimum and maximum sample values
+    offset by 128 and the RMS level, all scaled to the range 0-255.
+
+    Any may be None when the measurement failed.
+    """
+
+    __slots__ = ()
+
+    @property
+    def gain(self):
+        """The loudness as a playlist replaygain string."""
+
+        if self.loudness is None:
+            return None
+        return "%0.2f R128" % (R128_TARGET - self.loudness)
+
+
+class TrackAnalyser(object):
+    """Measures and remembers the properties of media files.
+
+    Listeners added with connect are called as func(pathname, analysis)
+    when a measurement completes.
+    """
+
+    _schema = """
+        CREATE TABLE IF NOT EXISTS analysis (
+            pathname TEXT PRIMARY KEY,
+            size INTEGER NOT NULL,
+            mtime REAL NOT NULL,
+            loudness REAL,
+            lead REAL,
+            audio_end REAL,
+            fade REAL,
+            overview BLOB);
+        """
+
+    def __init__(self, approot, pathname):
+        self._approot = approot
+        self._conn = sqlite3.connect(pathname)
+        self._conn.text_factory = str
+        try:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+        except sqlite3.DatabaseError as e:
+            print("track analysis cache:", e)
+        with self._conn:
+            self._conn.executescript(self._schema)
+            columns = [x[1] for x in self._conn.execute(
+                                        "PRAGMA table_info(analysis)")]
+            if "overview" not in columns:
+                # Rows from before overviews were kept are measured again.
+                self._conn.execute(
+                            "ALTER TABLE analysis ADD COLUMN overview BLOB")
+
+        self._queue = collections.deque()
+        self._queued = set()
+        self._idle = 0
+        self._poll_source_id = None
+        self._listeners = []
+
+    def connect(self, func):
+        self._listeners.append(func)
+
+    def lookup(self, pathname):
+        """The TrackAnalysis for pathname or None.
+
+        A file that has yet to be measured is queued for analysis.
+        """
+
+        identity = self._identity(pathname)
+        if identity is None:
+            return None
+        row = self._conn.execute("SELECT size, mtime, loudness, lead, "
+                "audio_end, fade, overview FROM analysis WHERE pathname = ?",
+                (pathname,)).fetchone()
+        if row is not None and tuple(row[:2]) == identity and \
+                                        (row[6] is not None or row[4] is None):
+            overview = row[6] and str(row[6])
+            return TrackAnalysis._make(row[2:6] + (overview,))
+
+        if pathname not in self._queued:
+            self._queued.add(pathname)
+            self._queue.append(pathname)
+            if self._poll_source_id is None:
+                self._poll_source_id = timeout_add(POLL_INTERVAL, self._poll)
+        return None
+
+    def backend_restarted(self):
+        """Queue again the files whose results went with the old backend."""
+
+        in_flight = self._queued.difference(self._queue)
+        self._queue.extendleft(in_flight)
+        self._idle = 0
+        if self._queue and self._poll_source_id is None:
+            self._poll_source_id = timeout_add(POLL_INTERVAL, self._poll)
+
+    def close(self):
+        if self._poll_source_id is not None:
+            source_remove(self._poll_source_id)
+            self._poll_source_id = None
+        self._conn.close()
+
+    @staticmethod
+    def _identity(pathname):
+        try:
+            st = os.stat(pathname)
+        except OSError:
+            return None
+        return st.st_size, st.st_mtime
+
+    @threadslock
+    def _poll(self):
+        approot = self._approot
+        try:
+            approot.mixer_write("ACTN=analysisresults\nend\n")
+            results = []
+            fields = {}
+            while 1:
+                line = approot.mixer_read().rstrip("\n")
+                if not line or line == "end":
+                    break
+                key, sep, value = line.partition("=")
+                if key == "analysis_pathname":
+                    results.append((value, fields))
+                    fields = {}
+                elif key == "analysers_idle":
+                    self._idle = int(value)
+                elif key.startswith("analysis_"):
+                    fields[key[9:]] = value
+
+            for pathname, fields in results:
+                self._store(pathname, fields)
+
+            while self._idle and self._queue:
+                pathname = self._queue.popleft()
+                approot.mixer_write("PLRP=%s\nACTN=analyse\nend\n" % pathname)
+                self._idle -= 1
+        except (IOError, ValueError) as e:
+            print("track analysis:", e)
+
+        if self._queue or len(self._queued) > len(self._queue):
+            return True
+        self._poll_source_id = None
+        return False
+
+    def _store(self, pathname, fields):
+        self._queued.discard(pathname)
+        identity = self._identity(pathname)
+        if identity is None:
+            return
+
+        def value(key):
+            try:
+                v = float(fields[key])
+            except (KeyError, ValueError):
+                return None
+            return None if math.isnan(v) else v
+
+        try:
+            overview = binascii.unhexlify(fields["overview"])
+        except (KeyError, TypeError):
+            overview = None
+
+        analysis = TrackAnalysis._make([value(x) for x in
+                                TrackAnalysis._fields[:-1]] + [overview])
+        try:
+            with self._conn:
+                self._conn.execute("INSERT OR REPLACE INTO analysis VALUES "
+                        "(?, ?, ?, ?, ?, ?, ?, ?)", (pathname,) + identity +
+                        analysis[:-1] + (overview and buffer(overview),))
+        except sqlite3.Error as e:
+            print("track analysis cache write failed:", e)
+
+        for func in self._listeners:
+            func(pathname, analysis)
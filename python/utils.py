@@ -22,9 +22,11 @@ But strictly no third party module dependencies.
 from __future__ import print_function
 
 __all__ = ["Singleton", "PolicedAttributes", "FixedAttributes",
-                "PathStr", "SlotObject", "string_multireplace"]
+                "PathStr", "SlotObject", "LazyModule", "string_multireplace"]
 
 import os
+import imp
+import importlib
 import uuid
 import re
 import glob
@@ -212,6 +214,38 @@ class SlotObject(object):
 
 
 
+class LazyModule(object):
+    """Stand-in for a module that is imported when first used.
+
+    The available attribute tells whether the module can be found without
+    the cost of importing it.
+    """
+
+
+    def __init__(self, name):
+        self._name = name
+        self._module = None
+
+
+    @property
+    def available(self):
+        if self._module is not None:
+            return True
+        try:
+            imp.find_module(self._name.split(".")[0])
+        except ImportError:
+            return False
+        else:
+            return True
+
+
+    def __getattr__(self, what):
+        if self._module is None:
+            self._module = importlib.import_module(self._name)
+        return getattr(self._module, what)
+
+
+
 def string_multireplace(part, table):
     """Replace multiple items in a string.
 